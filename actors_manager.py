@@ -2,15 +2,44 @@
 Gestor de actores para descarga y entrenamiento de reconocimiento facial
 """
 
+import os
 import json
+import multiprocessing
 import time
-import requests
-import face_recognition
-import numpy as np
+import shutil
 from pathlib import Path
-from PIL import Image
 import logging
-from typing import Dict, List, Optional, Callable
+from typing import Dict, List, Optional, Callable, Tuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+from tmdb_client import json_loads, ORJSON_AVAILABLE
+
+if ORJSON_AVAILABLE:
+    import orjson
+
+# Descargas simultáneas de fotos de actores
+ACTOR_DOWNLOAD_WORKERS = 12
+
+# Descargas simultáneas de fotos adicionales dentro de cada actor
+ACTOR_PHOTO_WORKERS = 4
+
+# Tamaño de bloque al escribir imágenes descargadas a disco
+IMAGE_CHUNK_SIZE = 64 * 1024
+
+# Procesos para generar encodings faciales durante el entrenamiento
+TRAIN_WORKERS = os.cpu_count() or 1
+
+def _encode_image(image_path: str) -> Tuple[List, Optional[str]]:
+    """Encodings faciales de una imagen (se ejecuta en un proceso del pool); devuelve (encodings, error)"""
+    try:
+        import face_recognition  # Cada proceso carga dlib una sola vez
+        image = face_recognition.load_image_file(image_path)
+        face_locations = face_recognition.face_locations(image)
+        if not face_locations:
+            return [], None
+        return face_recognition.face_encodings(image, face_locations), None
+    except Exception as e:
+        return [], str(e)
 
 class ActorsManager:
     def __init__(self, tmdb_client, progress_callback: Optional[Callable] = None):
@@ -26,6 +55,87 @@ class ActorsManager:
         else:
             logging.info(message)
     
+    def _fetch_popular_page(self, page: int) -> List[Dict]:
+        """Obtener una página de actores populares de TMDB"""
+        params = {
+            'api_key': self.tmdb_client.api_key,
+            'page': page
+        }
+        
+        self.tmdb_client.wait_rate_limit()
+        response = self.tmdb_client.session.get(f"{self.tmdb_client.base_url}/person/popular", params=params, timeout=10)
+        response.raise_for_status()
+        
+        return json_loads(response.content).get('results', [])
+    
+    def _download_image(self, url: str, image_path: Path) -> bool:
+        """Descargar una imagen a disco por bloques; devuelve False si ya estaba al día"""
+        etag_path = image_path.with_suffix('.etag')
+        headers = {}
+        if image_path.exists() and image_path.stat().st_size > 0:
+            if not etag_path.exists():
+                return False
+            # Revalidar con el CDN: responde 304 si la imagen no cambió
+            headers['If-None-Match'] = etag_path.read_text(encoding='utf-8').strip()
+        
+        with self.tmdb_client.session.get(url, headers=headers, stream=True, timeout=15) as response:
+            if response.status_code == 304:
+                return False
+            response.raise_for_status()
+            response.raw.decode_content = True
+            # Escribir en temporal para no dejar imágenes a medias que luego se omitirían
+            part_path = image_path.with_suffix(image_path.suffix + '.part')
+            with open(part_path, 'wb') as f:
+                shutil.copyfileobj(response.raw, f, length=IMAGE_CHUNK_SIZE)
+            part_path.replace(image_path)
+            
+            etag = response.headers.get('ETag')
+            if etag:
+                etag_path.write_text(etag, encoding='utf-8')
+        return True
+    
+    def _download_actor_photos(self, actor: Dict, photos_per_actor: int) -> int:
+        """Descargar la foto principal y las adicionales de un actor; devuelve las fotos descargadas"""
+        actor_name = actor['name']
+        
+        # Crear carpeta del actor
+        actor_folder = self.actors_dir / actor_name.replace(" ", "_")
+        actor_folder.mkdir(exist_ok=True)
+        
+        # Descargar foto principal
+        profile_url = f"https://image.tmdb.org/t/p/w500{actor['profile_path']}"
+        if not self._download_image(profile_url, actor_folder / "profile.jpg"):
+            self.log_progress(f"⏭ {actor_name}: foto principal ya descargada")
+        
+        photos_downloaded = 1
+        
+        # Descargar fotos adicionales si se solicita
+        if photos_per_actor > 1:
+            try:
+                # Obtener más fotos del actor
+                images_data = self.tmdb_client.get_person_images(actor['id'])
+                profiles = images_data[:photos_per_actor-1]
+                
+                def download_additional(j: int):
+                    additional_url = f"https://image.tmdb.org/t/p/w500{profiles[j]['file_path']}"
+                    self._download_image(additional_url, actor_folder / f"photo_{j+2}.jpg")
+                
+                # Fotos adicionales en paralelo; los 429 los reintenta el adaptador de la sesión
+                with ThreadPoolExecutor(max_workers=ACTOR_PHOTO_WORKERS) as executor:
+                    futures = {executor.submit(download_additional, j): j for j in range(len(profiles))}
+                    for future in as_completed(futures):
+                        j = futures[future]
+                        try:
+                            future.result()
+                            photos_downloaded += 1
+                        except Exception as e:
+                            self.log_progress(f"Error descargando foto adicional {j+2} de {actor_name}: {str(e)}", "WARNING")
+            
+            except Exception as e:
+                self.log_progress(f"Error obteniendo fotos adicionales de {actor_name}: {str(e)}", "WARNING")
+        
+        return photos_downloaded
+    
     def download_popular_actors(self, num_actors: int = 30, photos_per_actor: int = 3) -> bool:
         """Descargar imágenes de actores populares desde TMDB"""
         try:
@@ -36,19 +146,15 @@ class ActorsManager:
             
             popular_actors = []
             
-            # Obtener actores populares de múltiples páginas
-            for page in range(1, min(6, (num_actors // 20) + 2)):  # Máximo 5 páginas
+            # Obtener actores populares de múltiples páginas en paralelo (el cliente TMDB limita la tasa)
+            pages = range(1, min(6, (num_actors // 20) + 2))  # Máximo 5 páginas
+            with ThreadPoolExecutor(max_workers=len(pages)) as executor:
+                page_futures = [(page, executor.submit(self._fetch_popular_page, page)) for page in pages]
+            
+            # Recolectar en orden de página
+            for page, future in page_futures:
                 try:
-                    params = {
-                        'api_key': self.tmdb_client.api_key,
-                        'page': page
-                    }
-                    
-                    response = requests.get(f"{self.tmdb_client.base_url}/person/popular", params=params, timeout=10)
-                    response.raise_for_status()
-                    
-                    data = response.json()
-                    for person in data.get('results', []):
+                    for person in future.result():
                         if len(popular_actors) >= num_actors:
                             break
                         
@@ -62,65 +168,24 @@ class ActorsManager:
                     
                     if len(popular_actors) >= num_actors:
                         break
-                        
-                    time.sleep(0.3)  # Evitar rate limiting
                     
                 except Exception as e:
                     self.log_progress(f"Error obteniendo página {page}: {str(e)}", "ERROR")
             
             self.log_progress(f"Obtenidos {len(popular_actors)} actores de TMDB")
             
-            # Descargar fotos para cada actor
-            for i, actor in enumerate(popular_actors):
-                try:
-                    actor_name = actor['name']
-                    self.log_progress(f"Descargando: {actor_name} ({i+1}/{len(popular_actors)})")
-                    
-                    # Crear carpeta del actor
-                    actor_folder = self.actors_dir / actor_name.replace(" ", "_")
-                    actor_folder.mkdir(exist_ok=True)
-                    
-                    # Descargar foto principal
-                    profile_url = f"https://image.tmdb.org/t/p/w500{actor['profile_path']}"
-                    img_response = requests.get(profile_url, timeout=15)
-                    img_response.raise_for_status()
-                    
-                    image_path = actor_folder / "profile.jpg"
-                    with open(image_path, 'wb') as f:
-                        f.write(img_response.content)
-                    
-                    photos_downloaded = 1
-                    
-                    # Descargar fotos adicionales si se solicita
-                    if photos_per_actor > 1:
-                        try:
-                            # Obtener más fotos del actor
-                            images_data = self.tmdb_client.get_person_images(actor['id'])
-                            
-                            for j, profile in enumerate(images_data[:photos_per_actor-1]):
-                                try:
-                                    additional_url = f"https://image.tmdb.org/t/p/w500{profile['file_path']}"
-                                    additional_response = requests.get(additional_url, timeout=15)
-                                    additional_response.raise_for_status()
-                                    
-                                    additional_path = actor_folder / f"photo_{j+2}.jpg"
-                                    with open(additional_path, 'wb') as f:
-                                        f.write(additional_response.content)
-                                    
-                                    photos_downloaded += 1
-                                    time.sleep(0.2)
-                                    
-                                except Exception as e:
-                                    self.log_progress(f"Error descargando foto adicional {j+2} de {actor_name}: {str(e)}", "WARNING")
-                        
-                        except Exception as e:
-                            self.log_progress(f"Error obteniendo fotos adicionales de {actor_name}: {str(e)}", "WARNING")
-                    
-                    self.log_progress(f"✅ {actor_name}: {photos_downloaded} fotos descargadas")
-                    time.sleep(0.5)  # Evitar rate limiting
-                    
-                except Exception as e:
-                    self.log_progress(f"Error descargando {actor.get('name', 'desconocido')}: {str(e)}", "ERROR")
+            # Descargar fotos de los actores en paralelo (descargas limitadas por red)
+            with ThreadPoolExecutor(max_workers=ACTOR_DOWNLOAD_WORKERS) as executor:
+                futures = {executor.submit(self._download_actor_photos, actor, photos_per_actor): actor
+                           for actor in popular_actors}
+                
+                for i, future in enumerate(as_completed(futures)):
+                    actor_name = futures[future].get('name', 'desconocido')
+                    try:
+                        photos_downloaded = future.result()
+                        self.log_progress(f"✅ {actor_name}: {photos_downloaded} fotos descargadas ({i+1}/{len(popular_actors)})")
+                    except Exception as e:
+                        self.log_progress(f"Error descargando {actor_name}: {str(e)}", "ERROR")
             
             self.log_progress("Descarga de actores completada!")
             self.log_progress(f"Total descargado: {len(popular_actors)} actores")
@@ -150,16 +215,12 @@ class ActorsManager:
             
             # Descargar imagen
             image_url = f"https://image.tmdb.org/t/p/w500{profile_path}"
-            img_response = requests.get(image_url, timeout=15)
-            img_response.raise_for_status()
-            
-            # Guardar imagen
             actor_folder = self.actors_dir / actor_data['name'].replace(" ", "_")
             actor_folder.mkdir(exist_ok=True)
             
-            image_path = actor_folder / "profile.jpg"
-            with open(image_path, 'wb') as f:
-                f.write(img_response.content)
+            if not self._download_image(image_url, actor_folder / "profile.jpg"):
+                self.log_progress(f"⏭ Actor ya descargado: {actor_data['name']}")
+                return True
             
             self.log_progress(f"Actor descargado: {actor_data['name']}")
             return True
@@ -168,9 +229,10 @@ class ActorsManager:
             self.log_progress(f"Error descargando actor: {str(e)}", "ERROR")
             return False
     
-    def train_face_recognition_model(self) -> bool:
-        """Entrenar modelo de reconocimiento facial"""
+    def train_face_recognition_model(self, export_json: bool = False) -> bool:
+        """Entrenar modelo de reconocimiento facial (export_json: copia legible en actors_db.json)"""
         try:
+            import numpy as np
             self.log_progress("Iniciando entrenamiento del modelo...")
             
             if not self.actors_dir.exists():
@@ -181,60 +243,68 @@ class ActorsManager:
             total_actors = 0
             successful_encodings = 0
             
-            # Procesar cada actor
-            actor_folders = list(self.actors_dir.iterdir())
-            for i, actor_folder in enumerate(actor_folders):
+            # Reunir las imágenes de cada actor
+            jobs = []
+            for actor_folder in self.actors_dir.iterdir():
                 if not actor_folder.is_dir():
                     continue
                 
                 actor_name = actor_folder.name.replace("_", " ")
-                self.log_progress(f"Procesando: {actor_name} ({i+1}/{len(actor_folders)})")
-                
-                # Buscar imágenes en la carpeta del actor
                 image_files = list(actor_folder.glob("*.jpg")) + list(actor_folder.glob("*.png"))
                 
                 if not image_files:
                     self.log_progress(f"Sin imágenes para: {actor_name}", "WARNING")
                     continue
                 
-                encodings = []
+                jobs.append((actor_name, image_files))
+            
+            # Detección y encoding en paralelo sobre todas las imágenes; resultados en el mismo orden
+            all_images = [str(image_file) for _, image_files in jobs for image_file in image_files]
+            # 'spawn': no heredar el estado de Tk ni los locks de los hilos de la GUI
+            with ProcessPoolExecutor(max_workers=TRAIN_WORKERS, mp_context=multiprocessing.get_context('spawn')) as executor:
+                results = executor.map(_encode_image, all_images, chunksize=4)
                 
-                for image_file in image_files:
-                    try:
-                        # Cargar imagen
-                        image = face_recognition.load_image_file(str(image_file))
-                        
-                        # Detectar caras
-                        face_locations = face_recognition.face_locations(image)
-                        
-                        if not face_locations:
+                for i, (actor_name, image_files) in enumerate(jobs):
+                    self.log_progress(f"Procesando: {actor_name} ({i+1}/{len(jobs)})")
+                    encodings = []
+                    
+                    for image_file in image_files:
+                        face_encodings, error = next(results)
+                        if error:
+                            self.log_progress(f"Error procesando {image_file.name}: {error}", "ERROR")
+                        elif not face_encodings:
                             self.log_progress(f"Sin caras detectadas en: {image_file.name}", "WARNING")
-                            continue
-                        
-                        # Obtener encodings
-                        face_encodings = face_recognition.face_encodings(image, face_locations)
-                        
-                        if face_encodings:
+                        else:
                             encodings.extend(face_encodings)
                             self.log_progress(f"Encoding generado para: {actor_name}")
-                        
-                    except Exception as e:
-                        self.log_progress(f"Error procesando {image_file.name}: {str(e)}", "ERROR")
-                
-                if encodings:
-                    # Convertir a lista para JSON
-                    actors_db[actor_name] = [encoding.tolist() for encoding in encodings]
-                    successful_encodings += len(encodings)
-                    total_actors += 1
-                    self.log_progress(f"✅ {actor_name}: {len(encodings)} encodings")
-                else:
-                    self.log_progress(f"Sin encodings válidos para: {actor_name}", "ERROR")
+                    
+                    if encodings:
+                        actors_db[actor_name] = encodings
+                        successful_encodings += len(encodings)
+                        total_actors += 1
+                        self.log_progress(f"✅ {actor_name}: {len(encodings)} encodings")
+                    else:
+                        self.log_progress(f"Sin encodings válidos para: {actor_name}", "ERROR")
             
             # Guardar base de datos
             if actors_db:
-                db_path = Path("data/actors_db.json")
-                with open(db_path, 'w', encoding='utf-8') as f:
-                    json.dump(actors_db, f, indent=2, ensure_ascii=False)
+                # Formato binario: nombres, desplazamientos y una matriz (N, 128) float32
+                names = list(actors_db.keys())
+                offsets = np.cumsum([0] + [len(actors_db[name]) for name in names])
+                all_encodings = np.stack([encoding for name in names for encoding in actors_db[name]]).astype(np.float32)
+                db_path = Path("data/actors_db.npz")
+                np.savez_compressed(db_path, names=np.array(names), offsets=offsets, encodings=all_encodings)
+                
+                if export_json:
+                    # Copia solo para inspección manual
+                    if ORJSON_AVAILABLE:
+                        db_path.with_suffix('.json').write_bytes(orjson.dumps(
+                            {name: actors_db[name] for name in names},
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_INDENT_2))
+                    else:
+                        with open(db_path.with_suffix('.json'), 'w', encoding='utf-8') as f:
+                            json.dump({name: [encoding.tolist() for encoding in actors_db[name]] for name in names},
+                                      f, indent=2, ensure_ascii=False)
                 
                 self.log_progress("Modelo entrenado exitosamente!")
                 self.log_progress("Estadísticas:")
@@ -254,12 +324,20 @@ class ActorsManager:
     def get_database_info(self) -> Dict:
         """Obtener información de la base de datos actual"""
         try:
+            actors_db_path = Path("data/actors_db.npz")
+            if actors_db_path.exists():
+                import numpy as np
+                with np.load(actors_db_path) as data:
+                    names = data['names'].tolist()
+                    total_encodings = int(data['offsets'][-1])
+                return {'actors': len(names), 'encodings': total_encodings, 'actors_list': names}
+            
+            # Formato anterior en JSON
             actors_db_path = Path("data/actors_db.json")
             if not actors_db_path.exists():
                 return {'actors': 0, 'encodings': 0, 'actors_list': []}
             
-            with open(actors_db_path, 'r', encoding='utf-8') as f:
-                actors_data = json.load(f)
+            actors_data = json_loads(actors_db_path.read_bytes())
             
             total_encodings = sum(len(encodings) for encodings in actors_data.values())
             
@@ -271,4 +349,4 @@ class ActorsManager:
             
         except Exception as e:
             logging.error(f"Error obteniendo información de BD: {e}")
-            return {'actors': 0, 'encodings': 0, 'actors_list': []}
\ No newline at end of file
+            return {'actors': 0, 'encodings': 0, 'actors_list': []}
@@ -9,6 +9,7 @@ import json
 import requests
 import tempfile
 import subprocess
+import threading
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 import logging
@@ -27,6 +28,9 @@ class AudioAnalyzer:
         self.config = config
         self.progress_callback = progress_callback
         self.whisper_model = None
+        # Un solo modelo Whisper compartido por los hilos de FileOrganizer: se carga una vez y las
+        # transcripciones van de una en una (el decodificador instala hooks de kv-cache en el modelo)
+        self._whisper_lock = threading.RLock()
         self.opensubtitles_base_url = "https://api.opensubtitles.com/api/v1"
         
         # NO cargar modelo Whisper automáticamente en __init__
@@ -52,7 +56,9 @@ class AudioAnalyzer:
         try:
             model_name = self.config.get("whisper_model", "base")
             self.log_progress(f"Cargando modelo Whisper: {model_name}")
-            self.whisper_model = whisper.load_model(model_name)
+            model = whisper.load_model(model_name)
+            with self._whisper_lock:
+                self.whisper_model = model
             self.log_progress("Modelo Whisper cargado exitosamente")
             return True
         except Exception as e:
@@ -91,21 +97,22 @@ class AudioAnalyzer:
     def transcribe_audio(self, audio_path: Path, language: str = "es") -> Optional[Dict]:
         """Transcribir audio usando Whisper"""
         try:
-            # Cargar modelo si no está cargado
-            if not self.whisper_model:
-                if not self.load_whisper_model():
-                    self.log_progress("Modelo Whisper no disponible", "ERROR")
-                    return None
-            
-            self.log_progress(f"Transcribiendo audio: {audio_path.name}")
-            
-            # Transcribir con Whisper
-            result = self.whisper_model.transcribe(
-                str(audio_path),
-                language=language,
-                task="transcribe",
-                word_timestamps=True
-            )
+            with self._whisper_lock:
+                # Cargar modelo si no está cargado (con el lock: un único hilo lo carga)
+                if not self.whisper_model:
+                    if not self.load_whisper_model():
+                        self.log_progress("Modelo Whisper no disponible", "ERROR")
+                        return None
+                
+                self.log_progress(f"Transcribiendo audio: {audio_path.name}")
+                
+                # Transcribir con Whisper
+                result = self.whisper_model.transcribe(
+                    str(audio_path),
+                    language=language,
+                    task="transcribe",
+                    word_timestamps=True
+                )
             
             self.log_progress(f"Transcripción completada: {len(result['text'])} caracteres")
             
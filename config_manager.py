@@ -2,23 +2,41 @@
 Gestor de configuración para VideoSort Pro
 """
 
+import os
 import json
 import logging
 from pathlib import Path
 from typing import Dict, Any, Optional
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Máximo de líneas por panel de log (menor en equipos modestos)
+MAX_LOG_LINES = 500 if (os.cpu_count() or 1) <= 2 else 2000
+
 class ConfigManager:
     def __init__(self, config_file: str = "config/config.json"):
         self.config_file = Path(config_file)
         self.config = {}
+        self.dirty = False
+        # Último contenido escrito a disco (se omite la escritura si no ha cambiado)
+        self._last_written = None
         self.load_config()
     
     def load_config(self):
         """Cargar configuración desde archivo"""
         try:
             if self.config_file.exists():
-                with open(self.config_file, 'r', encoding='utf-8') as f:
-                    self.config = json.load(f)
+                if ORJSON_AVAILABLE:
+                    self.config = orjson.loads(self.config_file.read_bytes())
+                else:
+                    with open(self.config_file, 'r', encoding='utf-8') as f:
+                        self.config = json.load(f)
+                # Lo cargado cuenta como ya escrito: flush() no reescribe una configuración sin cambios
+                self._last_written = self._serialize()
                 logging.info(f"Configuración cargada desde: {self.config_file}")
             else:
                 # Configuración por defecto
@@ -31,6 +49,9 @@ class ConfigManager:
                     "min_confidence": 0.7,
                     "min_tmdb_score": 0.8,
                     "detect_actors": True,
+                    "face_detection_model": "hog",
+                    "face_batch_size": 32,
+                    "hardware_decoding": True,
                     "detect_studios": True,
                     "analyze_audio": False,
                     "jellyfin_naming": True,
@@ -40,31 +61,59 @@ class ConfigManager:
                     "whisper_model": "base",
                     "audio_language": "es",
                     "target_video_codec": "h264",
-                    "video_quality_preset": "medium",
+                    "video_quality_preset": "faster",
+                    "auto_video_preset": True,
                     "max_video_bitrate": "2M",
                     "enable_video_conversion": False,
                     "youtube_client_id": "",
                     "youtube_client_secret": "",
-                    "youtube_refresh_token": ""
+                    "youtube_refresh_token": "",
+                    "youtube_parallel": 4,
+                    "youtube_high_quality": False,
+                    "max_log_lines": MAX_LOG_LINES
                 }
                 self.save_config()
+                self.flush()
                 logging.info("Configuración por defecto creada")
         except Exception as e:
             logging.error(f"Error cargando configuración: {e}")
             self.config = {}
     
     def save_config(self, updates: Optional[Dict] = None) -> bool:
-        """Guardar configuración a archivo"""
+        """Guardar configuración en memoria; se escribe a disco con flush()"""
+        if updates:
+            self.config.update(updates)
+        self.dirty = True
+        return True
+    
+    def _serialize(self) -> bytes:
+        """Contenido del archivo de configuración para el estado actual"""
+        if ORJSON_AVAILABLE:
+            return orjson.dumps(self.config, option=orjson.OPT_INDENT_2)
+        return json.dumps(self.config, indent=2, ensure_ascii=False).encode('utf-8')
+    
+    def flush(self) -> bool:
+        """Escribir la configuración a archivo de forma atómica si hay cambios pendientes"""
+        if not self.dirty:
+            return True
         try:
-            if updates:
-                self.config.update(updates)
-            
             # Crear directorio si no existe
             self.config_file.parent.mkdir(parents=True, exist_ok=True)
             
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(self.config, f, indent=2, ensure_ascii=False)
+            data = self._serialize()
+            if data == self._last_written:
+                self.dirty = False
+                return True
+            
+            tmp_file = self.config_file.with_suffix(self.config_file.suffix + '.tmp')
+            with open(tmp_file, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.config_file)
             
+            self._last_written = data
+            self.dirty = False
             logging.info(f"Configuración guardada en: {self.config_file}")
             return True
         except Exception as e:
@@ -72,7 +121,7 @@ class ConfigManager:
             return False
     
     def get(self, key: str, default: Any = None) -> Any:
-        """Obtener valor de configuración"""
+        """Obtener valor de configuración (lectura en memoria, sin acceso a disco)"""
         return self.config.get(key, default)
     
     def set(self, key: str, value: Any):
@@ -3,6 +3,7 @@ Organizador de archivos para VideoSort Pro
 Maneja el movimiento y organización de archivos según estructura Jellyfin
 """
 
+import os
 import re
 import shutil
 import logging
@@ -11,6 +12,10 @@ from datetime import datetime
 from typing import Dict, List, Optional, Callable, Any
 import time
 import threading
+from string import Template
+from xml.sax.saxutils import escape as xml_escape
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext, simpledialog
 
@@ -19,9 +24,76 @@ TMDB_CONFIRM_SCORE = 0.95
 TMDB_PASS_SCORE = 0.70
 FINAL_CONFIDENCE_THRESHOLD = 0.60 # Umbral para mover el archivo (no desconocido)
 
+# Caracteres no válidos en nombres de archivo/carpeta (borrado por tabla con str.translate)
+_INVALID_FS_CHARS = str.maketrans('', '', '<>:"/\\|?*')
+
+# Plantillas NFO de Jellyfin, compiladas una vez (los valores se escapan para XML al sustituir)
+_MOVIE_NFO_TEMPLATE = Template("""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<movie>
+    <title>$title</title>
+    <originaltitle>$original_title</originaltitle>
+    <year>$year</year>
+    <plot>$overview</plot>
+    <tmdbid>$tmdb_id</tmdbid>
+    <id>$tmdb_id</id>
+    <uniqueid type="tmdb">$tmdb_id</uniqueid>
+</movie>""")
+_EPISODE_NFO_TEMPLATE = Template("""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<episodedetails>
+    <title>$title</title>
+    <season>$season</season>
+    <episode>$episode</episode>
+    <plot>$overview</plot>
+    <tmdbid>$tmdb_id</tmdbid>
+    <uniqueid type="tmdb">$tmdb_id</uniqueid>
+</episodedetails>""")
+
+# Sufijo de duplicado " (n)" al final del nombre
+_DUPLICATE_SUFFIX_RE = re.compile(r'\s\(\d+\)$')
+
+# Carpetas de sistema que nunca contienen videos de la biblioteca
+_SKIPPED_DIRS = frozenset(('$recycle.bin', 'system volume information', '@eadir', 'lost+found'))
+
+# Tamaño mínimo de un video real; por debajo son marcadores o descargas a medias
+MIN_VIDEO_SIZE = 1024 * 1024
+
+def iter_video_files(root, extensions, exclude=(), min_size=MIN_VIDEO_SIZE):
+    """Recorrer recursivamente una carpeta con os.scandir y generar las rutas de video
+    
+    Se omiten las carpetas ocultas, las de sistema y las indicadas en exclude, así como
+    los archivos ocultos o temporales y los menores de min_size bytes.
+    """
+    video_exts = frozenset(ext.lower() for ext in extensions)
+    excluded = frozenset(os.path.normcase(os.path.abspath(path)) for path in exclude)
+    stack = [os.fspath(root)]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if (entry.name.startswith('.') or entry.name.lower() in _SKIPPED_DIRS
+                                    or (excluded and os.path.normcase(os.path.abspath(entry.path)) in excluded)):
+                                continue
+                            stack.append(entry.path)
+                        # Sufijo con un solo rfind sobre el nombre (sin punto queda el último carácter, que no coincide)
+                        elif (entry.name[entry.name.rfind('.'):].lower() in video_exts
+                                and not entry.name.startswith(('.', '~'))
+                                and entry.is_file() and entry.stat().st_size >= min_size):
+                            yield Path(entry.path)
+                    except OSError:
+                        continue
+        except OSError as e:
+            logging.warning(f"No se pudo leer la carpeta {current}: {e}")
+
 class FileOrganizer:
     def __init__(self, config):
         self.config = config
+        # Serializa la elección del nombre de destino entre hilos de procesamiento
+        self._move_lock = threading.Lock()
+        # Destinos elegidos cuyo movimiento aún no ha terminado
+        self._reserved_destinations = set()
         
     def create_jellyfin_structure(self, video_info: Dict, dest_base_path: Path) -> Optional[Path]:
         """Crear estructura de carpetas según convenciones de Jellyfin"""
@@ -33,7 +105,7 @@ class FileOrganizer:
                 if year: folder_name = f"{title} ({year})"
                 else: folder_name = title
                 
-                folder_name = re.sub(r'[<>:"/\\|?*]', '', folder_name)
+                folder_name = folder_name.translate(_INVALID_FS_CHARS)
                 movie_folder = dest_base_path / folder_name
                 movie_folder.mkdir(parents=True, exist_ok=True)
                 return movie_folder
@@ -42,7 +114,7 @@ class FileOrganizer:
                 title = video_info['title']
                 season = video_info['season']
                 
-                clean_title = re.sub(r'[<>:"/\\|?*]', '', title)
+                clean_title = title.translate(_INVALID_FS_CHARS)
                 
                 series_folder = dest_base_path / clean_title
                 season_folder = series_folder / f"Season {season:02d}"
@@ -52,7 +124,7 @@ class FileOrganizer:
             elif video_info['type'] == 'extra':
                 title = video_info['title']
                 extra_type = video_info.get('extra_type', 'extra')
-                clean_title = re.sub(r'[<>:"/\\|?*]', '', title)
+                clean_title = title.translate(_INVALID_FS_CHARS)
                 series_folder = dest_base_path / clean_title
                 
                 if extra_type in ['featurette', 'documentary', 'interview']: extras_folder = series_folder / "Specials"
@@ -80,7 +152,7 @@ class FileOrganizer:
         
         elif video_info['type'] == 'extra':
             title = video_info['title']; original_name = Path(original_filename).stem
-            clean_original = re.sub(r'[<>:"/\\|?*]', '', original_name)
+            clean_original = original_name.translate(_INVALID_FS_CHARS)
             
             if len(clean_original) > 5: filename = f"{clean_original}{extension}"
             else:
@@ -89,7 +161,7 @@ class FileOrganizer:
         
         else: filename = original_filename
         
-        filename = re.sub(r'[<>:"/\\|?*]', '', filename)
+        filename = filename.translate(_INVALID_FS_CHARS)
         return filename
     
     def create_nfo_file(self, video_info: Dict, video_file_path: Path):
@@ -97,30 +169,21 @@ class FileOrganizer:
         try:
             nfo_path = video_file_path.with_suffix('.nfo')
             
-            if video_info['type'] == 'movie':
-                nfo_content = f"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
-<movie>
-    <title>{video_info['title']}</title>
-    <originaltitle>{video_info.get('original_title', video_info['title'])}</originaltitle>
-    <year>{video_info.get('year', '')}</year>
-    <plot>{video_info.get('overview', '')}</plot>
-    <tmdbid>{video_info.get('tmdb_id', '')}</tmdbid>
-    <id>{video_info.get('tmdb_id', '')}</id>
-    <uniqueid type="tmdb">{video_info.get('tmdb_id', '')}</uniqueid>
-</movie>"""
-            elif video_info['type'] == 'series':
-                nfo_content = f"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
-<episodedetails>
-    <title>{video_info['title']}</title>
-    <season>{video_info.get('season', '')}</season>
-    <episode>{video_info.get('episode', '')}</episode>
-    <plot>{video_info.get('overview', '')}</plot>
-    <tmdbid>{video_info.get('tmdb_id', '')}</tmdbid>
-    <uniqueid type="tmdb">{video_info.get('tmdb_id', '')}</uniqueid>
-</episodedetails>"""
+            if video_info['type'] == 'movie': template = _MOVIE_NFO_TEMPLATE
+            elif video_info['type'] == 'series': template = _EPISODE_NFO_TEMPLATE
             else: return
             
-            with open(nfo_path, 'w', encoding='utf-8') as f: f.write(nfo_content)
+            values = {
+                'title': video_info['title'],
+                'original_title': video_info.get('original_title', video_info['title']),
+                'year': video_info.get('year', ''), 'season': video_info.get('season', ''),
+                'episode': video_info.get('episode', ''), 'overview': video_info.get('overview', ''),
+                'tmdb_id': video_info.get('tmdb_id', ''),
+            }
+            nfo_content = template.substitute({key: xml_escape(str(value)) for key, value in values.items()})
+            
+            # Una sola escritura de los bytes ya codificados
+            with open(nfo_path, 'wb') as f: f.write(nfo_content.encode('utf-8'))
             logging.info(f"Archivo NFO creado: {nfo_path.name}")
             
         except Exception as e:
@@ -167,182 +230,43 @@ usando reconocimiento óptico de caracteres (OCR) y reconocimiento facial.
             movies_dest.mkdir(parents=True, exist_ok=True)
             series_dest.mkdir(parents=True, exist_ok=True)
             
-            video_extensions = set(self.config.get('video_extensions', []))
-            videos_found = [file_path for file_path in source_path.rglob('*') 
-                            if file_path.is_file() and file_path.suffix.lower() in video_extensions]
-            
-            log_callback(f"Procesando {len(videos_found)} archivos de video con sistema de Capas...")
+            log_callback("Buscando y procesando archivos de video con sistema de Capas...")
             
-            progress_bar.configure(mode='determinate', maximum=len(videos_found))
+            progress_bar.configure(mode='determinate', maximum=1, value=0)
+            cancel_event = options.get('cancel_event')
+            # Resultados de Capa 0 por título: los episodios de una serie comparten una sola búsqueda
+            capa_0_results = {}
             
-            for i, video_path in enumerate(videos_found):
+            completed = 0
+            max_workers = max(1, self.config.get('max_processes', 4))
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                # El procesamiento empieza mientras sigue el recorrido de la carpeta; las carpetas
+                # de destino se excluyen para no volver a encontrar los archivos ya movidos
+                futures = []
+                videos_found = iter_video_files(source_path, self.config.get('video_extensions', []),
+                                                exclude=(movies_dest, series_dest))
+                for i, video_path in enumerate(videos_found):
+                    if cancel_event is not None and cancel_event.is_set():
+                        break
+                    futures.append(executor.submit(self._process_one, video_path, i, movies_dest, series_dest,
+                                                   options, tmdb_client, video_analyzer, audio_analyzer,
+                                                   log_callback, capa_0_results))
+                    progress_bar.configure(maximum=len(futures))
                 
-                # Reinicio de variables por archivo
-                tmdb_info = None
-                analysis_result = None
-                final_confidence = 0.0
+                log_callback(f"Encontrados {len(futures)} archivos de video")
                 
-                try:
-                    progress_bar['value'] = i + 1
-                    
-                    log_callback(f"--- Procesando: {video_path.name} ({i+1}/{len(videos_found)}) ---")
-                    
-                    video_info = video_analyzer.extract_video_info(video_path.name)
-                    
-                    if not video_info:
-                        log_callback(f"Capa 0 - Fallo: No se pudo extraer info. Se mantiene en origen.", "WARNING")
-                        stats['unknown_files'] += 1
-                        continue 
-                    
-                    # ----------------------------------------------------
-                    # CAPA 0: METADATOS TEXTUALES (siempre se ejecuta primero)
-                    # ----------------------------------------------------
-                    if options['capas_activas']['capa_0']:
-                        log_callback(f"Capa 0: Ejecutando búsqueda en TMDb para '{video_info['search_title']}'")
-                        tmdb_info = self._run_capa_0(video_info, tmdb_client, options)
-                        
-                        if tmdb_info:
-                            video_info.update(tmdb_info) # Actualizar video_info con TMDB data
-                            final_confidence = tmdb_info.get('similarity_score', 0.0)
-
-                            if final_confidence >= TMDB_CONFIRM_SCORE:
-                                log_callback("Capa 0 - Confirmado: Score >= 0.95. Terminando identificación aquí.", "INFO")
-                            elif final_confidence >= TMDB_PASS_SCORE:
-                                log_callback(f"Capa 0 - Probable: Score {final_confidence:.2f}. Avanzando a Capa 1.", "INFO")
-                            else:
-                                log_callback(f"Capa 0 - Dudoso: Score {final_confidence:.2f}. Requiere Capa 1.", "WARNING")
-                        else:
-                            log_callback("Capa 0 - Fallo: Título no encontrado en TMDb.", "WARNING")
-
-                    
-                    # ----------------------------------------------------
-                    # MÓDULOS DE ENTRADA (OCR/FACIAL) - Se ejecutan si se requiere Capa 1/3
-                    # ----------------------------------------------------
-                    if (final_confidence < TMDB_CONFIRM_SCORE) and \
-                       (options['capas_activas']['capa_1'] or options['capas_activas']['capa_3']):
-                        
-                        if options['modulos_entrada']['facial_recognition'] or options['modulos_entrada']['ocr_analysis']:
-                            log_callback("Ejecutando Análisis Visual (OCR/Facial) para Capas 1/3...")
-                            analysis_result = video_analyzer.perform_visual_analysis(video_path)
-                            if analysis_result and analysis_result.get('confidence', 0) > 0.3:
-                                stats['visual_analysis_used'] += 1
-                                stats['actors_detected'].update(analysis_result.get('actors', []))
-                                log_callback(f"Análisis Visual (confianza: {analysis_result['confidence']:.2f})")
-
-                    # ----------------------------------------------------
-                    # CAPA 1: HASHING PERCEPTUAL (DB Local)
-                    # ----------------------------------------------------
-                    if (final_confidence < TMDB_CONFIRM_SCORE) and options['capas_activas']['capa_1']:
-                        log_callback("Capa 1: Ejecutando comparación de pHash (DB Local)")
-                        
-                        # Simulación: Aquí iría la lógica real. Usamos el score del análisis visual como proxy.
-                        capa_1_score = analysis_result.get('confidence', 0) if analysis_result else 0
-                        
-                        # Lógica de decisión: El pHash es muy fuerte.
-                        if capa_1_score >= 0.85:
-                            log_callback(f"Capa 1 - Confirmado: Score {capa_1_score:.2f}. Sobrepasa Capa 0.", "INFO")
-                            final_confidence = 0.95 # Alta fiabilidad
-                        elif capa_1_score > final_confidence:
-                            final_confidence = max(final_confidence, capa_1_score * 0.8) # Ponderación si es menor
+                for future in as_completed(futures):
+                    file_stats = future.result()
+                    for key, value in file_stats.items():
+                        if key == 'actors_detected':
+                            stats['actors_detected'].update(value)
                         else:
-                             log_callback("Capa 1 - Sin Match Fuerte.", "INFO")
-
-
-                    # ----------------------------------------------------
-                    # CAPA 2: AUDIO FINGERPRINT (AcoustID)
-                    # ----------------------------------------------------
-                    if (final_confidence < 0.90) and options['capas_activas']['capa_2']:
-                        log_callback("Capa 2: Ejecutando Audio Fingerprint (AcoustID)")
-                        
-                        # NOTE: Esto puede ser costoso/lento, se ejecuta solo si es necesario.
-                        if options['modulos_entrada']['audio_whisper']:
-                            audio_match = audio_analyzer.find_movie_by_audio_analysis(
-                                audio_analyzer.analyze_video_audio(video_path, num_segments=2)
-                            )
-                        else:
-                            audio_match = None
-
-                        if audio_match and audio_match.get('confidence_score', 0) >= 0.75:
-                            log_callback(f"Capa 2 - CONFIRMADO: Match de audio. Título: {audio_match['title']}", "INFO")
-                            final_confidence = 0.98 # Máxima fiabilidad
-                        elif audio_match:
-                            log_callback("Capa 2 - REFUTADO/DUDOSO: Penalizando score.", "WARNING")
-                            final_confidence *= 0.5 
-                        else:
-                            log_callback("Capa 2 - NO ENCONTRADO (no penaliza).", "INFO")
-
-
-                    # ----------------------------------------------------
-                    # CAPA 3: VERIFICACIÓN IA (Gemini - Alto Costo)
-                    # ----------------------------------------------------
-                    if (final_confidence < FINAL_CONFIDENCE_THRESHOLD) and options['capas_activas']['capa_3']:
-                        log_callback("Capa 3: Ejecutando Verificación IA (Gemini)", "WARNING")
-                        
-                        # NOTE: Aquí iría la llamada real a Gemini con las capturas de video
-                        # Simulamos un resultado con base en el análisis visual para el flujo
-                        
-                        gemini_conf = analysis_result.get('confidence', 0) * 0.9 if analysis_result else 0.0
-                        
-                        if gemini_conf >= 0.80:
-                            log_callback("Capa 3 - Éxito: IA sugiere alta confianza.", "INFO")
-                            final_confidence = 0.80
-                        elif gemini_conf > 0.50:
-                            log_callback("Capa 3 - Requerir Manual: IA es ambigua.", "WARNING")
-                            final_confidence = 0.65
-                        else:
-                            final_confidence = min(final_confidence, 0.40) # Desconfianza
-
-                    # ----------------------------------------------------
-                    # DECISIÓN FINAL
-                    # ----------------------------------------------------
-                    log_callback(f"Decisión Final: Confianza calculada: {final_confidence:.2f}")
-
-                    if final_confidence < FINAL_CONFIDENCE_THRESHOLD:
-                        log_callback(f"Decisión Final: Confianza baja. Se mantiene en origen (DUDOSO).", "WARNING")
-                        stats['skipped_low_confidence'] += 1
-                        stats['unknown_files'] += 1
-                        continue # Mantiene el archivo en origen
-
-                    # Si llegamos aquí, el archivo está identificado con suficiente confianza para moverse.
-                    
-                    # Asegurar tmdb_info final para nombrar
-                    if tmdb_info: video_info.update(tmdb_info)
-
-                    if video_info['type'] == 'movie':
-                        dest_folder = self.create_jellyfin_structure(video_info, movies_dest)
-                        stats['movies_processed'] += 1
-                    else:
-                        dest_folder = self.create_jellyfin_structure(video_info, series_dest)
-                        stats['series_processed'] += 1
-
-                    if not dest_folder:
-                        log_callback(f"Error creando carpeta. Se mantiene en origen.", "ERROR")
-                        stats['errors'] += 1
-                        continue
-                        
-                    new_filename = self.generate_jellyfin_filename(video_info, video_path.name)
-                    dest_file = dest_folder / new_filename
-                    
-                    if options['move_files']:
-                        if dest_file.exists(): 
-                            counter = 1
-                            original_stem = dest_file.stem
-                            ext = dest_file.suffix
-                            if re.search(r'\s\(\d+\)$', original_stem): original_stem = re.sub(r'\s\(\d+\)$', '', original_stem)
-                            while dest_file.exists():
-                                dest_file = dest_folder / f"{original_stem} ({counter}){ext}"; counter += 1
-                        
-                        shutil.move(str(video_path), str(dest_file))
-                        log_callback(f"Movido: {video_path.name} -> {dest_file}")
-                    else:
-                        log_callback(f"Análisis: {video_path.name} debería moverse a -> {dest_file}")
-                        
-                    if tmdb_info and tmdb_info.get('tmdb_id'): self.create_nfo_file(video_info, dest_file)
-                    if analysis_result: self.create_analysis_file(analysis_result, dest_file)
-                
-                except Exception as e:
-                    log_callback(f"Error procesando {video_path.name}: {str(e)}. Se mantiene en origen.", "ERROR")
-                    stats['errors'] += 1
+                            stats[key] += value
+                    completed += 1
+                    progress_bar['value'] = completed
+            
+            if cancel_event is not None and cancel_event.is_set():
+                log_callback("Procesamiento cancelado por el usuario", "WARNING")
             
             processing_time = datetime.now() - stats['processing_time']
             stats['processing_time'] = str(processing_time).split('.')[0]
@@ -351,18 +275,216 @@ usando reconocimiento óptico de caracteres (OCR) y reconocimiento facial.
         except Exception as e:
             log_callback(f"Error crítico durante el procesamiento: {str(e)}", "ERROR")
             stats['errors'] += 1
+        finally:
+            # Una sola transacción para las búsquedas TMDB cacheadas del lote
+            tmdb_client.flush_cache()
         
         return stats
     
-    def _run_capa_0(self, video_info: Dict, tmdb_client, options: Dict) -> Optional[Dict]:
+    def _process_one(self, video_path: Path, i: int, movies_dest: Path, series_dest: Path,
+                     options: Dict, tmdb_client, video_analyzer, audio_analyzer, log_callback,
+                     capa_0_results: Dict) -> Dict:
+        """Procesar un único video con el sistema de Capas y devolver sus estadísticas parciales"""
+        stats = defaultdict(int)
+        stats['actors_detected'] = set()
+        
+        cancel_event = options.get('cancel_event')
+        if cancel_event is not None and cancel_event.is_set():
+            return stats
+        
+        # Reinicio de variables por archivo
+        tmdb_info = None
+        analysis_result = None
+        final_confidence = 0.0
+
+        try:
+            log_callback(f"--- Procesando: {video_path.name} (#{i+1}) ---")
+
+            # Misma clave (nombre, ruta) que la vista previa: el segundo pase sale de la cache
+            video_info = video_analyzer.extract_video_info(video_path.name, str(video_path))
+
+            if not video_info:
+                log_callback(f"Capa 0 - Fallo: No se pudo extraer info. Se mantiene en origen.", "WARNING")
+                stats['unknown_files'] += 1
+                return stats
+
+            # ----------------------------------------------------
+            # CAPA 0: METADATOS TEXTUALES (siempre se ejecuta primero)
+            # ----------------------------------------------------
+            if options['capas_activas']['capa_0']:
+                log_callback(f"Capa 0: Ejecutando búsqueda en TMDb para '{video_info['search_title']}'")
+                tmdb_info = self._run_capa_0(video_info, tmdb_client, options, capa_0_results)
+
+                if tmdb_info:
+                    video_info.update(tmdb_info) # Actualizar video_info con TMDB data
+                    final_confidence = tmdb_info.get('similarity_score', 0.0)
+
+                    if final_confidence >= TMDB_CONFIRM_SCORE:
+                        log_callback("Capa 0 - Confirmado: Score >= 0.95. Terminando identificación aquí.", "INFO")
+                    elif final_confidence >= TMDB_PASS_SCORE:
+                        log_callback(f"Capa 0 - Probable: Score {final_confidence:.2f}. Avanzando a Capa 1.", "INFO")
+                    else:
+                        log_callback(f"Capa 0 - Dudoso: Score {final_confidence:.2f}. Requiere Capa 1.", "WARNING")
+                else:
+                    log_callback("Capa 0 - Fallo: Título no encontrado en TMDb.", "WARNING")
+
+
+            # ----------------------------------------------------
+            # MÓDULOS DE ENTRADA (OCR/FACIAL) - Se ejecutan si se requiere Capa 1/3
+            # ----------------------------------------------------
+            if (final_confidence < TMDB_CONFIRM_SCORE) and \
+               (options['capas_activas']['capa_1'] or options['capas_activas']['capa_3']):
+
+                if options['modulos_entrada']['facial_recognition'] or options['modulos_entrada']['ocr_analysis']:
+                    log_callback("Ejecutando Análisis Visual (OCR/Facial) para Capas 1/3...")
+                    analysis_result = video_analyzer.perform_visual_analysis(video_path)
+                    if analysis_result and analysis_result.get('confidence', 0) > 0.3:
+                        stats['visual_analysis_used'] += 1
+                        stats['actors_detected'].update(analysis_result.get('actors', []))
+                        log_callback(f"Análisis Visual (confianza: {analysis_result['confidence']:.2f})")
+
+            # ----------------------------------------------------
+            # CAPA 1: HASHING PERCEPTUAL (DB Local)
+            # ----------------------------------------------------
+            if (final_confidence < TMDB_CONFIRM_SCORE) and options['capas_activas']['capa_1']:
+                log_callback("Capa 1: Ejecutando comparación de pHash (DB Local)")
+
+                # Simulación: Aquí iría la lógica real. Usamos el score del análisis visual como proxy.
+                capa_1_score = analysis_result.get('confidence', 0) if analysis_result else 0
+
+                # Lógica de decisión: El pHash es muy fuerte.
+                if capa_1_score >= 0.85:
+                    log_callback(f"Capa 1 - Confirmado: Score {capa_1_score:.2f}. Sobrepasa Capa 0.", "INFO")
+                    final_confidence = 0.95 # Alta fiabilidad
+                elif capa_1_score > final_confidence:
+                    final_confidence = max(final_confidence, capa_1_score * 0.8) # Ponderación si es menor
+                else:
+                     log_callback("Capa 1 - Sin Match Fuerte.", "INFO")
+
+
+            # ----------------------------------------------------
+            # CAPA 2: AUDIO FINGERPRINT (AcoustID)
+            # ----------------------------------------------------
+            if (final_confidence < 0.90) and options['capas_activas']['capa_2']:
+                log_callback("Capa 2: Ejecutando Audio Fingerprint (AcoustID)")
+
+                # NOTE: Esto puede ser costoso/lento, se ejecuta solo si es necesario.
+                if options['modulos_entrada']['audio_whisper']:
+                    audio_match = audio_analyzer.find_movie_by_audio_analysis(
+                        audio_analyzer.analyze_video_audio(video_path, num_segments=2)
+                    )
+                else:
+                    audio_match = None
+
+                if audio_match and audio_match.get('confidence_score', 0) >= 0.75:
+                    log_callback(f"Capa 2 - CONFIRMADO: Match de audio. Título: {audio_match['title']}", "INFO")
+                    final_confidence = 0.98 # Máxima fiabilidad
+                elif audio_match:
+                    log_callback("Capa 2 - REFUTADO/DUDOSO: Penalizando score.", "WARNING")
+                    final_confidence *= 0.5 
+                else:
+                    log_callback("Capa 2 - NO ENCONTRADO (no penaliza).", "INFO")
+
+
+            # ----------------------------------------------------
+            # CAPA 3: VERIFICACIÓN IA (Gemini - Alto Costo)
+            # ----------------------------------------------------
+            if (final_confidence < FINAL_CONFIDENCE_THRESHOLD) and options['capas_activas']['capa_3']:
+                log_callback("Capa 3: Ejecutando Verificación IA (Gemini)", "WARNING")
+
+                # NOTE: Aquí iría la llamada real a Gemini con las capturas de video
+                # Simulamos un resultado con base en el análisis visual para el flujo
+
+                gemini_conf = analysis_result.get('confidence', 0) * 0.9 if analysis_result else 0.0
+
+                if gemini_conf >= 0.80:
+                    log_callback("Capa 3 - Éxito: IA sugiere alta confianza.", "INFO")
+                    final_confidence = 0.80
+                elif gemini_conf > 0.50:
+                    log_callback("Capa 3 - Requerir Manual: IA es ambigua.", "WARNING")
+                    final_confidence = 0.65
+                else:
+                    final_confidence = min(final_confidence, 0.40) # Desconfianza
+
+            # ----------------------------------------------------
+            # DECISIÓN FINAL
+            # ----------------------------------------------------
+            log_callback(f"Decisión Final: Confianza calculada: {final_confidence:.2f}")
+
+            if final_confidence < FINAL_CONFIDENCE_THRESHOLD:
+                log_callback(f"Decisión Final: Confianza baja. Se mantiene en origen (DUDOSO).", "WARNING")
+                stats['skipped_low_confidence'] += 1
+                stats['unknown_files'] += 1
+                return stats # Mantiene el archivo en origen
+
+            # Si llegamos aquí, el archivo está identificado con suficiente confianza para moverse.
+
+            # Asegurar tmdb_info final para nombrar
+            if tmdb_info: video_info.update(tmdb_info)
+
+            if video_info['type'] == 'movie':
+                dest_folder = self.create_jellyfin_structure(video_info, movies_dest)
+                stats['movies_processed'] += 1
+            else:
+                dest_folder = self.create_jellyfin_structure(video_info, series_dest)
+                stats['series_processed'] += 1
+
+            if not dest_folder:
+                log_callback(f"Error creando carpeta. Se mantiene en origen.", "ERROR")
+                stats['errors'] += 1
+                return stats
+
+            new_filename = self.generate_jellyfin_filename(video_info, video_path.name)
+            dest_file = dest_folder / new_filename
+
+            if options['move_files']:
+                # Elegir y reservar el nombre de destino bajo el lock; la copia (lenta entre volúmenes)
+                # se hace fuera para que los demás hilos puedan mover sus archivos a la vez
+                with self._move_lock:
+                    if dest_file.exists() or dest_file in self._reserved_destinations:
+                        counter = 1
+                        original_stem = dest_file.stem
+                        ext = dest_file.suffix
+                        original_stem = _DUPLICATE_SUFFIX_RE.sub('', original_stem)
+                        # Una sola lectura de la carpeta en lugar de un exists() por candidato
+                        existing = {os.path.normcase(name) for name in os.listdir(dest_folder)}
+                        while (os.path.normcase(dest_file.name) in existing
+                               or dest_file in self._reserved_destinations):
+                            dest_file = dest_folder / f"{original_stem} ({counter}){ext}"; counter += 1
+                    self._reserved_destinations.add(dest_file)
+                
+                try:
+                    shutil.move(str(video_path), str(dest_file))
+                finally:
+                    with self._move_lock:
+                        self._reserved_destinations.discard(dest_file)
+                log_callback(f"Movido: {video_path.name} -> {dest_file}")
+            else:
+                log_callback(f"Análisis: {video_path.name} debería moverse a -> {dest_file}")
+
+            if tmdb_info and tmdb_info.get('tmdb_id'): self.create_nfo_file(video_info, dest_file)
+            if analysis_result: self.create_analysis_file(analysis_result, dest_file)
+
+        except Exception as e:
+            log_callback(f"Error procesando {video_path.name}: {str(e)}. Se mantiene en origen.", "ERROR")
+            stats['errors'] += 1
+        
+        return stats
+    
+    def _run_capa_0(self, video_info: Dict, tmdb_client, options: Dict, results_cache: Optional[Dict] = None) -> Optional[Dict]:
         """Ejecuta la Capa 0: Búsqueda inicial en TMDb."""
+        key = (video_info['type'], video_info['search_title'], video_info.get('year'))
+        if results_cache is not None and key in results_cache:
+            return results_cache[key]
+        
         if video_info['type'] == 'series':
             tmdb_info = tmdb_client.search_tv_show(video_info['search_title'], options.get('tmdb_min_score', 0.8))
         else:
             tmdb_info = tmdb_client.search_movie(video_info['search_title'], video_info.get('year'), options.get('tmdb_min_score', 0.8))
         
-        if tmdb_info: return tmdb_info
-        return None
+        tmdb_info = tmdb_info or None
+        if results_cache is not None: results_cache[key] = tmdb_info
+        return tmdb_info
 
     def enhanced_search_with_visual_data(self, video_info: Dict, visual_analysis: Dict, tmdb_client, options: Dict):
         """Función de búsqueda alternativa (usada por el código original)."""
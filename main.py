@@ -4,43 +4,28 @@ VideoSort Pro v2 - Organizador Avanzado para Jellyfin
 Archivo principal de la aplicación
 """
 
+import importlib.util
 import tkinter as tk
 from tkinter import messagebox
 from video_sort_app import VideoSortPro
 
+# Módulo a importar -> paquete de pip
+CRITICAL_DEPENDENCIES = {
+    "cv2": "opencv-python",
+    "pytesseract": "pytesseract",
+    "face_recognition": "face_recognition",
+    "requests": "requests",
+    "numpy": "numpy",
+    "PIL": "Pillow",
+}
+
 def check_dependencies():
-    """Verificar dependencias críticas"""
+    """Verificar dependencias críticas (sin importarlas; se cargan al usarse)"""
     missing_deps = []
     
-    try:
-        import cv2
-    except ImportError:
-        missing_deps.append("opencv-python")
-    
-    try:
-        import pytesseract
-    except ImportError:
-        missing_deps.append("pytesseract")
-    
-    try:
-        import face_recognition
-    except ImportError:
-        missing_deps.append("face_recognition")
-    
-    try:
-        import requests
-    except ImportError:
-        missing_deps.append("requests")
-    
-    try:
-        import numpy as np
-    except ImportError:
-        missing_deps.append("numpy")
-    
-    try:
-        from PIL import Image, ImageTk
-    except ImportError:
-        missing_deps.append("Pillow")
+    for module_name, package_name in CRITICAL_DEPENDENCIES.items():
+        if importlib.util.find_spec(module_name) is None:
+            missing_deps.append(package_name)
     
     return missing_deps
 
@@ -67,12 +52,8 @@ def main():
     root = tk.Tk()
     app = VideoSortPro(root)
     
-    # Configurar cierre de aplicación
-    def on_closing():
-        if messagebox.askokcancel("Salir", "¿Estás seguro de que quieres salir?"):
-            root.destroy()
-    
-    root.protocol("WM_DELETE_WINDOW", on_closing)
+    # Configurar cierre de aplicación (confirma, guarda configuración y cierra logs)
+    root.protocol("WM_DELETE_WINDOW", app.on_closing)
     
     # Mostrar mensaje de bienvenida
     app.log("🎬 VideoSort Pro v2 iniciado")
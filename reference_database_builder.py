@@ -8,12 +8,14 @@ import sqlite3
 import hashlib
 import logging
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import shutil
 import subprocess
 import time
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple, Any
 from datetime import datetime
-import cv2
 import numpy as np
 import re
 
@@ -45,6 +47,12 @@ class ReferenceDatabaseBuilder:
         self.tmdb_base_url = "https://api.themoviedb.org/3"
         self.tmdb_image_base = "https://image.tmdb.org/t/p"
         
+        # Sesión persistente para API e imágenes de TMDb (keep-alive y reintentos ante 429/5xx)
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = "VideoSortPro v2.0"
+        retries = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+        self.session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=20, max_retries=retries))
+        
         # Crear carpetas necesarias
         self.images_cache = Path("data/cache/images")
         self.videos_cache = Path("data/cache/videos")
@@ -53,11 +61,22 @@ class ReferenceDatabaseBuilder:
         
         # Estado de pausa
         self.paused = False
-        self.should_stop = False
+        self._stop_requested = False
+        # Evento de cancelación de la aplicación (opcional): detiene la construcción igual que stop_processing()
+        self.cancel_event = None
         
         # NOTA: La inicialización de la DB (self.init_database()) se llama desde 
         # VideoSortPro.__init__ después de crear los logs.
     
+    @property
+    def should_stop(self) -> bool:
+        """Se pidió detener la construcción (botón Detener o cancelación de la aplicación)"""
+        return self._stop_requested or (self.cancel_event is not None and self.cancel_event.is_set())
+    
+    @should_stop.setter
+    def should_stop(self, value: bool):
+        self._stop_requested = value
+    
     def log(self, message: str, level: str = "INFO"):
         """Logging con callback"""
         if self.progress_callback:
@@ -231,6 +250,15 @@ class ReferenceDatabaseBuilder:
         except Exception as e:
             self.log(f"❌ Error marcando contenido procesado: {e}", "ERROR")
     
+    def _download_image(self, url: str, save_path: Path):
+        """Descargar una imagen escribiéndola a disco por bloques (sin cargarla entera en memoria)"""
+        with self.session.get(url, stream=True, timeout=20) as response:
+            response.raise_for_status(); response.raw.decode_content = True
+            # Temporal + rename: sin fsync, pero nunca queda una imagen a medias con el nombre final
+            part_path = save_path.with_suffix(save_path.suffix + '.part')
+            with open(part_path, 'wb') as f: shutil.copyfileobj(response.raw, f, length=64 * 1024)
+            part_path.replace(save_path)
+    
     def download_tmdb_images(self, tmdb_id: int, content_type: str = "movie") -> List[Path]:
         """Descargar imágenes de TMDb (posters, backdrops)"""
         try:
@@ -238,27 +266,25 @@ class ReferenceDatabaseBuilder:
             if not api_key: self.log("❌ API Key de TMDb no configurada", "ERROR"); return []
             
             endpoint = f"/{content_type}/{tmdb_id}/images"; url = f"{self.tmdb_base_url}{endpoint}"
-            params = { 'api_key': api_key, 'include_image_language': 'en,null' }; response = requests.get(url, params=params, timeout=15); response.raise_for_status()
+            params = { 'api_key': api_key, 'include_image_language': 'en,null' }; response = self.session.get(url, params=params, timeout=15); response.raise_for_status()
             data = response.json(); downloaded_images = []
             
             for i, poster in enumerate(data.get('posters', [])[:3]):
                 try:
                     file_path = poster.get('file_path'); 
                     if not file_path: continue
-                    image_url = f"{self.tmdb_image_base}/w500{file_path}"; img_response = requests.get(image_url, timeout=20); img_response.raise_for_status()
                     filename = f"{tmdb_id}_poster_{i}.jpg"; save_path = self.images_cache / filename
-                    with open(save_path, 'wb') as f: f.write(img_response.content)
-                    downloaded_images.append(save_path); self.log(f"  📥 Poster {i+1} descargado"); time.sleep(0.2)
+                    self._download_image(f"{self.tmdb_image_base}/w500{file_path}", save_path)
+                    downloaded_images.append(save_path); self.log(f"  📥 Poster {i+1} descargado")
                 except Exception as e: self.log(f"  ⚠️ Error descargando poster {i}: {e}", "WARNING")
             
             for i, backdrop in enumerate(data.get('backdrops', [])[:2]):
                 try:
                     file_path = backdrop.get('file_path'); 
                     if not file_path: continue
-                    image_url = f"{self.tmdb_image_base}/w780{file_path}"; img_response = requests.get(image_url, timeout=20); img_response.raise_for_status()
                     filename = f"{tmdb_id}_backdrop_{i}.jpg"; save_path = self.images_cache / filename
-                    with open(save_path, 'wb') as f: f.write(img_response.content)
-                    downloaded_images.append(save_path); self.log(f"  📥 Backdrop {i+1} descargado"); time.sleep(0.2)
+                    self._download_image(f"{self.tmdb_image_base}/w780{file_path}", save_path)
+                    downloaded_images.append(save_path); self.log(f"  📥 Backdrop {i+1} descargado")
                 except Exception as e: self.log(f"  ⚠️ Error descargando backdrop {i}: {e}", "WARNING")
             
             return downloaded_images
@@ -278,6 +304,7 @@ class ReferenceDatabaseBuilder:
     def generate_phash_from_video(self, video_path: Path, num_frames: int = 10) -> List[Tuple[str, int]]:
         """Generar múltiples pHashes desde un video"""
         try:
+            import cv2
             if not IMAGEHASH_AVAILABLE: self.log("❌ imagehash no disponible", "ERROR"); return []
             cap = cv2.VideoCapture(str(video_path))
             if not cap.isOpened(): self.log(f"❌ No se pudo abrir video: {video_path}", "ERROR"); return []
@@ -364,12 +391,13 @@ class ReferenceDatabaseBuilder:
             self.log(f"✅ {title}: {hashes_generated} hashes de imágenes generados"); return True
         except Exception as e: self.log(f"❌ Error procesando imágenes de {title}: {e}", "ERROR"); return False
     
-    def process_content_video(self, tmdb_id: int, content_type: str, title: str, year: int, youtube_manager):
-        """Procesar hashes desde video (trailer)"""
+    def process_content_video(self, tmdb_id: int, content_type: str, title: str, year: int, youtube_manager, trailer_path: Optional[Path] = None):
+        """Procesar hashes desde video (trailer); trailer_path permite pasar un trailer ya descargado"""
         try:
             if self.is_content_processed(tmdb_id, 'video'): self.log(f"⏭️ {title}: Video ya procesado", "INFO"); return True
             self.log(f"🎬 Procesando video: {title} ({year})")
-            trailer_path = youtube_manager.download_trailer_for_content(tmdb_id=str(tmdb_id), content_type=content_type, output_dir=self.videos_cache, title=title)
+            if trailer_path is None:
+                trailer_path = youtube_manager.download_trailer_for_content(tmdb_id=str(tmdb_id), content_type=content_type, output_dir=self.videos_cache, title=title)
             if not trailer_path or not trailer_path.exists(): self.log(f"⚠️ No se pudo descargar trailer para: {title}", "WARNING"); return False
             
             visual_hashes = self.generate_phash_from_video(trailer_path, num_frames=15)
@@ -399,6 +427,11 @@ class ReferenceDatabaseBuilder:
         except Exception as e:
             self.log(f"❌ Error procesando audio de {title}: {e}", "ERROR"); return False
     
+    def _wait_while_paused(self) -> bool:
+        """Esperar mientras esté en pausa; devuelve False si se pidió detener el proceso"""
+        while self.paused and not self.should_stop: time.sleep(1)
+        return not self.should_stop
+    
     def pause_processing(self): self.paused = True; logging.info("⏸️ Procesamiento pausado")
     def resume_processing(self): self.paused = False; logging.info("▶️ Procesamiento reanudado")
     def stop_processing(self): self.should_stop = True; self.paused = False; logging.info("⏹️ Procesamiento detenido")
@@ -418,6 +451,8 @@ class ReferenceDatabaseBuilder:
             
             api_key = self.config.get('tmdb_api_key')
             if not api_key: self.log("❌ API Key de TMDb no configurada", "ERROR"); return
+            # Los modos con trailers necesitan yt-dlp: mejor abortar ahora que fallar en cada título
+            if mode in ['video', 'both'] and not youtube_manager.preflight(): return
             
             self.log(f"🚀 Iniciando construcción de base de datos (modo: {mode})")
             self.log(f"📊 Objetivo MÁXIMO: {max_items} ítems de TMDb (incluye ya procesados)")
@@ -433,11 +468,22 @@ class ReferenceDatabaseBuilder:
                     url = f"{self.tmdb_base_url}/movie/popular"
                     params = { 'api_key': api_key, 'language': 'es-ES', 'page': page }
                     
-                    response = requests.get(url, params=params, timeout=15); response.raise_for_status()
+                    response = self.session.get(url, params=params, timeout=15); response.raise_for_status()
                     data = response.json(); movies = data.get('results', [])
                     
                     if not movies: break
                     
+                    # Trailers de la página descargados en paralelo antes de hashearlos uno a uno
+                    prefetched_trailers = {}
+                    if mode in ['video', 'both']:
+                        pending = [{'tmdb_id': movie.get('id'), 'type': 'movie', 'title': movie.get('title', 'Unknown')}
+                                   for movie in movies[:max_items - processed_count]
+                                   if not self.is_content_processed(movie.get('id'), 'video')]
+                        if pending:
+                            self.log(f"⬇️ Descargando {len(pending)} trailers en paralelo...")
+                            prefetched_trailers = youtube_manager.download_trailers_batch(pending, self.videos_cache,
+                                                                                          should_continue=self._wait_while_paused)
+                    
                     for movie in movies:
                         try:
                             if processed_count >= max_items or self.should_stop: break
@@ -461,7 +507,12 @@ class ReferenceDatabaseBuilder:
                                 stats['skipped'] += 1
 
                             if mode in ['video', 'both'] and not video_done and not self.should_stop:
-                                processed_item_success = self.process_content_video(tmdb_id, 'movie', title, year, youtube_manager) or processed_item_success
+                                if str(tmdb_id) in prefetched_trailers and prefetched_trailers[str(tmdb_id)] is None:
+                                    # La descarga en lote ya falló: no se reintenta en serie
+                                    self.log(f"⚠️ No se pudo descargar trailer para: {title}", "WARNING")
+                                else:
+                                    processed_item_success = self.process_content_video(tmdb_id, 'movie', title, year, youtube_manager,
+                                                                                        trailer_path=prefetched_trailers.get(str(tmdb_id))) or processed_item_success
                             elif video_done and mode in ['video', 'both']:
                                 self.log(f"⏭️ {title}: Video/Audio ya hasheado, saltando.")
                                 stats['skipped'] += 1
@@ -475,7 +526,7 @@ class ReferenceDatabaseBuilder:
                             self.log(f"❌ Error procesando {movie.get('title', 'Unknown')}: {e}", "ERROR")
                             stats['errors'] += 1; processed_count += 1
                 
-                    page += 1; time.sleep(0.5) # Rate limiting entre páginas
+                    page += 1  # Los 429 los reintenta el adaptador de la sesión
                 
                 except Exception as e:
                     self.log(f"❌ Error obteniendo página {page}: {e}", "ERROR"); page += 1
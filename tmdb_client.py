@@ -3,36 +3,268 @@ Cliente para interactuar con The Movie Database (TMDB) API
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
+import json
+import socket
+import sqlite3
+import hashlib
 import logging
-from typing import Dict, Optional
+import threading
+from collections import deque, OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from functools import lru_cache
+from email.utils import parsedate_to_datetime
+
+try:
+    from rapidfuzz import fuzz, process
+    RAPIDFUZZ_AVAILABLE = True
+except ImportError:
+    RAPIDFUZZ_AVAILABLE = False
+    logging.warning("rapidfuzz no está instalado; se usará similitud por palabras. Instálalo con: pip install rapidfuzz")
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    logging.warning("orjson no está instalado; se usará el módulo json estándar. Instálalo con: pip install orjson")
+
+# Vigencia de las búsquedas cacheadas en disco (segundos)
+TMDB_CACHE_TTL = 30 * 24 * 3600
+
+# Búsquedas decodificadas que se mantienen en memoria delante de la cache en disco
+TMDB_MEMORY_CACHE_SIZE = 4096
+
+# Escrituras pendientes antes de confirmar la transacción de la cache
+TMDB_CACHE_COMMIT_EVERY = 50
+
+# Límite de peticiones de TMDB: máximo de peticiones por ventana de segundos
+TMDB_RATE_LIMIT = 40
+TMDB_RATE_WINDOW = 10.0
+
+# Hosts de TMDB que se resuelven por adelantado al arrancar
+TMDB_HOSTS = ("api.themoviedb.org", "image.tmdb.org")
+
+# Tras un 429 el límite se reduce a la mitad durante este tiempo y luego se recupera poco a poco
+TMDB_THROTTLE_SECONDS = 30.0
+
+def json_loads(data):
+    """Decodificar JSON (str o bytes) con orjson si está disponible"""
+    return orjson.loads(data) if ORJSON_AVAILABLE else json.loads(data)
+
+def json_dumps(obj) -> str:
+    """Codificar JSON compacto con orjson si está disponible"""
+    return orjson.dumps(obj).decode('utf-8') if ORJSON_AVAILABLE else json.dumps(obj)
+
+def _parse_retry_after(value: Optional[str]) -> float:
+    """Segundos indicados por la cabecera Retry-After (entero o fecha HTTP)"""
+    if not value:
+        return 0.0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return 0.0
+
+class ThrottleAwareRetry(Retry):
+    """Retry que avisa al cliente cuando el servidor responde 429"""
+    on_throttle = None
+    
+    def new(self, **kw):
+        retry = super().new(**kw)
+        retry.on_throttle = self.on_throttle
+        return retry
+    
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        if response is not None and response.status == 429 and self.on_throttle:
+            self.on_throttle(response.headers.get('Retry-After'))
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+@lru_cache(maxsize=8192)
+def _title_similarity(title1: str, title2: str) -> float:
+    """Similitud entre títulos (memoizada; argumentos en orden canónico)"""
+    title1 = title1.lower().strip()
+    title2 = title2.lower().strip()
+    
+    # Similitud exacta
+    if title1 == title2:
+        return 1.0
+    
+    # Token set ratio: tolera reordenaciones ("Matrix, The") y pequeñas diferencias de caracteres.
+    # Por sí solo da 100 si las palabras de un título están contenidas en el otro ("Batman" frente a
+    # "Batman Begins"); promediado con token sort ratio, el título exacto queda por delante del más largo
+    if RAPIDFUZZ_AVAILABLE:
+        return (fuzz.token_set_ratio(title1, title2) + fuzz.token_sort_ratio(title1, title2)) / 200.0
+    
+    # Similitud de palabras
+    words1 = set(title1.split())
+    words2 = set(title2.split())
+    
+    if not words1 or not words2:
+        return 0.0
+    
+    intersection = words1.intersection(words2)
+    union = words1.union(words2)
+    
+    return len(intersection) / len(union)
 
 class TMDBClient:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, cache_path: str = "cache/tmdb.db"):
         self.api_key = api_key
         self.base_url = "https://api.themoviedb.org/3"
+        
+        # Sesión compartida (API e imágenes): conexiones persistentes y reintentos ante 429/5xx
         self.session = requests.Session()
+        retries = ThrottleAwareRetry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+        retries.on_throttle = self._on_throttle
+        self.session.mount('https://', HTTPAdapter(pool_connections=20, pool_maxsize=50, max_retries=retries))
         
-    def calculate_title_similarity(self, title1: str, title2: str) -> float:
-        """Calcular similitud entre títulos"""
-        title1 = title1.lower().strip()
-        title2 = title2.lower().strip()
+        # Marcas de tiempo de las últimas peticiones, compartidas entre hilos
+        self._rate_lock = threading.Lock()
+        self._request_times = deque()
+        # Límite adaptativo: se reduce ante 429 y se recupera gradualmente
+        self._rate_limit = TMDB_RATE_LIMIT
+        self._throttle_until = 0.0
+        self._blocked_until = 0.0
         
-        # Similitud exacta
-        if title1 == title2:
-            return 1.0
+        # Cache persistente de búsquedas (una conexión reutilizada entre llamadas)
+        self._cache_lock = threading.Lock()
+        self._cache_pending = 0
+        # Capa en memoria (LRU) con los resultados ya decodificados de esta sesión
+        self._memory_cache = OrderedDict()
+        self.cache_conn = None
+        try:
+            Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+            self.cache_conn = sqlite3.connect(cache_path, check_same_thread=False)
+            # WAL: las lecturas no esperan a las escrituras; NORMAL evita un fsync por transacción
+            self.cache_conn.execute('PRAGMA journal_mode=WAL')
+            self.cache_conn.execute('PRAGMA synchronous=NORMAL')
+            self.cache_conn.execute('CREATE TABLE IF NOT EXISTS tmdb (key TEXT PRIMARY KEY, payload TEXT, ts INTEGER)')
+            self.cache_conn.commit()
+        except sqlite3.Error as e:
+            logging.warning(f"Cache de TMDB no disponible: {e}")
+            self.cache_conn = None
+    
+    def prewarm_dns(self):
+        """Resolver los hosts de TMDB en segundo plano para que la primera conexión no espere al DNS"""
+        def resolve():
+            for host in TMDB_HOSTS:
+                try:
+                    socket.getaddrinfo(host, 443, type=socket.SOCK_STREAM)
+                except OSError as e:
+                    logging.debug(f"No se pudo resolver {host}: {e}")
+        threading.Thread(target=resolve, daemon=True).start()
+    
+    def _on_throttle(self, retry_after: Optional[str]):
+        """Reaccionar a un 429: pausar según Retry-After y reducir el límite a la mitad"""
+        now = time.monotonic()
+        self._blocked_until = max(self._blocked_until, now + _parse_retry_after(retry_after))
+        self._rate_limit = max(1, self._rate_limit // 2)
+        self._throttle_until = now + TMDB_THROTTLE_SECONDS
+        logging.warning(f"TMDB respondió 429; límite reducido a {self._rate_limit} peticiones/{TMDB_RATE_WINDOW:.0f}s")
+    
+    def wait_rate_limit(self):
+        """Esperar hasta poder hacer otra petición sin superar el límite de TMDB"""
+        with self._rate_lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    time.sleep(self._blocked_until - now)
+                    continue
+                # Recuperar una petición por ventana una vez pasado el periodo de reducción
+                if self._rate_limit < TMDB_RATE_LIMIT and now >= self._throttle_until:
+                    self._rate_limit += 1
+                    self._throttle_until = now + TMDB_RATE_WINDOW
+                while self._request_times and now - self._request_times[0] >= TMDB_RATE_WINDOW:
+                    self._request_times.popleft()
+                if len(self._request_times) < self._rate_limit:
+                    self._request_times.append(now)
+                    return
+                time.sleep(TMDB_RATE_WINDOW - (now - self._request_times[0]))
+    
+    def _cached_search(self, endpoint: str, params: Dict) -> Dict:
+        """Búsqueda en TMDB consultando antes la cache en disco"""
+        key_source = f"{endpoint}|{params.get('query', '')}|{params.get('year', '')}|{params.get('language', '')}"
+        key = hashlib.sha1(key_source.encode('utf-8')).hexdigest()
+        
+        with self._cache_lock:
+            entry = self._memory_cache.get(key)
+            if entry is not None:
+                if time.time() - entry[1] < TMDB_CACHE_TTL:
+                    self._memory_cache.move_to_end(key)
+                    return entry[0]
+                del self._memory_cache[key]
+        
+        if self.cache_conn is not None:
+            with self._cache_lock:
+                row = self.cache_conn.execute('SELECT payload, ts FROM tmdb WHERE key = ?', (key,)).fetchone()
+            if row and time.time() - row[1] < TMDB_CACHE_TTL:
+                logging.debug(f"Búsqueda TMDB desde cache: {key_source}")
+                data = json_loads(row[0])
+                self._remember(key, data, row[1])
+                return data
         
-        # Similitud de palabras
-        words1 = set(title1.split())
-        words2 = set(title2.split())
+        self.wait_rate_limit()
+        response = self.session.get(f"{self.base_url}{endpoint}", params=params, timeout=10)
+        response.raise_for_status()
+        data = json_loads(response.content)
+        self._remember(key, data, int(time.time()))
         
-        if not words1 or not words2:
-            return 0.0
+        if self.cache_conn is not None:
+            with self._cache_lock:
+                self.cache_conn.execute('INSERT OR REPLACE INTO tmdb (key, payload, ts) VALUES (?, ?, ?)',
+                                        (key, json_dumps(data), int(time.time())))
+                self._cache_pending += 1
+                if self._cache_pending >= TMDB_CACHE_COMMIT_EVERY:
+                    self.cache_conn.commit()
+                    self._cache_pending = 0
         
-        intersection = words1.intersection(words2)
-        union = words1.union(words2)
+        return data
+    
+    def _remember(self, key: str, data: Dict, ts: int):
+        """Guardar una búsqueda en la cache en memoria, descartando la menos usada si está llena"""
+        with self._cache_lock:
+            self._memory_cache[key] = (data, ts)
+            self._memory_cache.move_to_end(key)
+            if len(self._memory_cache) > TMDB_MEMORY_CACHE_SIZE:
+                self._memory_cache.popitem(last=False)
+    
+    def flush_cache(self):
+        """Confirmar en disco las búsquedas cacheadas pendientes"""
+        if self.cache_conn is None:
+            return
+        with self._cache_lock:
+            if self._cache_pending:
+                self.cache_conn.commit()
+                self._cache_pending = 0
         
-        return len(intersection) / len(union)
+    def calculate_title_similarity(self, title1: str, title2: str) -> float:
+        """Calcular similitud entre títulos"""
+        # La similitud es simétrica: (a, b) y (b, a) comparten entrada en la cache
+        if title2 < title1:
+            title1, title2 = title2, title1
+        return _title_similarity(title1, title2)
+    
+    def score_candidates(self, title: str, candidates: List[Tuple[str, str]]) -> List[float]:
+        """Mejor similitud del título con cada candidato (título, título original) en una sola pasada"""
+        if not candidates:
+            return []
+        if RAPIDFUZZ_AVAILABLE and title.strip():
+            # Una única matriz de puntuaciones para todos los títulos de los candidatos
+            choices = [candidate for pair in candidates for candidate in pair]
+            # Misma puntuación que _title_similarity: media de token set y token sort
+            scores = (process.cdist([title], choices, scorer=fuzz.token_set_ratio, processor=str.lower)[0]
+                      + process.cdist([title], choices, scorer=fuzz.token_sort_ratio, processor=str.lower)[0])
+            return [float(max(scores[2 * i], scores[2 * i + 1])) / 200.0 for i in range(len(candidates))]
+        return [max(self.calculate_title_similarity(title, result_title),
+                    self.calculate_title_similarity(title, original_title))
+                for result_title, original_title in candidates]
     
     def search_movie(self, title: str, year: Optional[str] = None, min_score: float = 0.8) -> Optional[Dict]:
         """Buscar película en TMDB"""
@@ -53,10 +285,7 @@ class TMDBClient:
             
             logging.info(f"Buscando película en TMDB: '{title}' (año: {year})")
             
-            response = self.session.get(f"{self.base_url}{endpoint}", params=params, timeout=10)
-            response.raise_for_status()
-            
-            data = response.json()
+            data = self._cached_search(endpoint, params)
             
             if not data.get('results'):
                 logging.warning(f"No se encontraron resultados en TMDB para: {title}")
@@ -66,18 +295,13 @@ class TMDBClient:
             best_match = None
             best_score = 0
             
-            for result in data['results'][:5]:  # Revisar los primeros 5 resultados
-                result_title = result.get('title', '')
-                result_original_title = result.get('original_title', '')
+            results = data['results'][:5]  # Revisar los primeros 5 resultados
+            similarities = self.score_candidates(
+                title, [(result.get('title', ''), result.get('original_title', '')) for result in results])
+            
+            for result, similarity in zip(results, similarities):
                 result_year = result.get('release_date', '')[:4] if result.get('release_date') else ''
                 
-                # Calcular similitud con el título
-                title_similarity = self.calculate_title_similarity(title, result_title)
-                original_title_similarity = self.calculate_title_similarity(title, result_original_title)
-                
-                # Usar la mejor similitud
-                similarity = max(title_similarity, original_title_similarity)
-                
                 # Bonus si el año coincide
                 if year and result_year and year == result_year:
                     similarity += 0.2
@@ -127,10 +351,7 @@ class TMDBClient:
             
             logging.info(f"Buscando serie en TMDB: '{title}'")
             
-            response = self.session.get(f"{self.base_url}{endpoint}", params=params, timeout=10)
-            response.raise_for_status()
-            
-            data = response.json()
+            data = self._cached_search(endpoint, params)
             
             if not data.get('results'):
                 logging.warning(f"No se encontraron resultados en TMDB para: {title}")
@@ -140,17 +361,11 @@ class TMDBClient:
             best_match = None
             best_score = 0
             
-            for result in data['results'][:5]:
-                result_title = result.get('name', '')
-                result_original_title = result.get('original_name', '')
-                
-                # Calcular similitud con el título
-                title_similarity = self.calculate_title_similarity(title, result_title)
-                original_title_similarity = self.calculate_title_similarity(title, result_original_title)
-                
-                # Usar la mejor similitud
-                similarity = max(title_similarity, original_title_similarity)
-                
+            results = data['results'][:5]
+            similarities = self.score_candidates(
+                title, [(result.get('name', ''), result.get('original_name', '')) for result in results])
+            
+            for result, similarity in zip(results, similarities):
                 if similarity > best_score:
                     best_score = similarity
                     best_match = result
@@ -191,10 +406,11 @@ class TMDBClient:
                 'query': 'Toy Story'
             }
             
+            self.wait_rate_limit()
             response = self.session.get(f"{self.base_url}/search/movie", params=params, timeout=10)
             response.raise_for_status()
             
-            data = response.json()
+            data = json_loads(response.content)
             return bool(data.get('results'))
         
         except Exception as e:
@@ -215,10 +431,11 @@ class TMDBClient:
                     'page': page
                 }
                 
+                self.wait_rate_limit()
                 response = self.session.get(f"{self.base_url}/person/popular", params=params, timeout=10)
                 response.raise_for_status()
                 
-                data = response.json()
+                data = json_loads(response.content)
                 for person in data.get('results', []):
                     if person.get('profile_path'):  # Solo actores con foto
                         popular_actors.append({
@@ -227,8 +444,6 @@ class TMDBClient:
                             'profile_path': person['profile_path'],
                             'known_for': [item.get('title', item.get('name', '')) for item in person.get('known_for', [])]
                         })
-                
-                time.sleep(0.3)  # Evitar rate limiting
         
         except Exception as e:
             logging.error(f"Error obteniendo actores populares: {e}")
@@ -242,10 +457,11 @@ class TMDBClient:
         
         try:
             params = {'api_key': self.api_key}
+            self.wait_rate_limit()
             response = self.session.get(f"{self.base_url}/person/{person_id}/images", params=params, timeout=10)
             response.raise_for_status()
             
-            data = response.json()
+            data = json_loads(response.content)
             return data.get('profiles', [])
         
         except Exception as e:
@@ -263,10 +479,11 @@ class TMDBClient:
                 'query': name
             }
             
+            self.wait_rate_limit()
             response = self.session.get(f"{self.base_url}/search/person", params=params, timeout=10)
             response.raise_for_status()
             
-            data = response.json()
+            data = json_loads(response.content)
             if data.get('results'):
                 return data['results'][0]
             
@@ -3,33 +3,319 @@ Analizador de videos con IA para VideoSort Pro - VERSION CON DEBUG DETALLADO
 Incluye reconocimiento facial, OCR y análisis de contenido
 """
 
-import cv2
+# cv2, pytesseract y face_recognition se importan en los métodos que los usan (arranque más rápido)
 import numpy as np
-import pytesseract
-import face_recognition
 import re
+import os
 import json
+import threading
+import sqlite3
+import hashlib
+import heapq
+import shutil
+import subprocess
 from pathlib import Path
 import logging
 from typing import Dict, List, Optional, Tuple
+from functools import lru_cache
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Resultados de OCR cacheados por hash perceptual del fotograma (intros y logos repetidos)
+OCR_CACHE_SIZE = 2048
+# Lado de la rejilla del dHash: 16 -> 256 bits, distingue rótulos distintos sobre el mismo fondo
+OCR_HASH_SIZE = 16
+
+# Hilos para OCR en paralelo (tesseract corre en un subproceso, no retiene el GIL)
+OCR_WORKERS = min(8, os.cpu_count() or 1)
+# Pool de OCR único para todo el proceso: los hilos de FileOrganizer que analizan videos a la vez
+# lo comparten, así nunca hay más de OCR_WORKERS tesseract en marcha
+_OCR_EXECUTOR = ThreadPoolExecutor(max_workers=OCR_WORKERS, thread_name_prefix='ocr')
+# Con varios tesseract a la vez, cada uno en un solo hilo OpenMP: sin esto cada proceso lanza
+# un hilo por núcleo y compiten entre sí. Solo en el entorno de tesseract: en el del proceso
+# también limitaría a un hilo a torch/Whisper
+_TESSERACT_ENV = {'OMP_THREAD_LIMIT': '1', **os.environ}
+
+# Distancia máxima (en fotogramas) para avanzar con grab() en lugar de buscar con set()
+SEQUENTIAL_GRAB_MAX_STEP = 90
+
+# Distancia de Hamming máxima entre aHash de 64 bits para considerar dos fotogramas duplicados
+DUPLICATE_FRAME_MAX_DISTANCE = 5
+
+# Desviación típica mínima de la miniatura para hacer OCR sin realzar el contraste
+OCR_MIN_CONTRAST_STD = 40
+# Densidad mínima de bordes Canny (media de la imagen de bordes, 0-255) para intentar OCR;
+# por debajo el fotograma no tiene la estructura de alto contraste de un rótulo
+OCR_MIN_EDGE_DENSITY = 5.0
+# Motor LSTM de Tesseract y segmentación como bloque de texto uniforme
+OCR_TESSERACT_CONFIG = '--oem 1 --psm 6'
+
+# Lado mayor máximo de los fotogramas analizados (OCR y caras escalan con el número de píxeles)
+ANALYSIS_MAX_SIDE = 1280
+
+# ffmpeg, si está instalado, lee fotogramas lejanos decodificando solo el fotograma clave más cercano
+FFMPEG_PATH = shutil.which('ffmpeg')
+# Tiempo máximo para extraer un fotograma clave con ffmpeg (segundos)
+FFMPEG_KEYFRAME_TIMEOUT = 30
+
+# Resultados de extract_video_info memoizados por (nombre, ruta)
+VIDEO_INFO_CACHE_SIZE = 50000
+
+# Cache en disco de los análisis visuales, por ruta, fecha de modificación, tamaño y base de actores
+VISUAL_ANALYSIS_CACHE_PATH = "cache/visual_analysis.db"
+# Opciones de configuración que cambian el resultado del análisis visual (parte de la clave de la cache)
+VISUAL_ANALYSIS_CONFIG_KEYS = ('capture_frames', 'min_confidence', 'detect_actors', 'face_detection_model')
+
+# Escala a la que se buscan caras con HOG (con el sobremuestreo por defecto, caras de ~80 px o más)
+FACE_DETECTION_SCALE = 0.5
+
+# Fotogramas por lote para la detección de caras con el modelo CNN (reducir si la GPU se queda sin memoria)
+FACE_BATCH_SIZE = 32
+
+# Patrones precompilados para el análisis de nombres de archivo
+_YEAR_RE = re.compile(r'\b(19|20)\d{2}\b')
+
+# Etiquetas de calidad/codec/fuente y texto entre corchetes o llaves, en una sola alternancia
+_CLEAN_COMBINED_RE = re.compile('|'.join((
+    r'\b(?:1080p|720p|480p|2160p|4K|HDRip|BRRip|DVDRip|WEBRip|HDTV)\b',
+    r'\b(?:x264|x265|h264|h265|HEVC|AVC)\b',
+    r'\b(?:BluRay|Blu-ray|DVD|WEB-DL|WEBRip)\b',
+    r'\b(?:PROPER|REPACK|EXTENDED|UNCUT|DC|DIRECTORS?\.CUT)\b',
+    r'\[.*?\]',  # Texto entre corchetes
+    r'\{.*?\}',  # Texto entre llaves
+)), re.IGNORECASE)
+
+# Información de episodios: se elimina para obtener solo el nombre de la serie/película
+# (en orden; cada patrón corta hasta el final sobre el resultado del anterior)
+_EPISODE_PATTERNS = [re.compile(p, re.IGNORECASE) for p in (
+    r'\s*[Ss]\d{1,2}\s*[Ee]\d{1,2}.*$',  # S01E01 y todo lo que sigue
+    r'\s*\d{1,2}x\d{1,2}.*$',            # 1x01 y todo lo que sigue
+    r'\s*[Ss]eason\s*\d+.*$',            # Season 1 y todo lo que sigue
+    r'\s*[Tt]emporada\s*\d+.*$',         # Temporada 1 y todo lo que sigue
+)]
+
+_NON_YEAR_PARENS_RE = re.compile(r'\([^0-9]*\)')
+_SEPARATORS_RE = re.compile(r'[\.\-_]')
+_SPACES_RE = re.compile(r'\s+')
+
+_PROBLEMATIC_PATTERNS = [re.compile(p) for p in (
+    r'^[a-z]?\d+$',                    # Solo números o letra+números: f13796081992
+    r'^[a-z]\d{8,}$',                  # Letra seguida de muchos números
+    r'^tmp',                           # Archivos temporales
+    r'^temp',                          # Archivos temporales
+    r'^\d{8,}',                        # Solo números largos
+    r'^[a-z]{1,2}\d{6,}$',            # 1-2 letras + 6+ números
+    r'^sample',                        # Archivos de muestra
+    r'^test',                          # Archivos de prueba
+)]
+
+_EXTRA_PATTERNS = [re.compile(p) for p in (
+    r'featurette',
+    r'behind.the.scene',
+    r'making.of',
+    r'documentary',
+    r'interview',
+    r'trailer',
+    r'teaser',
+    r'promo',
+    r'extras?',
+    r'special.feature',
+    r'deleted.scene',
+    r'gag.reel',
+    r'bloopers?',
+    r'commentary',
+    r'making.off',
+    r'detras.de.escena',
+    r'entrevista',
+    r'documental',
+)]
+
+# Carpetas que indican serie en la ruta
+_PATH_SERIES_PATTERNS = [re.compile(p, re.IGNORECASE) for p in (
+    r'(.+?)\s*\(?(\d{4})\)?\s*Season\s*\d+',  # "Serie (2020) Season 1"
+    r'(.+?)\s*[Ss]\d{2}',                      # "Serie S01"
+    r'(.+?)\s*Season\s*\d+',                   # "Serie Season 1"
+    r'(.+?)\s*Temporada\s*\d+',               # "Serie Temporada 1"
+)]
+
+# Detección de serie frente a película (una sola alternación, un único recorrido)
+_SERIES_DETECT_RE = re.compile('|'.join((
+    r'[Ss]\d{1,2}\s*[Ee]\d{1,2}',  # S01 E01, S01E01
+    r'\d{1,2}x\d{1,2}',            # 1x01
+    r'[Tt]emporada\s*\d+',         # Temporada 1
+    r'[Ee]pisode\s*\d+',           # Episode 1
+    r'[Ss]eason\s*\d+',            # Season 1
+)), re.IGNORECASE)
+
+# Nombre de serie, temporada y episodio
+_SERIES_INFO_PATTERNS = [re.compile(p, re.IGNORECASE) for p in (
+    # Formato S01E01, S01 E01
+    r'(.+?)\s*[Ss](\d{1,2})\s*[Ee](\d{1,2})',
+    # Formato 1x01
+    r'(.+?)\s*(\d{1,2})x(\d{1,2})',
+    # Formato Temporada X Capitulo Y
+    r'(.+?)\s*[Tt]emporada\s*(\d+).*?[Cc]apitulo\s*(\d+)',
+    # Formato Season X Episode Y
+    r'(.+?)\s*[Ss]eason\s*(\d+).*?[Ee]pisode\s*(\d+)',
+)]
+
+# Posibles títulos en el texto OCR (todos con el título en el grupo 1)
+_TITLE_PATTERNS = [re.compile(p) for p in (
+    r'\b([A-Z][a-z]+(?: [A-Z][a-z]+){1,3})\b',  # Títulos en formato título (2-4 palabras)
+    r'\b([A-Z]{3,}(?: [A-Z]{3,})*)\b',          # Títulos en mayúsculas
+    r'"([^"]{5,30})"',                           # Texto entre comillas
+    r"'([^']{5,30})'",                           # Texto entre comillas simples
+)]
+
+# Palabras de créditos que no son títulos
+_TITLE_STOPWORDS = frozenset(('presents', 'production', 'entertainment', 'pictures'))
+
+# Limpieza del texto OCR y patrones de título para la sugerencia de búsqueda
+_NON_WORD_RE = re.compile(r'[^\w\s]')
+_SUGGESTION_PATTERNS = [re.compile(p) for p in (
+    r'\b([A-Z][a-z]+ [A-Z][a-z]+(?:\s[A-Z][a-z]+)?)\b',  # Título en formato título
+    r'\b([A-Z]{2,}(?:\s[A-Z]{2,})*)\b',                  # Títulos en mayúsculas
+)]
+
+# Palabras comunes que no aportan a la sugerencia de búsqueda
+_SUGGESTION_STOP_WORDS = frozenset((
+    'the', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by',
+    'a', 'an', 'el', 'la', 'los', 'las', 'un', 'una', 'y', 'o', 'pero', 'en',
+    'con', 'por', 'para', 'de', 'del', 'al', 'movie', 'film', 'película',
+    'presents', 'production', 'productions', 'entertainment', 'pictures',
+    'studios', 'studio', 'films', 'cinema'
+))
+
+@lru_cache(maxsize=4096)
+def _clean_filename_for_search(filename: str) -> Tuple[str, Optional[str]]:
+    """Limpiar nombre de archivo para búsqueda (memoizado por nombre)"""
+    logging.debug(f"Limpiando filename: {filename}")
+    
+    # Remover extensión
+    name = Path(filename).stem
+    logging.debug(f"  Sin extensión: {name}")
+    
+    # Primero extraer año si existe y quitarlo del nombre durante la limpieza
+    year_match = _YEAR_RE.search(name)
+    year = year_match.group(0) if year_match else None
+    if year:
+        name = name[:year_match.start()] + ' ' + name[year_match.end():]
+        logging.debug(f"  Año detectado: {year}")
+    
+    # Aplicar limpieza básica (una sola pasada)
+    name = _CLEAN_COMBINED_RE.sub(' ', name)
+    logging.debug(f"  Tras limpieza de etiquetas: {name}")
+    
+    # Remover información de episodios para obtener solo el nombre de la serie/película
+    for pattern in _EPISODE_PATTERNS:
+        old_name = name
+        name = pattern.sub('', name)
+        if old_name != name:
+            logging.debug(f"  Removido episodio {pattern.pattern}: {name}")
+    
+    # Remover paréntesis vacíos o con contenido no relevante (incluye los que contenían el año)
+    name = _NON_YEAR_PARENS_RE.sub('', name)  # Remover paréntesis que no contengan años
+    
+    # Restaurar año si se encontró
+    if year:
+        name = f"{name} {year}"
+        logging.debug(f"  Con año restaurado: {name}")
+    
+    # Limpieza final
+    name = _SEPARATORS_RE.sub(' ', name)  # Convertir puntos, guiones a espacios
+    name = _SPACES_RE.sub(' ', name).strip()  # Múltiples espacios a uno solo
+    
+    # Verificar que no esté vacío después de la limpieza
+    if not name or len(name.strip()) < 2:
+        logging.debug(f"  Nombre vacío después de limpieza, usando original")
+        # Si la limpieza dejó el nombre vacío, usar el original sin extensión
+        name = Path(filename).stem
+        name = _SEPARATORS_RE.sub(' ', name)
+        name = _SPACES_RE.sub(' ', name).strip()
+    
+    logging.debug(f"  Resultado final: '{name}', año: {year}")
+    return name, year
 
 class VideoAnalyzer:
     def __init__(self, config):
         self.config = config
+        self.actor_encodings = np.empty((0, 128), dtype=np.float32)
+        self.actor_sq_norms = np.empty(0, dtype=np.float32)
+        self.actor_names: List[str] = []
         self.actors_db = self.load_actors_database()
+        self.ocr_cache = OrderedDict()
+        self._ocr_cache_lock = threading.Lock()
+        self._extract_video_info_cached = lru_cache(maxsize=VIDEO_INFO_CACHE_SIZE)(self._extract_video_info)
+        
+        # Análisis visuales ya hechos (el archivo se vuelve a analizar solo si cambia)
+        self._analysis_cache_lock = threading.Lock()
+        self.analysis_cache_conn = None
+        try:
+            Path(VISUAL_ANALYSIS_CACHE_PATH).parent.mkdir(parents=True, exist_ok=True)
+            self.analysis_cache_conn = sqlite3.connect(VISUAL_ANALYSIS_CACHE_PATH, check_same_thread=False)
+            # Un commit por análisis: con WAL y NORMAL cada uno no fuerza un fsync completo
+            self.analysis_cache_conn.execute('PRAGMA journal_mode=WAL')
+            self.analysis_cache_conn.execute('PRAGMA synchronous=NORMAL')
+            self.analysis_cache_conn.execute('CREATE TABLE IF NOT EXISTS visual_analysis (key TEXT PRIMARY KEY, payload TEXT)')
+            self.analysis_cache_conn.commit()
+        except sqlite3.Error as e:
+            logging.warning(f"No se pudo abrir la cache de análisis visual: {e}")
+            self.analysis_cache_conn = None
         
     def load_actors_database(self) -> Dict:
         """Cargar base de datos de actores conocidos"""
+        self.actor_encodings = np.empty((0, 128), dtype=np.float32)
+        self.actor_sq_norms = np.empty(0, dtype=np.float32)
+        self.actor_names = []
+        # Versión de la base cargada (archivo y mtime): forma parte de la clave de la cache de análisis visual
+        self.actors_db_version = ""
         try:
+            # Formato binario: una sola lectura, sin conversión elemento a elemento
+            npz_path = Path("data/actors_db.npz")
+            if npz_path.exists():
+                self.actors_db_version = f"{npz_path.name}:{npz_path.stat().st_mtime_ns}"
+                with np.load(npz_path) as data:
+                    names = data['names'].tolist()
+                    offsets = data['offsets']
+                    encodings = np.ascontiguousarray(data['encodings'], dtype=np.float32)
+                
+                actors_db = {name: encodings[offsets[i]:offsets[i + 1]] for i, name in enumerate(names)}
+                if len(encodings):
+                    self.actor_encodings = encodings
+                    self.actor_sq_norms = np.einsum('ij,ij->i', encodings, encodings)
+                    self.actor_names = np.repeat(np.array(names, dtype=object), np.diff(offsets)).tolist()
+                
+                logging.info(f"Base de datos de actores cargada: {len(actors_db)} actores")
+                return actors_db
+            
+            # Formato anterior en JSON
             actors_db_path = Path("data/actors_db.json")
             if actors_db_path.exists():
-                with open(actors_db_path, 'r', encoding='utf-8') as f:
-                    actors_data = json.load(f)
+                self.actors_db_version = f"{actors_db_path.name}:{actors_db_path.stat().st_mtime_ns}"
+                if ORJSON_AVAILABLE:
+                    actors_data = orjson.loads(actors_db_path.read_bytes())
+                else:
+                    with open(actors_db_path, 'r', encoding='utf-8') as f:
+                        actors_data = json.load(f)
                 
-                # Convertir encodings de lista a numpy arrays
+                # Matriz contigua (N, 128) construida directamente desde las listas; cada actor es una vista
+                names = [actor_name for actor_name, encodings_list in actors_data.items() for _ in encodings_list]
                 actors_db = {}
-                for actor_name, encodings_list in actors_data.items():
-                    actors_db[actor_name] = [np.array(encoding) for encoding in encodings_list]
+                if names:
+                    self.actor_encodings = np.array(
+                        [encoding for encodings_list in actors_data.values() for encoding in encodings_list], dtype=np.float32)
+                    self.actor_sq_norms = np.einsum('ij,ij->i', self.actor_encodings, self.actor_encodings)
+                    self.actor_names = names
+                    start = 0
+                    for actor_name, encodings_list in actors_data.items():
+                        actors_db[actor_name] = self.actor_encodings[start:start + len(encodings_list)]
+                        start += len(encodings_list)
                 
                 logging.info(f"Base de datos de actores cargada: {len(actors_db)} actores")
                 return actors_db
@@ -45,22 +331,10 @@ class VideoAnalyzer:
         """Detectar archivos con nombres problemáticos que deberían ir a unknown"""
         name = Path(filename).stem.lower()
         
-        # Patrones problemáticos
-        problematic_patterns = [
-            r'^[a-z]?\d+$',                    # Solo números o letra+números: f13796081992
-            r'^[a-z]\d{8,}$',                  # Letra seguida de muchos números
-            r'^tmp',                           # Archivos temporales
-            r'^temp',                          # Archivos temporales
-            r'^\d{8,}',                        # Solo números largos
-            r'^[a-z]{1,2}\d{6,}$',            # 1-2 letras + 6+ números
-            r'^sample',                        # Archivos de muestra
-            r'^test',                          # Archivos de prueba
-        ]
-        
         # Verificar patrones problemáticos
-        for pattern in problematic_patterns:
-            if re.match(pattern, name):
-                logging.debug(f"Archivo problemático detectado: {filename} (patrón: {pattern})")
+        for pattern in _PROBLEMATIC_PATTERNS:
+            if pattern.match(name):
+                logging.debug(f"Archivo problemático detectado: {filename} (patrón: {pattern.pattern})")
                 return True
         
         # Verificar si el nombre es muy corto (menos de 3 caracteres)
@@ -80,32 +354,10 @@ class VideoAnalyzer:
         """Detectar si el archivo es contenido adicional/extras"""
         name = filename.lower()
         
-        # Patrones de contenido adicional
-        extra_patterns = [
-            r'featurette',
-            r'behind.the.scene',
-            r'making.of',
-            r'documentary',
-            r'interview',
-            r'trailer',
-            r'teaser',
-            r'promo',
-            r'extras?',
-            r'special.feature',
-            r'deleted.scene',
-            r'gag.reel',
-            r'bloopers?',
-            r'commentary',
-            r'making.off',
-            r'detras.de.escena',
-            r'entrevista',
-            r'documental',
-        ]
-        
         # Verificar si contiene palabras clave de extras
-        for pattern in extra_patterns:
-            if re.search(pattern, name):
-                logging.debug(f"Contenido extra detectado: {filename} (patrón: {pattern})")
+        for pattern in _EXTRA_PATTERNS:
+            if pattern.search(name):
+                logging.debug(f"Contenido extra detectado: {filename} (patrón: {pattern.pattern})")
                 return True
         
         # Verificar rutas que indican extras
@@ -134,16 +386,8 @@ class VideoAnalyzer:
         # Buscar en las partes de la ruta información de serie
         for i, part in enumerate(path_parts):
             logging.debug(f"  Parte {i}: {part}")
-            # Patrones que indican carpeta de serie
-            series_patterns = [
-                r'(.+?)\s*\(?(\d{4})\)?\s*Season\s*\d+',  # "Serie (2020) Season 1"
-                r'(.+?)\s*[Ss]\d{2}',                      # "Serie S01"
-                r'(.+?)\s*Season\s*\d+',                   # "Serie Season 1"
-                r'(.+?)\s*Temporada\s*\d+',               # "Serie Temporada 1"
-            ]
-            
-            for pattern in series_patterns:
-                match = re.search(pattern, part, re.IGNORECASE)
+            for pattern in _PATH_SERIES_PATTERNS:
+                match = pattern.search(part)
                 if match:
                     series_name = match.group(1).strip()
                     logging.debug(f"  Serie encontrada en ruta: {series_name}")
@@ -158,73 +402,14 @@ class VideoAnalyzer:
     
     def clean_filename_for_search(self, filename: str) -> Tuple[str, Optional[str]]:
         """Limpiar nombre de archivo para búsqueda mejorada"""
-        logging.debug(f"Limpiando filename: {filename}")
-        
-        # Remover extensión
-        name = Path(filename).stem
-        logging.debug(f"  Sin extensión: {name}")
-        
-        # Remover caracteres especiales y patrones comunes
-        patterns_to_remove = [
-            r'\b(1080p|720p|480p|2160p|4K|HDRip|BRRip|DVDRip|WEBRip|HDTV)\b',
-            r'\b(x264|x265|h264|h265|HEVC|AVC)\b',
-            r'\b(BluRay|Blu-ray|DVD|WEB-DL|WEBRip)\b',
-            r'\b(PROPER|REPACK|EXTENDED|UNCUT|DC|DIRECTORS?\.CUT)\b',
-            r'\[(.*?)\]',  # Texto entre corchetes
-            r'\{(.*?)\}',  # Texto entre llaves
-        ]
-        
-        # Primero extraer año si existe
-        year_match = re.search(r'\b(19|20)\d{2}\b', name)
-        year = year_match.group(0) if year_match else None
-        if year:
-            logging.debug(f"  Año detectado: {year}")
-        
-        # Aplicar limpieza básica
-        for pattern in patterns_to_remove:
-            old_name = name
-            name = re.sub(pattern, ' ', name, flags=re.IGNORECASE)
-            if old_name != name:
-                logging.debug(f"  Aplicado patrón {pattern}: {name}")
-        
-        # Remover información de episodios para obtener solo el nombre de la serie/película
-        episode_patterns = [
-            r'\s*[Ss]\d{1,2}\s*[Ee]\d{1,2}.*$',  # S01E01 y todo lo que sigue
-            r'\s*\d{1,2}x\d{1,2}.*$',            # 1x01 y todo lo que sigue
-            r'\s*[Ss]eason\s*\d+.*$',            # Season 1 y todo lo que sigue
-            r'\s*[Tt]emporada\s*\d+.*$',         # Temporada 1 y todo lo que sigue
-        ]
-        
-        for pattern in episode_patterns:
-            old_name = name
-            name = re.sub(pattern, '', name, flags=re.IGNORECASE)
-            if old_name != name:
-                logging.debug(f"  Removido episodio {pattern}: {name}")
-        
-        # Remover paréntesis vacíos o con contenido no relevante
-        name = re.sub(r'\([^0-9]*\)', '', name)  # Remover paréntesis que no contengan años
-        
-        # Restaurar año si se encontró
-        if year:
-            name = f"{name} {year}"
-            logging.debug(f"  Con año restaurado: {name}")
-        
-        # Limpieza final
-        name = re.sub(r'[\.\-_]', ' ', name)  # Convertir puntos, guiones a espacios
-        name = re.sub(r'\s+', ' ', name).strip()  # Múltiples espacios a uno solo
-        
-        # Verificar que no esté vacío después de la limpieza
-        if not name or len(name.strip()) < 2:
-            logging.debug(f"  Nombre vacío después de limpieza, usando original")
-            # Si la limpieza dejó el nombre vacío, usar el original sin extensión
-            name = Path(filename).stem
-            name = re.sub(r'[\.\-_]', ' ', name)
-            name = re.sub(r'\s+', ' ', name).strip()
-        
-        logging.debug(f"  Resultado final: '{name}', año: {year}")
-        return name, year
+        return _clean_filename_for_search(filename)
     
     def extract_video_info(self, filename: str, filepath: str = None) -> Optional[Dict]:
+        """Extraer información básica del nombre del archivo (memoizado; devuelve una copia modificable)"""
+        video_info = self._extract_video_info_cached(filename, filepath)
+        return dict(video_info) if video_info else None
+    
+    def _extract_video_info(self, filename: str, filepath: str = None) -> Optional[Dict]:
         """Extraer información básica del nombre del archivo"""
         logging.debug(f"Extrayendo info de video: {filename}")
         
@@ -255,15 +440,7 @@ class VideoAnalyzer:
             }
         
         # Detectar si es serie o película
-        series_patterns = [
-            r'[Ss]\d{1,2}\s*[Ee]\d{1,2}',  # S01 E01, S01E01
-            r'\d{1,2}x\d{1,2}',            # 1x01
-            r'[Tt]emporada\s*\d+',         # Temporada 1
-            r'[Ee]pisode\s*\d+',           # Episode 1
-            r'[Ss]eason\s*\d+',            # Season 1
-        ]
-        
-        is_series = any(re.search(pattern, filename, re.IGNORECASE) for pattern in series_patterns)
+        is_series = bool(_SERIES_DETECT_RE.search(filename))
         
         if is_series:
             logging.debug(f"Detectado como serie: {filename}")
@@ -310,19 +487,8 @@ class VideoAnalyzer:
         name = Path(filename).stem
         logging.debug(f"Extrayendo info de serie: {name}")
         
-        patterns = [
-            # Formato S01E01, S01 E01
-            r'(.+?)\s*[Ss](\d{1,2})\s*[Ee](\d{1,2})',
-            # Formato 1x01
-            r'(.+?)\s*(\d{1,2})x(\d{1,2})',
-            # Formato Temporada X Capitulo Y
-            r'(.+?)\s*[Tt]emporada\s*(\d+).*?[Cc]apitulo\s*(\d+)',
-            # Formato Season X Episode Y
-            r'(.+?)\s*[Ss]eason\s*(\d+).*?[Ee]pisode\s*(\d+)',
-        ]
-        
-        for i, pattern in enumerate(patterns):
-            match = re.search(pattern, name, re.IGNORECASE)
+        for i, pattern in enumerate(_SERIES_INFO_PATTERNS):
+            match = pattern.search(name)
             if match:
                 series_name = match.group(1).strip()
                 season = int(match.group(2))
@@ -352,76 +518,119 @@ class VideoAnalyzer:
     
     def detect_actors_in_frame(self, frame: np.ndarray) -> List[str]:
         """Detectar actores en un fotograma"""
-        detected_actors = []
+        return self.detect_actors_in_frames([frame])[0]
+    
+    def detect_actors_in_frames(self, frames: List[np.ndarray]) -> List[List[str]]:
+        """Detectar actores en varios fotogramas; con modelo 'cnn' la detección de caras va por lotes en GPU"""
+        import cv2
+        import face_recognition
+        detected_per_frame = [[] for _ in frames]
         
-        if not self.actors_db:
+        if not self.actors_db or not frames:
             logging.debug("Sin base de datos de actores, saltando reconocimiento facial")
-            return detected_actors
+            return detected_per_frame
         
         try:
-            logging.debug("Iniciando detección de actores en fotograma...")
-            
-            # Convertir BGR a RGB
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            logging.debug(f"Frame convertido a RGB: {rgb_frame.shape}")
-            
-            # Detectar caras
-            face_locations = face_recognition.face_locations(rgb_frame)
-            logging.debug(f"Caras detectadas: {len(face_locations)}")
+            # Convertir BGR a RGB (dlib exige arrays contiguos: una vista frame[:, :, ::-1] no sirve)
+            rgb_frames = [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) for frame in frames]
             
-            if not face_locations:
-                return detected_actors
+            # Detectar caras: por lotes con CNN (GPU) o fotograma a fotograma con HOG
+            if self.config.get('face_detection_model', 'hog') == 'cnn':
+                batch_size = self.config.get('face_batch_size', FACE_BATCH_SIZE)
+                # Un lote por tamaño de fotograma: dlib exige que todas las imágenes de un lote midan lo mismo
+                indices_by_shape = defaultdict(list)
+                for index, rgb_frame in enumerate(rgb_frames):
+                    indices_by_shape[rgb_frame.shape].append(index)
+                all_locations = [None] * len(rgb_frames)
+                for indices in indices_by_shape.values():
+                    locations = face_recognition.batch_face_locations(
+                        [rgb_frames[index] for index in indices], number_of_times_to_upsample=0, batch_size=batch_size)
+                    for index, frame_locations in zip(indices, locations):
+                        all_locations[index] = frame_locations
+            else:
+                # HOG sobre el fotograma a escala reducida (menos píxeles que recorrer) y coordenadas
+                # devueltas a la escala original para calcular los encodings con todo el detalle
+                all_locations = []
+                for rgb_frame in rgb_frames:
+                    small = cv2.resize(rgb_frame, None, fx=FACE_DETECTION_SCALE, fy=FACE_DETECTION_SCALE,
+                                       interpolation=cv2.INTER_AREA)
+                    all_locations.append([
+                        tuple(int(round(v / FACE_DETECTION_SCALE)) for v in location)
+                        for location in face_recognition.face_locations(small, model='hog')
+                    ])
             
-            face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
-            logging.debug(f"Encodings generados: {len(face_encodings)}")
+            tolerance = 1.0 - self.config.get('min_confidence', 0.7)
             
-            for i, face_encoding in enumerate(face_encodings):
-                logging.debug(f"  Procesando cara {i+1}/{len(face_encodings)}")
-                best_match = None
-                best_distance = float('inf')
+            for frame_index, (rgb_frame, face_locations) in enumerate(zip(rgb_frames, all_locations)):
+                logging.debug(f"Caras detectadas en fotograma {frame_index+1}: {len(face_locations)}")
+                if not face_locations:
+                    continue
                 
-                # Comparar con base de datos de actores
-                for actor_name, known_encodings in self.actors_db.items():
-                    for j, known_encoding in enumerate(known_encodings):
-                        distance = face_recognition.face_distance([known_encoding], face_encoding)[0]
-                        
-                        if distance < best_distance:
-                            best_distance = distance
-                            best_match = actor_name
-                            logging.debug(f"    Mejor match hasta ahora: {actor_name} (distancia: {distance:.3f})")
+                face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
+                if not face_encodings or not self.actor_names:
+                    continue
                 
-                # Verificar si la distancia es aceptable
-                tolerance = 1.0 - self.config.get('min_confidence', 0.7)
-                logging.debug(f"  Tolerancia: {tolerance:.3f}, mejor distancia: {best_distance:.3f}")
+                # Distancias al cuadrado de todas las caras contra toda la base de datos (sin sqrt):
+                # |q - e|² = |q|² + |e|² - 2·q·e, con un único producto matricial (|e|² precalculado al cargar)
+                queries = np.asarray(face_encodings, dtype=np.float32)
+                sq_distances = (np.einsum('ij,ij->i', queries, queries)[:, None]
+                                + self.actor_sq_norms[None, :]
+                                - 2.0 * queries @ self.actor_encodings.T)
+                best_indices = sq_distances.argmin(axis=1)
                 
-                if best_match and best_distance < tolerance:
-                    detected_actors.append(best_match)
-                    logging.debug(f"  Actor confirmado: {best_match}")
-                else:
-                    logging.debug(f"  No hay match suficientemente bueno para cara {i+1}")
+                for i, best_index in enumerate(best_indices):
+                    best_sq_distance = max(0.0, float(sq_distances[i, best_index]))
+                    best_match = self.actor_names[int(best_index)]
+                    
+                    logging.debug(f"  Cara {i+1}: mejor match {best_match} (distancia: {best_sq_distance ** 0.5:.3f}, tolerancia: {tolerance:.3f})")
+                    
+                    if best_match and best_sq_distance < tolerance * tolerance:
+                        detected_per_frame[frame_index].append(best_match)
+                        logging.debug(f"  Actor confirmado: {best_match}")
         
         except Exception as e:
             logging.error(f"Error en reconocimiento facial: {e}", exc_info=True)
         
-        logging.debug(f"Actores detectados en total: {detected_actors}")
-        return detected_actors
+        return detected_per_frame
     
     def extract_text_from_frame(self, frame: np.ndarray) -> str:
         """Extraer texto de un fotograma usando OCR"""
+        import cv2
+        import pytesseract
         try:
             logging.debug("Iniciando extracción de texto con OCR...")
             
-            # Convertir a escala de grises para mejor OCR
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            # Escala de grises: el canal verde se aproxima a la luminancia sin el cálculo de cvtColor
+            gray = cv2.extractChannel(frame, 1)
             logging.debug(f"Frame convertido a escala de grises: {gray.shape}")
             
-            # Mejorar contraste
-            gray = cv2.convertScaleAbs(gray, alpha=1.5, beta=0)
-            logging.debug("Contraste mejorado")
+            # Fotogramas casi idénticos (mismo dHash) reutilizan el texto ya extraído
+            small = cv2.resize(gray, (OCR_HASH_SIZE + 1, OCR_HASH_SIZE), interpolation=cv2.INTER_AREA)
+            frame_hash = np.packbits(small[:, 1:] > small[:, :-1]).tobytes()
+            with self._ocr_cache_lock:
+                cached_text = self.ocr_cache.get(frame_hash)
+                if cached_text is not None:
+                    self.ocr_cache.move_to_end(frame_hash)
+            if cached_text is not None:
+                logging.debug("OCR desde cache (fotograma repetido)")
+                return cached_text
+            
+            # Sin bordes marcados no hay texto legible: se evita la llamada a Tesseract
+            if cv2.Canny(gray, 100, 200).mean() < OCR_MIN_EDGE_DENSITY:
+                logging.debug("Fotograma sin estructura de texto, se omite el OCR")
+                self._remember_ocr(frame_hash, "")
+                return ""
+            
+            # Mejorar contraste solo si la miniatura indica poco contraste (CLAHE conserva el contraste local)
+            thumbnail = cv2.resize(gray, (160, 90), interpolation=cv2.INTER_AREA)
+            if thumbnail.std() < OCR_MIN_CONTRAST_STD:
+                gray = cv2.createCLAHE(clipLimit=2.0).apply(gray)
+                logging.debug("Contraste mejorado")
             
             # Extraer texto
-            text = pytesseract.image_to_string(gray, lang='spa+eng')
-            text = text.strip()
+            text = self._run_tesseract(gray, pytesseract.pytesseract.tesseract_cmd).strip()
+            
+            self._remember_ocr(frame_hash, text)
             
             if text:
                 logging.debug(f"OCR detectó texto ({len(text)} chars): '{text[:100]}{'...' if len(text) > 100 else ''}'")
@@ -434,8 +643,122 @@ class VideoAnalyzer:
             logging.error(f"Error en OCR: {e}", exc_info=True)
             return ""
     
+    @staticmethod
+    def _run_tesseract(gray: np.ndarray, tesseract_cmd: str) -> str:
+        """Ejecutar tesseract sobre la imagen (PNG por stdin/stdout, sin archivos temporales) con _TESSERACT_ENV
+        
+        Equivale a pytesseract.image_to_string, que no permite pasar un entorno propio al subproceso.
+        """
+        import cv2
+        ok, png = cv2.imencode('.png', gray)
+        if not ok:
+            return ""
+        cmd = [tesseract_cmd, 'stdin', 'stdout', '-l', 'spa+eng', *OCR_TESSERACT_CONFIG.split()]
+        result = subprocess.run(cmd, input=png.tobytes(), capture_output=True, env=_TESSERACT_ENV)
+        if result.returncode != 0:
+            raise RuntimeError(f"tesseract terminó con código {result.returncode}: "
+                               f"{result.stderr.decode('utf-8', errors='replace').strip()}")
+        return result.stdout.decode('utf-8', errors='replace')
+    
+    def _open_capture(self, video_path: Path):
+        """Abrir un video con el backend FFmpeg pidiendo decodificación por hardware si está disponible"""
+        import cv2
+        if self.config.get('hardware_decoding', True) and hasattr(cv2, 'CAP_PROP_HW_ACCELERATION'):
+            try:
+                cap = cv2.VideoCapture(str(video_path), cv2.CAP_FFMPEG,
+                                       [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY])
+                if cap.isOpened():
+                    return cap
+                cap.release()
+            except cv2.error as e:
+                logging.debug(f"Decodificación por hardware no disponible: {e}")
+        # OpenCV antiguo o sin FFmpeg/aceleración: backend por defecto, decodificación por software
+        return cv2.VideoCapture(str(video_path))
+    
+    @staticmethod
+    def _read_frame_at(cap, frame_pos: int, current_pos: int):
+        """Leer el fotograma frame_pos: con grab() si está cerca de la posición actual, si no con una búsqueda"""
+        import cv2
+        skip = frame_pos - current_pos
+        if 0 <= skip <= SEQUENTIAL_GRAB_MAX_STEP:
+            # grab() solo demultiplexa y decodifica; la conversión a BGR se hace en retrieve()
+            for _ in range(skip):
+                if not cap.grab():
+                    return False, None
+            return cap.read()
+        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_pos)
+        return cap.read()
+    
+    def _remember_ocr(self, frame_hash: bytes, text: str):
+        """Guardar el texto de un fotograma en la cache de OCR, descartando el más antiguo si está llena"""
+        with self._ocr_cache_lock:
+            self.ocr_cache[frame_hash] = text
+            if len(self.ocr_cache) > OCR_CACHE_SIZE:
+                self.ocr_cache.popitem(last=False)
+    
+    @staticmethod
+    def _analysis_size(width: int, height: int):
+        """Tamaño (ancho, alto) de análisis: lado mayor como máximo ANALYSIS_MAX_SIDE
+        
+        Lo usan tanto OpenCV como ffmpeg, para que todos los fotogramas de un video midan lo mismo
+        (batch_face_locations rechaza lotes con tamaños distintos).
+        """
+        scale = ANALYSIS_MAX_SIDE / max(width, height)
+        if scale >= 1.0:
+            return width, height
+        return max(1, round(width * scale)), max(1, round(height * scale))
+    
+    @classmethod
+    def _downscale_frame(cls, frame: np.ndarray) -> np.ndarray:
+        """Reducir el fotograma para que su lado mayor no supere ANALYSIS_MAX_SIDE"""
+        import cv2
+        height, width = frame.shape[:2]
+        size = cls._analysis_size(width, height)
+        if size == (width, height):
+            return frame
+        return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    
+    @staticmethod
+    def _read_keyframe(file_path: Path, seconds: float, width: int, height: int) -> Optional[np.ndarray]:
+        """Leer con ffmpeg el fotograma clave anterior a seconds, ya reducido a width x height (BGR)"""
+        cmd = [
+            FFMPEG_PATH, '-hide_banner', '-loglevel', 'error', '-noautorotate',
+            # Búsqueda en la entrada sin precisión: se entrega el fotograma clave sin decodificar el GOP
+            '-skip_frame', 'nokey', '-noaccurate_seek', '-ss', f"{seconds:.3f}", '-i', str(file_path),
+            '-frames:v', '1', '-an', '-sn', '-vf', f"scale={width}:{height}:flags=area",
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24', 'pipe:1'
+        ]
+        try:
+            result = subprocess.run(cmd, capture_output=True, timeout=FFMPEG_KEYFRAME_TIMEOUT)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            logging.debug(f"ffmpeg no pudo extraer el fotograma clave: {e}")
+            return None
+        if result.returncode != 0 or len(result.stdout) != width * height * 3:
+            return None
+        return np.frombuffer(result.stdout, dtype=np.uint8).reshape(height, width, 3)
+    
+    def _read_analysis_frame(self, cap, file_path: Path, frame_pos: int, current_pos: int):
+        """Leer el fotograma frame_pos para análisis; devuelve (ret, frame, nueva posición de cap)
+        
+        Los saltos largos se resuelven con el fotograma clave más cercano vía ffmpeg (basta para OCR
+        y caras, y evita decodificar el GOP entero); si no es posible, se usa OpenCV.
+        """
+        import cv2
+        skip = frame_pos - current_pos
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        if FFMPEG_PATH and fps > 0 and not 0 <= skip <= SEQUENTIAL_GRAB_MAX_STEP:
+            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            if width > 0 and height > 0:
+                frame = self._read_keyframe(file_path, frame_pos / fps, *self._analysis_size(width, height))
+                if frame is not None:
+                    return True, frame, current_pos
+        ret, frame = self._read_frame_at(cap, frame_pos, current_pos)
+        return ret, frame, frame_pos + 1
+    
     def analyze_video_with_ai(self, file_path: Path) -> Dict:
         """Análisis avanzado con IA (reconocimiento facial, OCR, etc.)"""
+        import cv2
         logging.info(f"Iniciando análisis con IA de: {file_path.name}")
         
         analysis_result = {
@@ -453,7 +776,7 @@ class VideoAnalyzer:
             
             # Capturar fotogramas
             logging.debug(f"Abriendo video: {file_path}")
-            cap = cv2.VideoCapture(str(file_path))
+            cap = self._open_capture(file_path)
             
             if not cap.isOpened():
                 logging.error(f"No se pudo abrir el video: {file_path}")
@@ -473,38 +796,72 @@ class VideoAnalyzer:
                 cap.release()
                 return analysis_result
             
-            for i in range(frames_to_capture):
-                frame_pos = int((i / frames_to_capture) * total_frames)
-                percentage = (frame_pos / total_frames) * 100
-                
-                logging.debug(f"Capturando fotograma {i+1}/{frames_to_capture} en posición {frame_pos} ({percentage:.1f}%)")
-                
-                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_pos)
-                ret, frame = cap.read()
-                
-                if not ret:
-                    logging.warning(f"No se pudo leer fotograma en posición {frame_pos}")
-                    continue
-                
-                logging.debug(f"Fotograma leído exitosamente: {frame.shape}")
-                
-                # Reconocimiento facial
-                if self.config.get('detect_actors', True):
-                    logging.debug("Ejecutando reconocimiento facial...")
-                    actors = self.detect_actors_in_frame(frame)
+            # Fotogramas pendientes de reconocimiento facial (se procesan por lotes)
+            detect_actors = self.config.get('detect_actors', True) and bool(self.actors_db)
+            batch_size = self.config.get('face_batch_size', FACE_BATCH_SIZE)
+            pending_frames = []
+            
+            def flush_face_batch():
+                for actors in self.detect_actors_in_frames(pending_frames):
                     if actors:
                         analysis_result['detected_actors'].extend(actors)
-                        logging.info(f"Actores detectados en frame {i+1}: {actors}")
-                
-                # OCR para texto
-                logging.debug("Ejecutando OCR...")
-                text = self.extract_text_from_frame(frame)
-                if text:
-                    analysis_result['extracted_text'].append(text)
-                    logging.info(f"Texto extraído en frame {i+1}: '{text[:50]}{'...' if len(text) > 50 else ''}'")
+                        logging.info(f"Actores detectados: {actors}")
+                pending_frames.clear()
             
-            cap.release()
-            logging.debug("Video cerrado")
+            # El OCR se ejecuta en paralelo a la lectura y la detección de caras
+            ocr_executor = _OCR_EXECUTOR
+            ocr_futures = []
+            current_pos = 0
+            seen_hashes = []  # aHash de los fotogramas ya analizados de este video
+            
+            try:
+                for i in range(frames_to_capture):
+                    frame_pos = int((i / frames_to_capture) * total_frames)
+                    percentage = (frame_pos / total_frames) * 100
+                    
+                    logging.debug(f"Capturando fotograma {i+1}/{frames_to_capture} en posición {frame_pos} ({percentage:.1f}%)")
+                    
+                    ret, frame, current_pos = self._read_analysis_frame(cap, file_path, frame_pos, current_pos)
+                    
+                    if not ret:
+                        logging.warning(f"No se pudo leer fotograma en posición {frame_pos}")
+                        continue
+                    
+                    logging.debug(f"Fotograma leído exitosamente: {frame.shape}")
+                    frame = self._downscale_frame(frame)
+                    
+                    # Saltar fotogramas casi idénticos a uno ya analizado (escenas estáticas, logos)
+                    small = cv2.cvtColor(cv2.resize(frame, (8, 8), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+                    frame_hash = int.from_bytes(np.packbits(small > small.mean()).tobytes(), 'big')
+                    if any(bin(frame_hash ^ seen).count('1') <= DUPLICATE_FRAME_MAX_DISTANCE for seen in seen_hashes):
+                        logging.debug(f"Fotograma {i+1} casi idéntico a uno anterior, se omite")
+                        continue
+                    seen_hashes.append(frame_hash)
+                    
+                    # OCR para texto
+                    ocr_futures.append((i, ocr_executor.submit(self.extract_text_from_frame, frame)))
+                    
+                    # Reconocimiento facial
+                    if detect_actors:
+                        pending_frames.append(frame)
+                        if len(pending_frames) >= batch_size:
+                            flush_face_batch()
+                
+                cap.release()
+                logging.debug("Video cerrado")
+                
+                if pending_frames:
+                    flush_face_batch()
+                
+                for i, future in ocr_futures:
+                    text = future.result()
+                    if text:
+                        analysis_result['extracted_text'].append(text)
+                        logging.info(f"Texto extraído en frame {i+1}: '{text[:50]}{'...' if len(text) > 50 else ''}'")
+            finally:
+                # Si el análisis se interrumpe, no dejar trabajo de este video en el pool compartido
+                for _, future in ocr_futures:
+                    future.cancel()
             
             # Calcular confianza basada en múltiples factores
             analysis_result['confidence_score'] = self.calculate_confidence_score(analysis_result)
@@ -544,7 +901,51 @@ class VideoAnalyzer:
         return final_score
     
     def perform_visual_analysis(self, video_path: Path) -> Optional[Dict]:
+        """Realizar análisis visual de un video, reutilizando el resultado si el archivo no ha cambiado"""
+        if self.analysis_cache_conn is None:
+            return self._accept_visual_analysis(self._perform_visual_analysis(video_path))
+        
+        try:
+            st = video_path.stat()
+        except OSError:
+            return self._accept_visual_analysis(self._perform_visual_analysis(video_path))
+        # La clave incluye la versión de la base de actores (si se reentrena, los actores detectados cambian)
+        # y las opciones que influyen en el análisis, para no devolver un resultado calculado con otras
+        settings = '|'.join(repr(self.config.get(name)) for name in VISUAL_ANALYSIS_CONFIG_KEYS)
+        key_source = f"{video_path}|{st.st_mtime_ns}|{st.st_size}|{self.actors_db_version}|{settings}"
+        key = hashlib.sha1(key_source.encode('utf-8')).hexdigest()
+        
+        with self._analysis_cache_lock:
+            row = self.analysis_cache_conn.execute('SELECT payload FROM visual_analysis WHERE key = ?', (key,)).fetchone()
+        if row:
+            logging.info(f"Análisis visual desde cache: {video_path.name}")
+            return self._accept_visual_analysis(json.loads(row[0]))
+        
+        # También se guardan los análisis de baja confianza: son los archivos que se quedan en origen
+        # y vuelven a aparecer en cada ejecución
+        analysis_result = self._perform_visual_analysis(video_path)
+        if analysis_result is not None:
+            with self._analysis_cache_lock:
+                self.analysis_cache_conn.execute('INSERT OR REPLACE INTO visual_analysis (key, payload) VALUES (?, ?)',
+                                                 (key, json.dumps(analysis_result, ensure_ascii=False)))
+                self.analysis_cache_conn.commit()
+        return self._accept_visual_analysis(analysis_result)
+    
+    @staticmethod
+    def _accept_visual_analysis(analysis_result: Optional[Dict]) -> Optional[Dict]:
+        """Devolver el análisis solo si su confianza es suficiente"""
+        if analysis_result is None:
+            return None
+        confidence = analysis_result['confidence']
+        if confidence > 0.3:
+            logging.info("Análisis visual exitoso (confianza > 0.3)")
+            return analysis_result
+        logging.warning(f"Análisis visual fallido (confianza {confidence:.2f} <= 0.3)")
+        return None
+    
+    def _perform_visual_analysis(self, video_path: Path) -> Optional[Dict]:
         """Realizar análisis visual de un video para extraer información"""
+        import cv2
         logging.info(f"Iniciando análisis visual de: {video_path.name}")
         
         try:
@@ -561,7 +962,7 @@ class VideoAnalyzer:
                 return None
             
             # Capturar fotogramas estratégicos
-            cap = cv2.VideoCapture(str(video_path))
+            cap = self._open_capture(video_path)
             
             if not cap.isOpened():
                 logging.error(f"No se pudo abrir video para análisis visual: {video_path}")
@@ -587,39 +988,47 @@ class VideoAnalyzer:
             
             all_text = []
             detected_actors = []
+            frames = []
             
+            # OCR en paralelo: cada fotograma se envía al pool en cuanto se decodifica, así la
+            # lectura del siguiente se solapa con el OCR del anterior
+            executor = _OCR_EXECUTOR
+            ocr_futures = []
+            current_pos = 0
             for i, frame_pos in enumerate(strategic_frames):
                 try:
                     percentage = (frame_pos / total_frames) * 100
                     logging.debug(f"Procesando fotograma estratégico {i+1}/4 en posición {frame_pos} ({percentage:.1f}%)")
-                    
-                    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_pos)
-                    ret, frame = cap.read()
-                    
+                        
+                    ret, frame, current_pos = self._read_analysis_frame(cap, video_path, frame_pos, current_pos)
+                        
                     if not ret:
                         logging.warning(f"No se pudo leer fotograma estratégico en posición {frame_pos}")
                         continue
+                        
+                    frame = self._downscale_frame(frame)
+                    frames.append(frame)
+                    ocr_futures.append(executor.submit(self.extract_text_from_frame, frame))
                     
-                    # OCR para texto
-                    logging.debug("Extrayendo texto del fotograma estratégico...")
-                    text = self.extract_text_from_frame(frame)
-                    if text and len(text.strip()) > 3:
-                        all_text.append(text.strip())
-                        logging.info(f"Texto útil extraído: '{text[:50]}{'...' if len(text) > 50 else ''}'")
-                    
-                    # Reconocimiento facial
-                    if self.actors_db:
-                        logging.debug("Analizando actores en fotograma estratégico...")
-                        actors = self.detect_actors_in_frame(frame)
-                        if actors:
-                            detected_actors.extend(actors)
-                            logging.info(f"Actores detectados: {actors}")
-                
                 except Exception as e:
                     logging.error(f"Error procesando fotograma estratégico {i+1}: {e}")
                     continue
-            
+                
             cap.release()
+                
+            # Reconocimiento facial en lote en este hilo mientras termina el OCR
+            if frames and self.actors_db:
+                logging.debug(f"Analizando actores en {len(frames)} fotogramas estratégicos...")
+                for actors in self.detect_actors_in_frames(frames):
+                    if actors:
+                        detected_actors.extend(actors)
+                        logging.info(f"Actores detectados: {actors}")
+                
+            for future in ocr_futures:
+                text = future.result()
+                if text and len(text.strip()) > 3:
+                    all_text.append(text.strip())
+                    logging.info(f"Texto útil extraído: '{text[:50]}{'...' if len(text) > 50 else ''}'")
             
             # Procesar texto extraído
             if all_text:
@@ -637,13 +1046,15 @@ class VideoAnalyzer:
             
             # Procesar actores detectados
             if detected_actors:
-                unique_actors = list(set(detected_actors))
+                # Un único recuento: actores ordenados de más a menos apariciones
+                actor_counts = Counter(detected_actors)
+                unique_actors = [actor for actor, _ in actor_counts.most_common()]
                 analysis_result['actors'] = unique_actors
                 logging.info(f"Actores únicos detectados: {unique_actors}")
                 
                 # Si hay actores conocidos, usar para mejorar búsqueda
                 if not analysis_result['google_search_suggestion'] and unique_actors:
-                    main_actor = max(set(detected_actors), key=detected_actors.count)
+                    main_actor = unique_actors[0]
                     analysis_result['google_search_suggestion'] = f"película {main_actor}"
                     logging.info(f"Sugerencia basada en actor principal: '{analysis_result['google_search_suggestion']}'")
             else:
@@ -663,13 +1074,7 @@ class VideoAnalyzer:
             
             analysis_result['confidence'] = confidence
             logging.info(f"Confianza final del análisis visual: {confidence:.2f}")
-            
-            if confidence > 0.3:
-                logging.info("Análisis visual exitoso (confianza > 0.3)")
-                return analysis_result
-            else:
-                logging.warning(f"Análisis visual fallido (confianza {confidence:.2f} <= 0.3)")
-                return None
+            return analysis_result
             
         except Exception as e:
             logging.error(f"Error crítico en análisis visual: {e}", exc_info=True)
@@ -681,38 +1086,21 @@ class VideoAnalyzer:
         
         try:
             # Limpiar el texto
-            text = re.sub(r'[^\w\s]', ' ', text)
+            text = _NON_WORD_RE.sub(' ', text)
             words = text.split()
             logging.debug(f"Palabras después de limpieza: {len(words)}")
             
-            # Filtrar palabras comunes y muy cortas
-            stop_words = {
-                'the', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by',
-                'a', 'an', 'el', 'la', 'los', 'las', 'un', 'una', 'y', 'o', 'pero', 'en',
-                'con', 'por', 'para', 'de', 'del', 'al', 'movie', 'film', 'película',
-                'presents', 'production', 'productions', 'entertainment', 'pictures',
-                'studios', 'studio', 'films', 'cinema'
-            }
-            
             # Filtrar palabras significativas
-            significant_words = []
-            for word in words:
-                if (len(word) > 2 and 
-                    word.lower() not in stop_words and 
-                    not word.isdigit() and
-                    len(word) < 15):  # Evitar palabras muy largas que suelen ser ruido
-                    significant_words.append(word)
+            # Las palabras muy largas (15+) suelen ser ruido del OCR
+            significant_words = [word for word in words
+                                 if 2 < len(word) < 15 and not word.isdigit()
+                                 and word.lower() not in _SUGGESTION_STOP_WORDS]
             
             logging.debug(f"Palabras significativas encontradas: {len(significant_words)}")
             
             # Buscar patrones de títulos
-            title_patterns = [
-                r'\b([A-Z][a-z]+ [A-Z][a-z]+(?:\s[A-Z][a-z]+)?)\b',  # Título en formato título
-                r'\b([A-Z]{2,}(?:\s[A-Z]{2,})*)\b',  # Títulos en mayúsculas
-            ]
-            
-            for pattern in title_patterns:
-                matches = re.findall(pattern, text)
+            for pattern in _SUGGESTION_PATTERNS:
+                matches = pattern.findall(text)
                 if matches:
                     # Tomar el match más largo
                     best_match = max(matches, key=len)
@@ -723,8 +1111,7 @@ class VideoAnalyzer:
             # Si no hay patrones claros, usar palabras más significativas
             if significant_words:
                 # Tomar las primeras 2-3 palabras más largas
-                sorted_words = sorted(significant_words, key=len, reverse=True)
-                search_terms = sorted_words[:3]
+                search_terms = heapq.nlargest(3, significant_words, key=len)
                 
                 if search_terms:
                     result = ' '.join(search_terms)
@@ -744,28 +1131,19 @@ class VideoAnalyzer:
         possible_titles = []
         
         try:
-            # Patrones para encontrar títulos
-            title_patterns = [
-                r'\b([A-Z][a-z]+(?: [A-Z][a-z]+){1,3})\b',  # Títulos en formato título (2-4 palabras)
-                r'\b([A-Z]{3,}(?: [A-Z]{3,})*)\b',          # Títulos en mayúsculas
-                r'"([^"]{5,30})"',                           # Texto entre comillas
-                r"'([^']{5,30})'",                           # Texto entre comillas simples
-            ]
-            
-            for i, pattern in enumerate(title_patterns):
-                matches = re.findall(pattern, text)
-                logging.debug(f"Patrón {i+1} encontró {len(matches)} coincidencias")
-                
-                for match in matches:
-                    if isinstance(match, tuple):
-                        match = match[0]
+            for i, pattern in enumerate(_TITLE_PATTERNS):
+                match_count = 0
+                for match_obj in pattern.finditer(text):
+                    match = match_obj.group(1)
+                    match_count += 1
                     
                     # Filtrar matches válidos
                     if (len(match) > 4 and 
                         len(match) < 50 and 
-                        not match.lower() in ['presents', 'production', 'entertainment', 'pictures']):
+                        match.lower() not in _TITLE_STOPWORDS):
                         possible_titles.append(match.strip())
                         logging.debug(f"Título candidato: '{match.strip()}'")
+                logging.debug(f"Patrón {i+1} encontró {match_count} coincidencias")
             
             # Remover duplicados manteniendo orden
             seen = set()
@@ -9,6 +9,35 @@ import logging
 from pathlib import Path
 from typing import Dict, Optional, Tuple, List
 import shutil
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Presets de x264/x265 de más rápido a más lento
+PRESET_ORDER = ["ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower", "veryslow"]
+
+# Pasos de preset más rápidos según la complejidad discretizada (energía espacial + gradiente temporal)
+PRESET_STEPS_BY_COMPLEXITY = {0: 3, 1: 2, 2: 1}
+
+# Segundos de muestra analizados para estimar la complejidad
+COMPLEXITY_SAMPLE_SECONDS = 5
+
+# Encoders por hardware seleccionables (NVENC, Quick Sync, VAAPI)
+HW_VIDEO_ENCODERS = ["h264_nvenc", "hevc_nvenc", "h264_qsv", "hevc_qsv", "h264_vaapi", "hevc_vaapi"]
+
+# Equivalencia de presets x264 a la escala p1..p7 de NVENC
+NVENC_PRESET_MAP = {
+    "ultrafast": "p1", "superfast": "p1", "veryfast": "p2", "faster": "p3", "fast": "p4",
+    "medium": "p5", "slow": "p6", "slower": "p7", "veryslow": "p7"
+}
+
+# Calidad constante (CRF en software, CQ/QP en hardware)
+VIDEO_QUALITY_CRF = 23
+
+# Dispositivo VAAPI por defecto
+VAAPI_DEVICE = "/dev/dri/renderD128"
+
+# Procesos ffmpeg simultáneos en conversión en lote (x264/x265 ya usan varios hilos cada uno)
+MAX_PARALLEL_CONVERSIONS = max(1, (os.cpu_count() or 2) // 4)
 
 class VideoConverter:
     def __init__(self, config, progress_callback=None):
@@ -19,6 +48,20 @@ class VideoConverter:
         self.jellyfin_video_codecs = ["h264", "h265", "hevc", "av1", "vp9"]
         self.jellyfin_audio_codecs = ["aac", "ac3", "eac3", "mp3", "flac"]
         self.jellyfin_containers = [".mp4", ".mkv", ".avi", ".webm"]
+        
+        # Cache de presets estimados por (ruta, mtime)
+        self._preset_cache = {}
+        
+        # Encoders disponibles en ffmpeg (se detectan en el primer uso)
+        self._available_encoders = None
+        
+        # Argumentos de codec ya construidos por (codec, preset, bitrate)
+        self._codec_args_cache = {}
+        
+        # Métodos de decodificación por hardware de ffmpeg (se detectan en el primer uso)
+        self._available_hwaccels = None
+        # Si existe de verdad un dispositivo CUDA utilizable (se prueba en el primer uso)
+        self._cuda_usable = None
     
     def log_progress(self, message: str, level: str = "INFO"):
         """Enviar mensaje de progreso"""
@@ -35,6 +78,58 @@ class VideoConverter:
         except FileNotFoundError:
             return False
     
+    def get_available_encoders(self) -> set:
+        """Encoders de video por hardware que ofrece el ffmpeg instalado (cacheado)"""
+        if self._available_encoders is None:
+            self._available_encoders = set()
+            try:
+                result = subprocess.run(["ffmpeg", "-hide_banner", "-encoders"],
+                                      capture_output=True, text=True, timeout=30)
+                for line in result.stdout.splitlines():
+                    parts = line.split()
+                    if len(parts) > 1 and parts[1] in HW_VIDEO_ENCODERS:
+                        self._available_encoders.add(parts[1])
+            except (FileNotFoundError, subprocess.TimeoutExpired):
+                pass
+        return self._available_encoders
+    
+    def get_available_hwaccels(self) -> List[str]:
+        """Métodos de aceleración por hardware que ofrece el ffmpeg instalado (cacheado)"""
+        if self._available_hwaccels is None:
+            self._available_hwaccels = []
+            try:
+                result = subprocess.run(["ffmpeg", "-hide_banner", "-hwaccels"],
+                                      capture_output=True, text=True, timeout=30)
+                # La primera línea es la cabecera "Hardware acceleration methods:"
+                self._available_hwaccels = [line.strip() for line in result.stdout.splitlines()[1:] if line.strip()]
+            except (FileNotFoundError, subprocess.TimeoutExpired):
+                pass
+        return self._available_hwaccels
+    
+    def is_cuda_usable(self) -> bool:
+        """Probar una vez que ffmpeg puede abrir un dispositivo CUDA (-hwaccels solo lista lo compilado)"""
+        if self._cuda_usable is None:
+            try:
+                result = subprocess.run(["ffmpeg", "-hide_banner", "-v", "error", "-init_hw_device", "cuda=gpu",
+                                         "-f", "lavfi", "-i", "nullsrc=s=64x64:d=0.04", "-frames:v", "1", "-f", "null", "-"],
+                                      capture_output=True, text=True, timeout=30)
+                self._cuda_usable = result.returncode == 0
+            except (FileNotFoundError, subprocess.TimeoutExpired):
+                self._cuda_usable = False
+        return self._cuda_usable
+    
+    def get_hwaccel_input_args(self) -> List[str]:
+        """Argumentos de entrada para decodificar por hardware, si está habilitado y disponible"""
+        if not self.config.get("hardware_decoding", True):
+            return []
+        hwaccels = self.get_available_hwaccels()
+        if "cuda" in hwaccels and self.is_cuda_usable():
+            # Los frames se quedan en la GPU: la salida nula no necesita copiarlos a memoria
+            return ["-hwaccel", "cuda", "-hwaccel_output_format", "cuda"]
+        if hwaccels:
+            return ["-hwaccel", "auto"]
+        return []
+    
     def get_video_info(self, video_path: Path) -> Optional[Dict]:
         """Obtener información detallada del video"""
         try:
@@ -137,16 +232,121 @@ class VideoConverter:
             self.log_progress(f"Error evaluando necesidad de conversión: {e}", "ERROR")
             return False, []
     
+    def probe_complexity(self, video_path: Path) -> Optional[Dict[str, float]]:
+        """Estimar complejidad de una muestra: energía espacial, gradiente temporal y luma media"""
+        try:
+            cmd = [
+                "ffmpeg", "-v", "error",
+                "-t", str(COMPLEXITY_SAMPLE_SECONDS),
+                "-i", str(video_path),
+                "-an", "-sn",
+                "-vf", "scale=320:-2,signalstats,entropy,metadata=mode=print:file=-",
+                "-f", "null", "-"
+            ]
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+            if result.returncode != 0:
+                return None
+            
+            sums = {"energy": 0.0, "gradient": 0.0, "luma": 0.0}
+            counts = {"energy": 0, "gradient": 0, "luma": 0}
+            keys = {
+                "lavfi.entropy.normalized_entropy.normal.Y": "energy",
+                "lavfi.signalstats.YDIF": "gradient",
+                "lavfi.signalstats.YAVG": "luma"
+            }
+            for line in result.stdout.splitlines():
+                key, _, value = line.partition("=")
+                feature = keys.get(key)
+                if feature:
+                    sums[feature] += float(value)
+                    counts[feature] += 1
+            
+            if not all(counts.values()):
+                return None
+            return {feature: sums[feature] / counts[feature] for feature in sums}
+            
+        except (subprocess.TimeoutExpired, ValueError):
+            return None
+        except Exception as e:
+            self.log_progress(f"Error estimando complejidad: {e}", "WARNING")
+            return None
+    
+    def predict_preset(self, video_path: Path) -> str:
+        """Elegir preset según la complejidad del video, sin superar el preset configurado"""
+        max_preset = self.config.get("video_quality_preset", "faster")
+        if max_preset not in PRESET_ORDER:
+            return max_preset
+        
+        try:
+            cache_key = (str(video_path), video_path.stat().st_mtime)
+        except OSError:
+            return max_preset
+        if cache_key in self._preset_cache:
+            return self._preset_cache[cache_key]
+        
+        preset = max_preset
+        features = self.probe_complexity(video_path)
+        if features:
+            energy_bin = 0 if features["energy"] < 0.6 else 1 if features["energy"] < 0.8 else 2
+            gradient_bin = 0 if features["gradient"] < 2 else 1 if features["gradient"] < 8 else 2
+            steps = PRESET_STEPS_BY_COMPLEXITY.get(energy_bin + gradient_bin, 0)
+            # Escenas oscuras muestran banding con presets rápidos
+            if features["luma"] < 50:
+                steps = max(0, steps - 1)
+            preset = PRESET_ORDER[max(0, PRESET_ORDER.index(max_preset) - steps)]
+            self.log_progress(f"Preset estimado para {video_path.name}: {preset} "
+                              f"(E={features['energy']:.2f}, h={features['gradient']:.1f}, L={features['luma']:.0f})")
+        
+        self._preset_cache[cache_key] = preset
+        return preset
+    
+    def get_video_codec_args(self, target_video_codec: str, video_quality: str, max_bitrate: str) -> Tuple[str, ...]:
+        """Argumentos de codec de video, construidos una vez por combinación de ajustes"""
+        cache_key = (target_video_codec, video_quality, max_bitrate)
+        codec_args = self._codec_args_cache.get(cache_key)
+        if codec_args is not None:
+            return codec_args
+        
+        quality = str(VIDEO_QUALITY_CRF)
+        if target_video_codec.endswith("_nvenc"):
+            codec_args = ("-c:v", target_video_codec, "-preset", NVENC_PRESET_MAP.get(video_quality, "p4"),
+                          "-tune", "hq", "-rc", "vbr", "-cq", quality)
+        elif target_video_codec.endswith("_qsv"):
+            codec_args = ("-c:v", target_video_codec,
+                          "-preset", video_quality if video_quality in PRESET_ORDER[2:] else "veryfast",
+                          "-global_quality", quality)
+        elif target_video_codec.endswith("_vaapi"):
+            codec_args = ("-c:v", target_video_codec, "-qp", quality)
+        elif target_video_codec == "h265" or target_video_codec == "hevc":
+            codec_args = ("-c:v", "libx265", "-preset", video_quality, "-crf", quality)
+        else:  # h264 por defecto
+            codec_args = ("-c:v", "libx264", "-preset", video_quality, "-crf", quality)
+        
+        # Bitrate máximo
+        codec_args += ("-maxrate", max_bitrate, "-bufsize", f"{int(max_bitrate[:-1]) * 2}M")
+        
+        self._codec_args_cache[cache_key] = codec_args
+        return codec_args
+    
     def build_ffmpeg_command(self, input_path: Path, output_path: Path, 
-                           video_info: Dict, conversion_reasons: List[str]) -> List[str]:
+                           video_info: Dict, conversion_reasons: List[str],
+                           preset: Optional[str] = None) -> List[str]:
         """Construir comando ffmpeg optimizado"""
-        cmd = ["ffmpeg", "-i", str(input_path)]
-        
         # Configuración de video
         target_video_codec = self.config.get("target_video_codec", "h264")
-        video_quality = self.config.get("video_quality_preset", "medium")
+        video_quality = preset or self.config.get("video_quality_preset", "faster")
         max_bitrate = self.config.get("max_video_bitrate", "2M")
         
+        # Encoder por hardware: volver a software si ffmpeg no lo ofrece
+        if target_video_codec in HW_VIDEO_ENCODERS and target_video_codec not in self.get_available_encoders():
+            self.log_progress(f"Encoder {target_video_codec} no disponible, usando codificación por software", "WARNING")
+            target_video_codec = "h265" if target_video_codec.startswith("hevc") else "h264"
+        
+        cmd = ["ffmpeg"]
+        if target_video_codec.endswith("_vaapi"):
+            cmd.extend(["-vaapi_device", self.config.get("vaapi_device", VAAPI_DEVICE)])
+        cmd.extend(["-i", str(input_path)])
+        
         # Mapear streams
         cmd.extend(["-map", "0:v:0"])  # Primer stream de video
         cmd.extend(["-map", "0:a:0"])  # Primer stream de audio
@@ -158,22 +358,16 @@ class VideoConverter:
             height = video_streams[0].get("height", 0)
             
             # Escalar si es necesario (máximo 1080p)
+            video_filters = []
             if width > 1920 or height > 1080:
-                cmd.extend(["-vf", "scale=1920:1080:force_original_aspect_ratio=decrease"])
-            
-            # Codec de video
-            if target_video_codec == "h265" or target_video_codec == "hevc":
-                cmd.extend(["-c:v", "libx265"])
-                cmd.extend(["-preset", video_quality])
-                cmd.extend(["-crf", "23"])
-            else:  # h264 por defecto
-                cmd.extend(["-c:v", "libx264"])
-                cmd.extend(["-preset", video_quality])
-                cmd.extend(["-crf", "23"])
-            
-            # Bitrate máximo
-            cmd.extend(["-maxrate", max_bitrate])
-            cmd.extend(["-bufsize", f"{int(max_bitrate[:-1]) * 2}M"])
+                video_filters.append("scale=1920:1080:force_original_aspect_ratio=decrease")
+            if target_video_codec.endswith("_vaapi"):
+                video_filters.extend(["format=nv12", "hwupload"])
+            if video_filters:
+                cmd.extend(["-vf", ",".join(video_filters)])
+            
+            # Codec de video y bitrate máximo (argumentos precalculados)
+            cmd.extend(self.get_video_codec_args(target_video_codec, video_quality, max_bitrate))
         
         # Configuración de audio
         target_audio_codec = self.config.get("target_audio_codec", "aac")
@@ -200,7 +394,7 @@ class VideoConverter:
         return cmd
     
     def convert_video(self, input_path: Path, output_path: Path, 
-                     progress_callback=None) -> bool:
+                     progress_callback=None, preset: Optional[str] = None) -> bool:
         """Convertir video con ffmpeg"""
         try:
             # Obtener información del video
@@ -218,7 +412,7 @@ class VideoConverter:
             self.log_progress(f"Razones: {', '.join(reasons)}")
             
             # Construir comando ffmpeg
-            cmd = self.build_ffmpeg_command(input_path, output_path, video_info, reasons)
+            cmd = self.build_ffmpeg_command(input_path, output_path, video_info, reasons, preset)
             
             # Ejecutar conversión
             process = subprocess.Popen(
@@ -281,16 +475,24 @@ class VideoConverter:
     def verify_video_integrity(self, video_path: Path) -> bool:
         """Verificar integridad del video"""
         try:
+            hwaccel_args = self.get_hwaccel_input_args()
+            input_args = ["-i", str(video_path), "-f", "null", "-"]
             cmd = [
                 "ffmpeg",
                 "-v", "error",
-                "-i", str(video_path),
-                "-f", "null",
-                "-"
+                *hwaccel_args,
+                *input_args
             ]
             
             result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
             
+            # Un fallo con decodificación por hardware puede ser del dispositivo y no del archivo:
+            # se repite por software antes de darlo por corrupto
+            if result.returncode != 0 and hwaccel_args:
+                logging.debug(f"Verificación por hardware fallida, reintentando por software: {result.stderr}")
+                cmd = ["ffmpeg", "-v", "error", *input_args]
+                result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+            
             if result.returncode == 0:
                 self.log_progress(f"Video íntegro: {video_path.name}")
                 return True
@@ -306,7 +508,7 @@ class VideoConverter:
             self.log_progress(f"Error verificando integridad: {e}", "ERROR")
             return False
     
-    def convert_video_with_backup(self, video_path: Path) -> bool:
+    def convert_video_with_backup(self, video_path: Path, preset: Optional[str] = None) -> bool:
         """Convertir video manteniendo backup del original"""
         try:
             # Crear nombre para archivo convertido
@@ -324,7 +526,7 @@ class VideoConverter:
                 return True
             
             # Convertir video
-            success = self.convert_video(video_path, output_path)
+            success = self.convert_video(video_path, output_path, preset=preset)
             
             if success:
                 # Verificar integridad del video convertido
@@ -355,64 +557,76 @@ class VideoConverter:
             self.log_progress(f"Error en conversión con backup: {e}", "ERROR")
             return False
     
+    def _convert_batch_item(self, video_path: Path, cancel_event=None) -> str:
+        """Procesar un video del lote; devuelve 'converted', 'skipped', 'failed' o 'cancelled'"""
+        # Los videos aún en cola cuando se cancela no llegan a arrancar ffmpeg
+        if cancel_event is not None and cancel_event.is_set():
+            return "cancelled"
+        try:
+            # Verificar que el archivo existe
+            if not video_path.exists():
+                self.log_progress(f"Archivo no encontrado: {video_path}", "ERROR")
+                return "failed"
+            
+            # Verificar información del video
+            video_info = self.get_video_info(video_path)
+            if not video_info:
+                self.log_progress(f"No se pudo analizar: {video_path.name}", "ERROR")
+                return "failed"
+            
+            # Verificar si necesita conversión
+            needs_conv, reasons = self.needs_conversion(video_info)
+            
+            if not needs_conv:
+                self.log_progress(f"No necesita conversión: {video_path.name}")
+                return "skipped"
+            
+            # Convertir video con preset ajustado a su complejidad
+            preset = self.predict_preset(video_path) if self.config.get("auto_video_preset", True) else None
+            return "converted" if self.convert_video_with_backup(video_path, preset) else "failed"
+                
+        except Exception as e:
+            self.log_progress(f"Error procesando {video_path.name}: {e}", "ERROR")
+            return "failed"
+    
     def batch_convert_videos(self, video_paths: List[Path], 
-                           progress_callback=None) -> Dict[str, int]:
-        """Convertir múltiples videos en lote"""
+                           progress_callback=None, cancel_event=None) -> Dict[str, int]:
+        """Convertir múltiples videos en lote, varios ffmpeg en paralelo (cancel_event detiene los pendientes)"""
         stats = {
             "total": len(video_paths),
             "converted": 0,
             "skipped": 0,
-            "failed": 0
+            "failed": 0,
+            "cancelled": 0
         }
         
         try:
-            for i, video_path in enumerate(video_paths):
-                try:
-                    if progress_callback:
-                        overall_progress = (i / len(video_paths)) * 100
-                        progress_callback(overall_progress, f"Procesando: {video_path.name}")
-                    
-                    self.log_progress(f"Procesando video {i+1}/{len(video_paths)}: {video_path.name}")
-                    
-                    # Verificar que el archivo existe
-                    if not video_path.exists():
-                        self.log_progress(f"Archivo no encontrado: {video_path}", "ERROR")
-                        stats["failed"] += 1
-                        continue
-                    
-                    # Verificar información del video
-                    video_info = self.get_video_info(video_path)
-                    if not video_info:
-                        self.log_progress(f"No se pudo analizar: {video_path.name}", "ERROR")
-                        stats["failed"] += 1
-                        continue
-                    
-                    # Verificar si necesita conversión
-                    needs_conv, reasons = self.needs_conversion(video_info)
-                    
-                    if not needs_conv:
-                        self.log_progress(f"No necesita conversión: {video_path.name}")
-                        stats["skipped"] += 1
-                        continue
+            max_workers = self.config.get("max_parallel_conversions", MAX_PARALLEL_CONVERSIONS)
+            self.log_progress(f"Conversiones simultáneas: {max_workers}")
+            
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {executor.submit(self._convert_batch_item, video_path, cancel_event): video_path
+                           for video_path in video_paths}
+                
+                for i, future in enumerate(as_completed(futures)):
+                    video_path = futures[future]
+                    stats[future.result()] += 1
                     
-                    # Convertir video
-                    if self.convert_video_with_backup(video_path):
-                        stats["converted"] += 1
-                    else:
-                        stats["failed"] += 1
-                        
-                except Exception as e:
-                    self.log_progress(f"Error procesando {video_path.name}: {e}", "ERROR")
-                    stats["failed"] += 1
+                    self.log_progress(f"Procesado video {i+1}/{len(video_paths)}: {video_path.name}")
+                    if progress_callback:
+                        overall_progress = ((i + 1) / len(video_paths)) * 100
+                        progress_callback(overall_progress, f"Procesado: {video_path.name}")
             
             self.log_progress(f"Conversión en lote completada:")
             self.log_progress(f"  Total: {stats['total']}")
             self.log_progress(f"  Convertidos: {stats['converted']}")
             self.log_progress(f"  Omitidos: {stats['skipped']}")
             self.log_progress(f"  Fallidos: {stats['failed']}")
+            if stats['cancelled']:
+                self.log_progress(f"  Cancelados: {stats['cancelled']}")
             
             return stats
             
         except Exception as e:
             self.log_progress(f"Error en conversión en lote: {e}", "ERROR")
-            return stats
\ No newline at end of file
+            return stats
@@ -14,22 +14,34 @@ import logging
 from datetime import datetime
 import json
 import time
+from collections import Counter, deque
 
 # Importaciones de tipado (corregidas)
 from typing import Dict, List, Optional, Tuple, Any 
 
 # Importar módulos locales
-from config_manager import ConfigManager
+from config_manager import ConfigManager, MAX_LOG_LINES
 from video_analyzer import VideoAnalyzer
 from tmdb_client import TMDBClient
 from actors_manager import ActorsManager
-from file_organizer import FileOrganizer
+from file_organizer import FileOrganizer, iter_video_files
 from jellyfin_client import JellyfinClient
 from audio_analyzer import AudioAnalyzer
-from video_converter import VideoConverter
+from video_converter import VideoConverter, HW_VIDEO_ENCODERS
 from reference_database_builder import ReferenceDatabaseBuilder
 from youtube_manager_simple import YouTubeManagerSimple
 
+# Intervalo de volcado de los buffers de log a la interfaz (ms): con actividad y en reposo
+LOG_FLUSH_INTERVAL_MS = 50
+LOG_FLUSH_IDLE_INTERVAL_MS = 250
+
+# Paneles de log de solo lectura: sin pila de deshacer (solo se escribe desde _flush_logs)
+LOG_TEXT_OPTIONS = {'height': 15, 'undo': False, 'maxundo': 0, 'autoseparators': False, 'state': 'disabled'}
+
+# Opciones de los combos de conversión (códecs por software y todos los codificadores por hardware soportados)
+VIDEO_CODEC_CHOICES = ("h264", "h265", "hevc") + tuple(HW_VIDEO_ENCODERS)
+VIDEO_PRESET_CHOICES = ("ultrafast", "fast", "faster", "medium", "slow", "veryslow")
+
 # DUMMY YouTube Manager Class (para evitar errores de NameError y dependencia en la UI)
 class YouTubeManagerDummy:
     def __init__(self, *args, **kwargs): pass
@@ -47,10 +59,33 @@ class YouTubeManagerDummy:
             pass
         return Path("temp") / f"{movie_info.get('title', 'dummy')}_trailer.mp4" 
     def log_progress(self, *args, **kwargs): pass
+    def refresh_config(self): pass
+    def close(self): pass
+
+class SampledProgress:
+    """Barra de progreso cuyos cambios se aplican desde el temporizador de la GUI"""
+    def __init__(self, widget):
+        self.widget = widget
+        self._pending = {}
+        self._lock = threading.Lock()
+    
+    def configure(self, **options):
+        with self._lock: self._pending.update(options)
+    
+    def __setitem__(self, key, value):
+        self.configure(**{key: value})
+    
+    def apply(self):
+        """Aplicar solo el último estado pendiente (llamar desde el hilo de Tk)"""
+        with self._lock: pending, self._pending = self._pending, {}
+        if pending: self.widget.configure(**pending)
 
 # === Clase Principal ===
 
 class VideoSortPro:
+    # [segundo epoch, hora formateada] del último timestamp de log
+    _ts_cache = [0, ""]
+
     def __init__(self, root):
         self.root = root
         self.root.title("VideoSort Pro v2 - Organizador Avanzado para Jellyfin")
@@ -84,9 +119,21 @@ class VideoSortPro:
         self.capa_1_enabled = tk.BooleanVar(value=self.config_manager.get('capa_1_habilitada', True))
         self.capa_2_enabled = tk.BooleanVar(value=self.config_manager.get('capa_2_habilitada', True))
         self.capa_3_enabled = tk.BooleanVar(value=self.config_manager.get('capa_3_habilitada', True))
-        
+
+        # Control de hilos de trabajo: uno a la vez y cancelación cooperativa
+        self._busy = threading.Event()
+        self._cancel = threading.Event()
+
+        # Buffers de log por panel; se vuelcan periódicamente en _flush_logs
+        # (acotados para pestañas que aún no se han construido)
+        self._max_log_lines = self.config_manager.get('max_log_lines', MAX_LOG_LINES)
+        self._log_buffers = {name: deque(maxlen=self._max_log_lines)
+                             for name in ('log_text', 'actors_log', 'db_builder_log', 'jellyfin_log',
+                                          'youtube_log', 'audio_log', 'conversion_log')}
+
         # Inicialización de clientes (NOTA: Antes de crear widgets)
         self.tmdb_client = TMDBClient(self.config_manager.get('tmdb_api_key', ''))
+        self.tmdb_client.prewarm_dns()
         self.video_analyzer = VideoAnalyzer(self.config_manager.config)
         self.actors_manager = ActorsManager(self.tmdb_client, self.actors_log_message)
         self.file_organizer = FileOrganizer(self.config_manager.config)
@@ -99,9 +146,11 @@ class VideoSortPro:
         self.video_converter = VideoConverter(self.config_manager.config, self.conversion_log_message)
         
         self.db_builder = ReferenceDatabaseBuilder(self.config_manager, self.db_builder_log_message)
+        self.db_builder.cancel_event = self._cancel
 
         # Crear interfaz
         self.create_widgets()
+        self.root.after(LOG_FLUSH_INTERVAL_MS, self._flush_logs)
 
         # INICIALIZACIÓN FINAL: Llamar a init_database solo después de crear todos los logs/widgets
         self.db_builder.init_database() 
@@ -114,9 +163,17 @@ class VideoSortPro:
         log_dir = Path("logs")
         log_dir.mkdir(exist_ok=True)
         
-        log_filename = f"videosort_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
+        session_stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        log_filename = f"videosort_{session_stamp}.log"
         log_path = log_dir / log_filename
         
+        # Copia persistente de los paneles de log; la interfaz solo conserva las últimas líneas.
+        # Cada línea se escribe al llegar (aunque su pestaña no exista aún) y el archivo se vacía en cada tick
+        self._panels_log_file = open(log_dir / f"videosort_paneles_{session_stamp}.log", 'a',
+                                     encoding='utf-8', buffering=65536)
+        self._panels_log_lock = threading.Lock()
+        self._panels_log_pending = False
+        
         logging.basicConfig(
             level=logging.INFO,
             format='%(asctime)s - %(levelname)s - %(message)s',
@@ -147,14 +204,26 @@ class VideoSortPro:
         self.create_config_tab(config_tab)
         self.create_analysis_tab(analysis_tab)
         self.create_actors_tab(actors_tab)
-        self.create_jellyfin_tab(jellyfin_tab)
-        self.create_youtube_tab(youtube_tab)
-        self.create_audio_tab(audio_tab)
-        self.create_conversion_tab(conversion_tab)
         self.create_reference_db_tab(reference_db_tab)
         
+        # Pestañas secundarias: se construyen la primera vez que se seleccionan
+        self._lazy_tabs = {
+            str(jellyfin_tab): (jellyfin_tab, self.create_jellyfin_tab),
+            str(youtube_tab): (youtube_tab, self.create_youtube_tab),
+            str(audio_tab): (audio_tab, self.create_audio_tab),
+            str(conversion_tab): (conversion_tab, self.create_conversion_tab)
+        }
+        notebook.bind('<<NotebookTabChanged>>', self._on_tab_changed)
+        
         return notebook
 
+    def _on_tab_changed(self, event):
+        """Construir la pestaña seleccionada si aún no se ha creado"""
+        lazy_tab = self._lazy_tabs.pop(event.widget.select(), None)
+        if lazy_tab:
+            parent, create_tab = lazy_tab
+            create_tab(parent)
+
     def create_main_tab(self, parent):
         """Crear pestaña principal"""
         paths_frame = ttk.LabelFrame(parent, text="Configuración de Rutas", padding="10")
@@ -216,15 +285,18 @@ class VideoSortPro:
         ttk.Button(buttons_frame, text="Verificar Configuración", command=self.verify_setup).pack(side='left', padx=5)
         ttk.Button(buttons_frame, text="Escanear Videos", command=self.scan_videos).pack(side='left', padx=5)
         ttk.Button(buttons_frame, text="Procesar Videos", command=self.process_videos).pack(side='left', padx=5)
+        ttk.Button(buttons_frame, text="Cancelar", command=self.cancel_task).pack(side='left', padx=5)
         ttk.Button(buttons_frame, text="Limpiar Log", command=self.clear_log).pack(side='left', padx=5)
         
         self.progress = ttk.Progressbar(parent, mode='determinate')
         self.progress.pack(fill='x', padx=10, pady=5)
+        # Los hilos de trabajo actualizan la barra a través del temporizador de logs
+        self.sampled_progress = SampledProgress(self.progress)
         
         log_frame = ttk.LabelFrame(parent, text="Log de Actividad", padding="5")
         log_frame.pack(fill='both', expand=True, padx=10, pady=5)
         
-        self.log_text = scrolledtext.ScrolledText(log_frame, height=15)
+        self.log_text = scrolledtext.ScrolledText(log_frame, **LOG_TEXT_OPTIONS)
         self.log_text.pack(fill='both', expand=True)
 
     def create_config_tab(self, parent):
@@ -319,7 +391,7 @@ class VideoSortPro:
         actors_log_frame = ttk.LabelFrame(parent, text="Log de Gestión de Actores", padding="5")
         actors_log_frame.pack(fill='both', expand=True, padx=10, pady=5)
         
-        self.actors_log = scrolledtext.ScrolledText(actors_log_frame, height=15)
+        self.actors_log = scrolledtext.ScrolledText(actors_log_frame, **LOG_TEXT_OPTIONS)
         self.actors_log.pack(fill='both', expand=True)
 
     def create_jellyfin_tab(self, parent):
@@ -359,7 +431,7 @@ class VideoSortPro:
         log_frame = ttk.LabelFrame(parent, text="Log de Jellyfin", padding="5")
         log_frame.pack(fill='both', expand=True, padx=10, pady=5)
         
-        self.jellyfin_log = scrolledtext.ScrolledText(log_frame, height=15)
+        self.jellyfin_log = scrolledtext.ScrolledText(log_frame, **LOG_TEXT_OPTIONS)
         self.jellyfin_log.pack(fill='both', expand=True)
 
     def create_youtube_tab(self, parent):
@@ -399,7 +471,7 @@ NO requiere OAuth ni credenciales de Google."""
         youtube_log_frame = ttk.LabelFrame(parent, text="Log de YouTube/Entrenamiento", padding="5")
         youtube_log_frame.pack(fill='both', expand=True, padx=10, pady=5)
         
-        self.youtube_log = scrolledtext.ScrolledText(youtube_log_frame, height=15)
+        self.youtube_log = scrolledtext.ScrolledText(youtube_log_frame, **LOG_TEXT_OPTIONS)
         self.youtube_log.pack(fill='both', expand=True)
 
     def create_audio_tab(self, parent):
@@ -419,10 +491,12 @@ NO requiere OAuth ni credenciales de Google."""
                                 values=["es", "en", "auto"], state="readonly")
         lang_combo.grid(row=1, column=1, sticky='w', padx=5, pady=2)
         
+        self.enable_audio_analysis_var = tk.BooleanVar(value=self.config_manager.get('enable_audio_analysis', True))
         ttk.Checkbutton(config_frame, text="Habilitar análisis de audio", 
-                       variable=tk.BooleanVar(value=self.config_manager.get('enable_audio_analysis', True))).grid(row=2, column=0, sticky='w', pady=2)
+                       variable=self.enable_audio_analysis_var).grid(row=2, column=0, sticky='w', pady=2)
+        self.enable_subtitle_search_var = tk.BooleanVar(value=self.config_manager.get('enable_subtitle_search', True))
         ttk.Checkbutton(config_frame, text="Buscar en OpenSubtitles", 
-                       variable=tk.BooleanVar(value=self.config_manager.get('enable_subtitle_search', True))).grid(row=2, column=1, sticky='w', pady=2)
+                       variable=self.enable_subtitle_search_var).grid(row=2, column=1, sticky='w', pady=2)
         
         audio_buttons_frame = ttk.Frame(config_frame)
         audio_buttons_frame.grid(row=3, column=0, columnspan=2, pady=10)
@@ -441,7 +515,7 @@ NO requiere OAuth ni credenciales de Google."""
         log_frame = ttk.LabelFrame(parent, text="Log de Análisis de Audio", padding="5")
         log_frame.pack(fill='both', expand=True, padx=10, pady=5)
         
-        self.audio_log = scrolledtext.ScrolledText(log_frame, height=15)
+        self.audio_log = scrolledtext.ScrolledText(log_frame, **LOG_TEXT_OPTIONS)
         self.audio_log.pack(fill='both', expand=True)
 
     def create_conversion_tab(self, parent):
@@ -452,13 +526,13 @@ NO requiere OAuth ni credenciales de Google."""
         ttk.Label(config_frame, text="Codec de video:").grid(row=0, column=0, sticky='w', pady=2)
         self.video_codec_var = tk.StringVar(value=self.config_manager.get('target_video_codec', 'h264'))
         codec_combo = ttk.Combobox(config_frame, textvariable=self.video_codec_var,
-                                 values=["h264", "h265", "hevc"], state="readonly")
+                                 values=VIDEO_CODEC_CHOICES, state="readonly")
         codec_combo.grid(row=0, column=1, sticky='w', padx=5, pady=2)
         
         ttk.Label(config_frame, text="Calidad:").grid(row=1, column=0, sticky='w', pady=2)
-        self.video_quality_var = tk.StringVar(value=self.config_manager.get('video_quality_preset', 'medium'))
+        self.video_quality_var = tk.StringVar(value=self.config_manager.get('video_quality_preset', 'faster'))
         quality_combo = ttk.Combobox(config_frame, textvariable=self.video_quality_var,
-                                   values=["ultrafast", "fast", "medium", "slow", "veryslow"], state="readonly")
+                                   values=VIDEO_PRESET_CHOICES, state="readonly")
         quality_combo.grid(row=1, column=1, sticky='w', padx=5, pady=2)
         
         ttk.Label(config_frame, text="Bitrate máximo:").grid(row=2, column=0, sticky='w', pady=2)
@@ -488,7 +562,7 @@ NO requiere OAuth ni credenciales de Google."""
         conversion_log_frame = ttk.LabelFrame(parent, text="Log de Conversión", padding="5")
         conversion_log_frame.pack(fill='both', expand=True, padx=10, pady=5)
         
-        self.conversion_log = scrolledtext.ScrolledText(conversion_log_frame, height=15)
+        self.conversion_log = scrolledtext.ScrolledText(conversion_log_frame, **LOG_TEXT_OPTIONS)
         self.conversion_log.pack(fill='both', expand=True)
 
     def create_reference_db_tab(self, parent):
@@ -572,7 +646,7 @@ MODOS DE PROCESAMIENTO:
         log_frame = ttk.LabelFrame(parent, text="Log de Construcción", padding="5")
         log_frame.pack(fill='both', expand=True, padx=10, pady=5)
         
-        self.db_builder_log = scrolledtext.ScrolledText(log_frame, height=15)
+        self.db_builder_log = scrolledtext.ScrolledText(log_frame, **LOG_TEXT_OPTIONS)
         self.db_builder_log.pack(fill='both', expand=True)
         
         self.refresh_db_stats()
@@ -603,7 +677,8 @@ MODOS DE PROCESAMIENTO:
                         'audio_whisper': self.analyze_audio_whisper.get()
                     },
                     'move_files': self.move_files.get(),
-                    'tmdb_min_score': self.config_manager.get('min_tmdb_score', 0.8)
+                    'tmdb_min_score': self.config_manager.get('min_tmdb_score', 0.8),
+                    'cancel_event': self._cancel
                 }
                 
                 self.tmdb_client.api_key = self.config_manager.get('tmdb_api_key', '')
@@ -614,7 +689,7 @@ MODOS DE PROCESAMIENTO:
                     self.tmdb_client, 
                     self.video_analyzer,
                     self.audio_analyzer,
-                    self.progress,
+                    self.sampled_progress,
                     self.log
                 )
                 
@@ -631,13 +706,14 @@ MODOS DE PROCESAMIENTO:
                 self.log(f"Error crítico durante el procesamiento: {str(e)}", "ERROR")
                 messagebox.showerror("Error", f"Error durante el procesamiento: {str(e)}")
             finally:
-                self.progress['value'] = 0
+                self.sampled_progress['value'] = 0
         
-        threading.Thread(target=process_thread, daemon=True).start()
+        self._start_worker(process_thread)
 
     def on_closing(self):
         """Guardar configuración al cerrar y cerrar la aplicación."""
         if messagebox.askokcancel("Salir", "¿Estás seguro de que quieres salir?"):
+            self._cancel.set()
             # Guardar últimas rutas utilizadas
             self.config_manager.save_last_folders(
                 self.source_folder.get(),
@@ -645,13 +721,37 @@ MODOS DE PROCESAMIENTO:
                 self.series_folder.get(),
                 self.unknown_folder.get()
             )
+            # Única escritura a disco de todos los cambios de configuración
+            self.config_manager.flush()
+            with self._panels_log_lock: self._panels_log_file.close()
+            self.youtube_manager.close()
             self.root.destroy()
             
+    def _start_worker(self, target):
+        """Lanzar un hilo de trabajo si no hay otro en curso"""
+        if self._busy.is_set():
+            self.log("Ya hay una tarea en curso. Espera a que termine o cancélala.", "WARNING")
+            return
+        self._busy.set(); self._cancel.clear()
+        def runner():
+            try: target()
+            finally: self._busy.clear()
+        threading.Thread(target=runner, daemon=True).start()
+
+    def cancel_task(self):
+        """Solicitar la cancelación de la tarea en curso"""
+        if self._busy.is_set():
+            self._cancel.set(); self.log("Cancelación solicitada...", "WARNING")
+
     # --- Métodos de UI / Callbacks / Lógica Secundaria ---
 
     def show_processing_stats(self, stats):
         """Mostrar estadísticas del procesamiento"""
         processing_time = stats.get('processing_time', 'N/A')
+        actors = stats.get('actors_detected') or ()
+
+        actors_str = ', '.join(sorted(actors)) if actors else 'Ninguno'
+
         stats_text = f"""ESTADÍSTICAS DEL PROCESAMIENTO
 {"="*60}
 Tiempo total: {processing_time}
@@ -660,8 +760,8 @@ Series procesadas: {stats.get('series_processed', 0)}
 Archivos no identificados: {stats.get('unknown_files', 0)}
 Saltados (baja confianza): {stats.get('skipped_low_confidence', 0)}
 Errores: {stats.get('errors', 0)}
-Actores detectados: {len(stats.get('actors_detected', set()))}
-{', '.join(sorted(stats.get('actors_detected', set()))) if stats.get('actors_detected') else 'Ninguno'}
+Actores detectados: {len(actors)}
+{actors_str}
 Procesamiento completado: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 """
         self.stats_text.configure(state='normal'); self.stats_text.delete(1.0, tk.END); self.stats_text.insert(1.0, stats_text); self.stats_text.configure(state='disabled')
@@ -683,14 +783,20 @@ Procesamiento completado: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
         if folder: self.unknown_folder.set(folder)
 
     # Métodos de Logging (Callbacks)
+    def _log(self, panel, message, level="INFO"):
+        """Encolar una línea en el buffer del panel de log indicado y copiarla al archivo de la sesión"""
+        line = f"[{self._now_ts()}] {level}: {message}\n"
+        self._log_buffers[panel].append(line)
+        # El log principal ya se escribe en el archivo de logging
+        if panel != 'log_text':
+            with self._panels_log_lock:
+                if not self._panels_log_file.closed:
+                    self._panels_log_file.write(f"{panel}: {line}")
+                    self._panels_log_pending = True
+
     def log(self, message, level="INFO"):
         """Agregar mensaje al log principal"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        log_message = f"[{timestamp}] {level}: {message}"
-        
-        self.log_text.insert(tk.END, log_message + "\n")
-        self.log_text.see(tk.END)
-        self.root.update_idletasks()
+        self._log('log_text', message, level)
         
         if level == "ERROR": self.logger.error(message)
         elif level == "WARNING": self.logger.warning(message)
@@ -698,55 +804,61 @@ Procesamiento completado: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
             
     def db_builder_log_message(self, message: str, level: str = "INFO"):
         """Log para construcción de DB (Callback)"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        log_message = f"[{timestamp}] {level}: {message}"
-        self.db_builder_log.insert(tk.END, log_message + "\n")
-        self.db_builder_log.see(tk.END)
-        self.root.update_idletasks()
+        self._log('db_builder_log', message, level)
         
     def actors_log_message(self, message, level="INFO"):
         """Log específico para actores"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        log_message = f"[{timestamp}] {level}: {message}"
-        self.actors_log.insert(tk.END, log_message + "\n")
-        self.actors_log.see(tk.END)
-        self.root.update_idletasks()
+        self._log('actors_log', message, level)
     
     def jellyfin_log_message(self, message, level="INFO"):
         """Log específico para Jellyfin"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        log_message = f"[{timestamp}] {level}: {message}"
-        self.jellyfin_log.insert(tk.END, log_message + "\n")
-        self.jellyfin_log.see(tk.END)
-        self.root.update_idletasks()
+        self._log('jellyfin_log', message, level)
     
     def youtube_log_message(self, message, level="INFO"):
         """Log específico para YouTube"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        log_message = f"[{timestamp}] {level}: {message}"
-        self.youtube_log.insert(tk.END, log_message + "\n")
-        self.youtube_log.see(tk.END)
-        self.root.update_idletasks()
+        self._log('youtube_log', message, level)
     
     def audio_log_message(self, message, level="INFO"):
         """Log específico para audio"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        log_message = f"[{timestamp}] {level}: {message}"
-        self.audio_log.insert(tk.END, log_message + "\n")
-        self.audio_log.see(tk.END)
-        self.root.update_idletasks()
+        self._log('audio_log', message, level)
     
     def conversion_log_message(self, message, level="INFO"):
         """Log específico para conversión"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        log_message = f"[{timestamp}] {level}: {message}"
-        self.conversion_log.insert(tk.END, log_message + "\n")
-        self.conversion_log.see(tk.END)
-        self.root.update_idletasks()
+        self._log('conversion_log', message, level)
+
+    def _now_ts(self) -> str:
+        """Hora actual formateada, reutilizada mientras no cambie el segundo"""
+        now = int(time.time())
+        if self._ts_cache[0] != now:
+            self._ts_cache[0] = now; self._ts_cache[1] = time.strftime("%H:%M:%S", time.localtime(now))
+        return self._ts_cache[1]
+
+    def _flush_logs(self):
+        """Volcar los buffers de log pendientes con un solo insert por panel"""
+        flushed = False
+        self.sampled_progress.apply()
+        with self._panels_log_lock:
+            if self._panels_log_pending and not self._panels_log_file.closed:
+                self._panels_log_file.flush()
+                self._panels_log_pending = False
+        for name, buffer in self._log_buffers.items():
+            widget = getattr(self, name, None)
+            if not buffer or widget is None: continue
+            flushed = True
+            lines = []
+            while buffer: lines.append(buffer.popleft())
+            widget.configure(state='normal')
+            widget.insert(tk.END, "".join(lines))
+            # Recortar el historial para acotar el coste de redibujado
+            line_count = int(widget.index('end-1c').split('.')[0])
+            if line_count > self._max_log_lines: widget.delete('1.0', f'{line_count - self._max_log_lines}.0')
+            widget.configure(state='disabled')
+            widget.see(tk.END)
+        self.root.after(LOG_FLUSH_INTERVAL_MS if flushed else LOG_FLUSH_IDLE_INTERVAL_MS, self._flush_logs)
 
     def clear_log(self):
         """Limpiar el log"""
-        self.log_text.delete(1.0, tk.END)
+        self.log_text.configure(state='normal'); self.log_text.delete(1.0, tk.END); self.log_text.configure(state='disabled')
     
     def test_tmdb_api(self):
         """Probar conexión con TMDB API"""
@@ -783,25 +895,38 @@ Procesamiento completado: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
         if not self.source_folder.get(): messagebox.showerror("Error", "Selecciona la carpeta origen"); return
         def scan_thread():
             try:
-                source_path = Path(self.source_folder.get()); video_extensions = set(self.config_manager.get('video_extensions', []))
+                source_path = Path(self.source_folder.get()); video_extensions = self.config_manager.get('video_extensions', [])
                 self.log("Iniciando escaneo de videos...")
-                videos_found = [file_path for file_path in source_path.rglob('*') if file_path.is_file() and file_path.suffix.lower() in video_extensions]
+                videos_found = []
+                for file_path in iter_video_files(source_path, video_extensions):
+                    if self._cancel.is_set(): self.log("Escaneo cancelado", "WARNING"); return
+                    videos_found.append(file_path)
                 self.log(f"Encontrados {len(videos_found)} archivos de video")
-                preview_text = "VISTA PREVIA DEL ANÁLISIS\n" + "="*50 + "\n\n"; counts = {'movies': 0, 'series': 0, 'extras': 0, 'problematic': 0}
+                parts = ["VISTA PREVIA DEL ANÁLISIS\n", "="*50, "\n\n"]; counts = {'movies': 0, 'series': 0, 'extras': 0, 'problematic': 0}
                 for i, video_path in enumerate(videos_found[:20]):
+                    if self._cancel.is_set(): break
                     video_info = self.video_analyzer.extract_video_info(video_path.name, str(video_path))
                     if video_info:
-                        preview_text += f"{i+1}. {video_path.name}\n"; preview_text += f"   Tipo: {video_info['type']}\n"; preview_text += f"   Título: {video_info['title']}\n"
+                        parts.append(f"{i+1}. {video_path.name}\n"); parts.append(f"   Tipo: {video_info['type']}\n"); parts.append(f"   Título: {video_info['title']}\n")
                         counts[video_info['type']] += 1
-                        if video_info['type'] == 'series': preview_text += f"   Temporada: {video_info.get('season', 'N/A')}\n"; preview_text += f"   Episodio: {video_info.get('episode', 'N/A')}\n"
-                        preview_text += "\n"
-                    else: counts['problematic'] += 1; preview_text += f"{i+1}. ❌ {video_path.name}\n"; preview_text += "   No se pudo extraer información\n\n"
-                if len(videos_found) > 20: preview_text += f"... y {len(videos_found) - 20} archivos más\n\n"
-                preview_text += "RESUMEN\n" + "="*20 + "\n"; preview_text += f"Películas: {counts['movies']}\n"; preview_text += f"Series: {counts['series']}\n"
-                preview_text += f"Extras: {counts['extras']}\n"; preview_text += f"Problemáticos: {counts['problematic']}\n"; preview_text += f"Total: {len(videos_found)}\n"
-                self.preview_text.delete(1.0, tk.END); self.preview_text.insert(1.0, preview_text); self.log("Escaneo completado")
+                        if video_info['type'] == 'series': parts.append(f"   Temporada: {video_info.get('season', 'N/A')}\n"); parts.append(f"   Episodio: {video_info.get('episode', 'N/A')}\n")
+                        parts.append("\n")
+                    else: counts['problematic'] += 1; parts.append(f"{i+1}. ❌ {video_path.name}\n"); parts.append("   No se pudo extraer información\n\n")
+                if len(videos_found) > 20: parts.append(f"... y {len(videos_found) - 20} archivos más\n\n")
+                parts += ["RESUMEN\n", "="*20, "\n"]; parts.append(f"Películas: {counts['movies']}\n"); parts.append(f"Series: {counts['series']}\n")
+                parts.append(f"Extras: {counts['extras']}\n"); parts.append(f"Problemáticos: {counts['problematic']}\n"); parts.append(f"Total: {len(videos_found)}\n")
+                # Los widgets de Tk solo se tocan desde el hilo principal
+                self.root.after(0, self._show_preview, ''.join(parts)); self.log("Escaneo completado")
             except Exception as e: self.log(f"Error durante el escaneo: {str(e)}", "ERROR")
-        threading.Thread(target=scan_thread, daemon=True).start()
+        self._start_worker(scan_thread)
+    
+    def _show_preview(self, text):
+        """Sustituir el contenido de la vista previa (llamar desde el hilo de Tk)"""
+        self.preview_text.delete(1.0, tk.END); self.preview_text.insert(1.0, text)
+    
+    def _persist_config(self, config_updates) -> bool:
+        """Aplicar cambios de un botón Guardar y escribirlos a disco en el acto"""
+        return self.config_manager.save_config(config_updates) and self.config_manager.flush()
     
     def save_config(self):
         """Guardar configuración actual"""
@@ -811,7 +936,9 @@ Procesamiento completado: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
                 'min_confidence': self.confidence_var.get(), 'min_tmdb_score': self.tmdb_score_var.get(),
                 'capture_frames': self.frames_var.get()
             }
-            if self.config_manager.save_config(config_updates): messagebox.showinfo("Éxito", "Configuración guardada correctamente")
+            saved = self._persist_config(config_updates)
+            self.youtube_manager.refresh_config()
+            if saved: messagebox.showinfo("Éxito", "Configuración guardada correctamente")
             else: messagebox.showerror("Error", "Error guardando configuración")
         except Exception as e: messagebox.showerror("Error", f"Error guardando configuración: {str(e)}")
     
@@ -820,11 +947,13 @@ Procesamiento completado: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
         config_file = filedialog.askopenfilename(title="Seleccionar archivo de configuración", filetypes=[("JSON", "*.json")])
         if config_file:
             try:
-                with open(config_file, 'r', encoding='utf-8') as f: loaded_config = json.load(f)
+                # Lectura en un solo bloque; las claves de la UI se leen directamente del dict cargado
+                with open(config_file, 'r', encoding='utf-8', buffering=65536) as f: loaded_config = json.load(f)
+                self.tmdb_key_var.set(loaded_config.get('tmdb_api_key', self.tmdb_key_var.get())); self.tvdb_key_var.set(loaded_config.get('thetvdb_api_key', self.tvdb_key_var.get()))
+                self.confidence_var.set(loaded_config.get('min_confidence', self.confidence_var.get())); self.tmdb_score_var.set(loaded_config.get('min_tmdb_score', self.tmdb_score_var.get()))
+                self.frames_var.set(loaded_config.get('capture_frames', self.frames_var.get()))
                 self.config_manager.update(loaded_config)
-                self.tmdb_key_var.set(self.config_manager.get('tmdb_api_key', '')); self.tvdb_key_var.set(self.config_manager.get('thetvdb_api_key', ''))
-                self.confidence_var.set(self.config_manager.get('min_confidence', 0.7)); self.tmdb_score_var.set(self.config_manager.get('min_tmdb_score', 0.8))
-                self.frames_var.set(self.config_manager.get('capture_frames', 30))
+                self.youtube_manager.refresh_config()
                 messagebox.showinfo("Éxito", "Configuración cargada correctamente")
             except Exception as e: messagebox.showerror("Error", f"Error cargando configuración: {str(e)}")
     
@@ -837,7 +966,7 @@ Procesamiento completado: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
     def save_jellyfin_config(self):
         """Guardar configuración de Jellyfin"""
         config_updates = { 'jellyfin_url': self.jellyfin_url_var.get(), 'jellyfin_api_key': self.jellyfin_api_key_var.get(), 'jellyfin_user_id': self.jellyfin_user_id_var.get() }
-        if self.config_manager.save_config(config_updates): messagebox.showinfo("Éxito", "Configuración de Jellyfin guardada")
+        if self._persist_config(config_updates): messagebox.showinfo("Éxito", "Configuración de Jellyfin guardada")
         else: messagebox.showerror("Error", "Error guardando configuración")
     
     def get_jellyfin_library(self):
@@ -845,7 +974,7 @@ Procesamiento completado: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
         def get_library_thread():
             content = self.jellyfin_client.get_all_content()
             self.jellyfin_log_message(f"Biblioteca obtenida: {content['total_movies']} películas, {content['total_series']} series")
-        threading.Thread(target=get_library_thread, daemon=True).start()
+        self._start_worker(get_library_thread)
     
     def get_jellyfin_actors(self):
         """Obtener actores de la biblioteca Jellyfin"""
@@ -853,7 +982,7 @@ Procesamiento completado: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
             actors = self.jellyfin_client.get_actors_from_library()
             self.jellyfin_log_message(f"Actores encontrados: {len(actors)}")
             for i, actor in enumerate(actors[:20]): self.jellyfin_log_message(f"  {i+1}. {actor}")
-        threading.Thread(target=get_actors_thread, daemon=True).start()
+        self._start_worker(get_actors_thread)
     
     def check_missing_metadata(self):
         """Verificar metadatos faltantes"""
@@ -861,7 +990,7 @@ Procesamiento completado: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
             missing = self.jellyfin_client.get_missing_metadata_items()
             self.jellyfin_log_message(f"Elementos con metadatos incompletos: {len(missing)}")
             for item in missing[:10]: self.jellyfin_log_message(f"  {item['name']}: {', '.join(item['issues'])}")
-        threading.Thread(target=check_metadata_thread, daemon=True).start()
+        self._start_worker(check_metadata_thread)
     
     def trigger_jellyfin_scan(self):
         """Disparar escaneo de biblioteca"""
@@ -872,7 +1001,7 @@ Procesamiento completado: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
     def save_youtube_config(self):
         """Guardar configuración de YouTube"""
         config_updates = { 'youtube_quality': self.youtube_quality_var.get() }
-        if self.config_manager.save_config(config_updates): messagebox.showinfo("Éxito", "Configuración de YouTube guardada")
+        if self._persist_config(config_updates): messagebox.showinfo("Éxito", "Configuración de YouTube guardada")
         else: messagebox.showerror("Error", "Error guardando configuración")
 
     def check_ytdlp(self):
@@ -901,12 +1030,15 @@ Procesamiento completado: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
                 if trailer_path: self.youtube_log_message(f"✅ Trailer descargado: {trailer_path}")
                 else: self.youtube_log_message(f"❌ No se pudo descargar trailer para: {movie_title}", "ERROR")
             except Exception as e: self.youtube_log_message(f"❌ Error: {e}", "ERROR")
-        threading.Thread(target=download_thread, daemon=True).start()
+        self._start_worker(download_thread)
 
     def save_audio_config(self):
         """Guardar configuración de audio"""
-        config_updates = { 'whisper_model': self.whisper_model_var.get(), 'audio_language': self.audio_language_var.get() }
-        if self.config_manager.save_config(config_updates): messagebox.showinfo("Éxito", "Configuración de audio guardada")
+        config_updates = {
+            'whisper_model': self.whisper_model_var.get(), 'audio_language': self.audio_language_var.get(),
+            'enable_audio_analysis': self.enable_audio_analysis_var.get(), 'enable_subtitle_search': self.enable_subtitle_search_var.get()
+        }
+        if self._persist_config(config_updates): messagebox.showinfo("Éxito", "Configuración de audio guardada")
         else: messagebox.showerror("Error", "Error guardando configuración")
     
     def test_whisper(self):
@@ -918,7 +1050,7 @@ Procesamiento completado: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
                 model = whisper.load_model(model_name); self.audio_log_message(f"Modelo {model_name} cargado exitosamente")
             except ImportError: self.audio_log_message("Whisper no está instalado. Ejecuta: pip install openai-whisper", "ERROR")
             except Exception as e: self.audio_log_message(f"Error probando Whisper: {e}", "ERROR")
-        threading.Thread(target=test_thread, daemon=True).start()
+        self._start_worker(test_thread)
     
     def test_audio_analysis(self):
         """Probar análisis de audio en un video"""
@@ -933,7 +1065,7 @@ Procesamiento completado: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
                     self.audio_log_message(f"Confianza: {result['confidence_score']:.2f}")
                 else: self.audio_log_message("No se pudo identificar la película por audio", "WARNING")
             except Exception as e: self.audio_log_message(f"Error en análisis de audio: {e}", "ERROR")
-        threading.Thread(target=analyze_thread, daemon=True).start()
+        self._start_worker(analyze_thread)
     
     def test_opensubtitles_search(self):
         """Probar búsqueda en OpenSubtitles"""
@@ -947,7 +1079,7 @@ Procesamiento completado: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
                     for i, result in enumerate(results): self.audio_log_message(f"  {i+1}. {result['title']} ({result['year']})")
                 else: self.audio_log_message(f"No se encontraron resultados para: '{query}'", "WARNING")
             except Exception as e: self.audio_log_message(f"Error en búsqueda: {e}", "ERROR")
-        threading.Thread(target=search_thread, daemon=True).start()
+        self._start_worker(search_thread)
     
     def save_conversion_config(self):
         """Guardar configuración de conversión"""
@@ -955,7 +1087,7 @@ Procesamiento completado: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
             'target_video_codec': self.video_codec_var.get(), 'video_quality_preset': self.video_quality_var.get(),
             'max_video_bitrate': self.max_bitrate_var.get(), 'enable_video_conversion': self.enable_conversion_var.get()
         }
-        if self.config_manager.save_config(config_updates): messagebox.showinfo("Éxito", "Configuración de conversión guardada")
+        if self._persist_config(config_updates): messagebox.showinfo("Éxito", "Configuración de conversión guardada")
         else: messagebox.showerror("Error", "Error guardando configuración")
     
     def check_ffmpeg(self):
@@ -979,7 +1111,7 @@ Procesamiento completado: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
                 if success: messagebox.showinfo("Éxito", "Video convertido exitosamente")
                 else: messagebox.showerror("Error", "Error durante la conversión")
             except Exception as e: self.conversion_log_message(f"Error en conversión: {e}", "ERROR")
-        threading.Thread(target=convert_thread, daemon=True).start()
+        self._start_worker(convert_thread)
     
     def batch_convert_videos(self):
         """Conversión en lote de videos"""
@@ -987,15 +1119,14 @@ Procesamiento completado: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
         if not folder: return
         def batch_convert_thread():
             try:
-                folder_path = Path(folder); video_extensions = set(self.config_manager.get('video_extensions', []))
-                videos_found = [file_path for file_path in folder_path.rglob('*') if file_path.is_file() and file_path.suffix.lower() in video_extensions]
+                videos_found = list(iter_video_files(folder, self.config_manager.get('video_extensions', [])))
                 if not videos_found: self.conversion_log_message("No se encontraron videos en la carpeta", "WARNING"); return
                 self.conversion_log_message(f"Iniciando conversión en lote: {len(videos_found)} videos")
                 def progress_callback(progress, message=""): self.conversion_log_message(f"Progreso: {progress:.1f}% - {message}")
-                stats = self.video_converter.batch_convert_videos(videos_found, progress_callback)
-                messagebox.showinfo("Completado", f"Conversión en lote completada:\nConvertidos: {stats['converted']}\nOmitidos: {stats['skipped']}\nFallidos: {stats['failed']}")
+                stats = self.video_converter.batch_convert_videos(videos_found, progress_callback, cancel_event=self._cancel)
+                messagebox.showinfo("Completado", f"Conversión en lote completada:\nConvertidos: {stats['converted']}\nOmitidos: {stats['skipped']}\nFallidos: {stats['failed']}\nCancelados: {stats['cancelled']}")
             except Exception as e: self.conversion_log_message(f"Error en conversión en lote: {e}", "ERROR")
-        threading.Thread(target=batch_convert_thread, daemon=True).start()
+        self._start_worker(batch_convert_thread)
     
     def check_video_integrity(self):
         """Verificar integridad de videos"""
@@ -1003,12 +1134,13 @@ Procesamiento completado: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
         if not folder: return
         def check_integrity_thread():
             try:
-                folder_path = Path(folder); video_extensions = set(self.config_manager.get('video_extensions', []))
-                videos_found = [file_path for file_path in folder_path.rglob('*') if file_path.is_file() and file_path.suffix.lower() in video_extensions]
+                # Sin tamaño mínimo: los archivos truncados son justo los que hay que señalar
+                videos_found = list(iter_video_files(folder, self.config_manager.get('video_extensions', []), min_size=0))
                 if not videos_found: self.conversion_log_message("No se encontraron videos en la carpeta", "WARNING"); return
                 self.conversion_log_message(f"Verificando integridad de {len(videos_found)} videos...")
                 corrupted_count = 0
                 for i, video_path in enumerate(videos_found):
+                    if self._cancel.is_set(): self.conversion_log_message("Verificación cancelada", "WARNING"); return
                     try:
                         self.conversion_log_message(f"Verificando {i+1}/{len(videos_found)}: {video_path.name}")
                         if not self.video_converter.verify_video_integrity(video_path): corrupted_count += 1
@@ -1016,7 +1148,7 @@ Procesamiento completado: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
                 if corrupted_count > 0: messagebox.showwarning("Advertencia", f"Se encontraron {corrupted_count} videos corruptos")
                 else: messagebox.showinfo("Éxito", "Todos los videos están íntegros")
             except Exception as e: self.conversion_log_message(f"Error en verificación: {e}", "ERROR")
-        threading.Thread(target=check_integrity_thread, daemon=True).start()
+        self._start_worker(check_integrity_thread)
 
     def refresh_db_stats(self):
         """Actualizar estadísticas de la base de datos"""
@@ -1078,7 +1210,7 @@ DESGLOSE POR TIPO:
                 self.db_builder_log_message(f"Error en construcción: {e}", "ERROR"); messagebox.showerror("Error", f"Error durante la construcción: {e}")
             finally:
                 self.db_start_btn.configure(state='normal'); self.db_pause_btn.configure(state='disabled'); self.db_stop_btn.configure(state='disabled')
-        threading.Thread(target=construction_thread, daemon=True).start()
+        self._start_worker(construction_thread)
 
     def pause_db_construction(self):
         """Pausar/Reanudar construcción"""
@@ -1103,7 +1235,7 @@ DESGLOSE POR TIPO:
             success = self.actors_manager.download_popular_actors(num_actors, photos_per_actor)
             if success: self.actors_log_message("Descarga completada exitosamente!")
             else: self.actors_log_message("Error en la descarga", "ERROR")
-        threading.Thread(target=download_thread, daemon=True).start()
+        self._start_worker(download_thread)
     
     def download_specific_actor(self):
         """Descargar actor específico"""
@@ -1113,7 +1245,7 @@ DESGLOSE POR TIPO:
             success = self.actors_manager.download_specific_actor(actor_name)
             if success: self.actors_log_message(f"Actor {actor_name} descargado exitosamente!")
             else: self.actors_log_message(f"Error descargando {actor_name}", "ERROR")
-        threading.Thread(target=download_thread, daemon=True).start()
+        self._start_worker(download_thread)
     
     def train_face_recognition_model(self):
         """Entrenar modelo de reconocimiento facial"""
@@ -1123,7 +1255,7 @@ DESGLOSE POR TIPO:
                 self.video_analyzer.actors_db = self.video_analyzer.load_actors_database()
                 self.actors_log_message("Modelo entrenado exitosamente!")
             else: self.actors_log_message("Error en el entrenamiento", "ERROR")
-        threading.Thread(target=train_thread, daemon=True).start()
+        self._start_worker(train_thread)
     
     def test_face_recognition(self):
         """Probar reconocimiento facial en un video"""
@@ -1137,11 +1269,13 @@ DESGLOSE POR TIPO:
                 analysis_result = self.video_analyzer.analyze_video_with_ai(Path(video_file))
                 detected_actors = analysis_result.get('detected_actors', [])
                 if detected_actors:
-                    unique_actors = list(set(detected_actors))
-                    self.actors_log_message(f"Actores detectados: {', '.join(unique_actors)}")
+                    # Counter deduplica conservando el orden de aparición y aporta las apariciones
+                    counts = Counter(detected_actors)
+                    self.actors_log_message(f"Actores detectados: {', '.join(counts)}")
+                    for actor, count in counts.items(): self.actors_log_message(f"   {actor}: {count} apariciones")
                 else: self.actors_log_message("No se detectaron actores conocidos")
             except Exception as e: self.actors_log_message(f"Error en prueba: {str(e)}", "ERROR")
-        threading.Thread(target=test_thread, daemon=True).start()
+        self._start_worker(test_thread)
     
     def show_actors_database(self):
         """Mostrar información de la base de datos actual"""
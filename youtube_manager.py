@@ -6,21 +6,102 @@ Incluye autenticación con Google y descarga de videos
 import os
 import json
 import subprocess
+import shutil
 import logging
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from pathlib import Path
 from typing import Optional, Dict, List
 import webbrowser
 import threading
 import time
+import hmac
+import secrets
+import re
+from collections import deque
 from urllib.parse import urlencode, parse_qs, urlparse
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+# Tiempo máximo de espera de las peticiones HTTP (segundos)
+HTTP_TIMEOUT = 10
+
+# Margen (segundos) con el que se renueva el access token antes de que caduque
+TOKEN_EXPIRY_MARGIN = 60
+
+# Tiempo máximo de una descarga de yt-dlp (segundos)
+YTDLP_DOWNLOAD_TIMEOUT = 180
+
+# Porcentaje de las líneas "[download] 45.2% of ..." de yt-dlp
+_DOWNLOAD_PERCENT_RE = re.compile(r'(\d+(?:\.\d+)?)%')
+
+# Tiempo máximo de espera del callback OAuth en el navegador (segundos)
+OAUTH_CALLBACK_TIMEOUT = 120
+
+_OAUTH_SUCCESS_PAGE = """<html>
+<body>
+<h2>Autenticación exitosa!</h2>
+<p>Puedes cerrar esta ventana y volver a VideoSort Pro.</p>
+</body>
+</html>
+"""
+
+_OAUTH_ERROR_PAGE = """<html>
+<body>
+<h2>Error en autenticación</h2>
+<p>No se pudo obtener el código de autorización.</p>
+</body>
+</html>
+"""
+
+class _OAuthHandler(BaseHTTPRequestHandler):
+    """Atiende la redirección de Google y deja el código en self.server.auth_code.
+
+    Solo se acepta si el parámetro state coincide con self.server.expected_state.
+    """
+    
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query) if parsed.path == '/oauth/callback' else {}
+        auth_code = query.get('code', [None])[0]
+        state = query.get('state', [''])[0]
+        expected_state = getattr(self.server, 'expected_state', None)
+        # Un callback sin el state generado para este flujo puede venir de otra página: se rechaza
+        state_ok = bool(expected_state) and hmac.compare_digest(state.encode(), expected_state.encode())
+        
+        if auth_code and state_ok:
+            self.server.auth_code = auth_code
+            self.send_response(200)
+            page = _OAUTH_SUCCESS_PAGE
+        else:
+            self.send_response(400)
+            page = _OAUTH_ERROR_PAGE
+        
+        body = page.encode('utf-8')
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, *args):
+        # Sin el log por stderr de cada petición
+        pass
 
 class YouTubeManager:
     def __init__(self, config_manager, progress_callback=None):
         self.config_manager = config_manager
         self.progress_callback = progress_callback
-        self.access_token = None
-        self.is_authenticated = False
+        
+        # Sesión persistente para Google y TMDB (keep-alive: sin un handshake TLS por llamada)
+        self.http = requests.Session()
+        retries = Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+        self.http.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retries))
+        # Access token cacheado con su caducidad (hora de reloj, persistida en la configuración)
+        self.access_token = config_manager.get("youtube_access_token")
+        self.token_expires_at = float(config_manager.get("youtube_token_expires_at", 0.0) or 0.0)
+        self.is_authenticated = bool(self.access_token) and time.time() < self.token_expires_at
+        # Ejecutable yt-dlp resuelto en la primera descarga ("" = no encontrado)
+        self.ytdlp_path = None
         
         # YouTube OAuth endpoints
         self.auth_url = "https://accounts.google.com/o/oauth2/auth"
@@ -36,6 +117,12 @@ class YouTubeManager:
         self.client_id = "your_client_id_here.apps.googleusercontent.com"
         self.client_secret = "your_client_secret_here"
         self.redirect_uri = "http://localhost:8080/oauth/callback"
+        # Valor anti-CSRF del flujo OAuth en curso (lo genera get_auth_url)
+        self._oauth_state = None
+    
+    def close(self):
+        """Cerrar las conexiones abiertas de la sesión HTTP"""
+        self.http.close()
     
     def log_progress(self, message: str, level: str = "INFO"):
         """Enviar mensaje de progreso"""
@@ -56,100 +143,76 @@ class YouTubeManager:
         self.log_progress("Credenciales OAuth configuradas")
     
     def get_auth_url(self) -> str:
-        """Generar URL de autenticación"""
+        """Generar URL de autenticación (con un state nuevo que el callback debe devolver)"""
+        self._oauth_state = secrets.token_urlsafe(24)
         params = {
             "client_id": self.client_id,
             "redirect_uri": self.redirect_uri,
             "scope": " ".join(self.scopes),
             "response_type": "code",
             "access_type": "offline",
-            "prompt": "consent"
+            "prompt": "consent",
+            "state": self._oauth_state
         }
         
         return f"{self.auth_url}?{urlencode(params)}"
     
-    def start_oauth_flow(self):
-        """Iniciar flujo de autenticación OAuth"""
+    def start_oauth_flow(self, on_complete=None) -> Optional[threading.Thread]:
+        """Iniciar flujo de autenticación OAuth sin bloquear al llamador.
+
+        La espera del callback y el canje del código se hacen en un hilo; al terminar se llama a
+        on_complete(autenticado) desde ese hilo (la UI debe reenviarlo a su hilo, p. ej. con root.after).
+        """
         try:
             auth_url = self.get_auth_url()
             self.log_progress("Iniciando autenticación con Google...")
             self.log_progress(f"Abriendo navegador: {auth_url}")
             
+            # El servidor local escucha antes de abrir el navegador para no perder la redirección
+            server = HTTPServer(('localhost', 8080), _OAuthHandler)
+            
             # Abrir navegador
             webbrowser.open(auth_url)
             
-            # Iniciar servidor local para recibir callback
-            self.start_callback_server()
+            # Esperar el callback en segundo plano (acotado por OAUTH_CALLBACK_TIMEOUT)
+            thread = threading.Thread(target=self._wait_for_authorization, args=(server, on_complete),
+                                      name="oauth-callback", daemon=True)
+            thread.start()
+            return thread
             
         except Exception as e:
             self.log_progress(f"Error iniciando OAuth: {e}", "ERROR")
+            return None
     
-    def start_callback_server(self):
-        """Iniciar servidor simple para recibir callback OAuth"""
-        import socket
-        import urllib.parse
-        
+    def _wait_for_authorization(self, server: HTTPServer, on_complete=None):
+        """Cuerpo del hilo de OAuth: recibir el callback y avisar del resultado"""
+        self.start_callback_server(server)
+        if on_complete:
+            on_complete(self.is_authenticated)
+    
+    def start_callback_server(self, server: Optional[HTTPServer] = None):
+        """Esperar en el servidor local el callback OAuth (como máximo OAUTH_CALLBACK_TIMEOUT)"""
         try:
-            # Crear socket servidor
-            server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            server_socket.bind(('localhost', 8080))
-            server_socket.listen(1)
+            if server is None:
+                server = HTTPServer(('localhost', 8080), _OAuthHandler)
+            server.auth_code = None
+            server.expected_state = self._oauth_state
+            server.timeout = 1
             
             self.log_progress("Esperando autorización... (revisa tu navegador)")
             
-            # Esperar conexión
-            client_socket, address = server_socket.accept()
+            # Atender peticiones hasta recibir el código (el navegador puede pedir antes otras rutas)
+            deadline = time.monotonic() + OAUTH_CALLBACK_TIMEOUT
+            while server.auth_code is None and time.monotonic() < deadline:
+                server.handle_request()
             
-            # Leer request
-            request = client_socket.recv(1024).decode('utf-8')
+            server.server_close()
             
-            # Extraer código de autorización
-            if "GET /oauth/callback" in request:
-                # Parsear URL para obtener código
-                lines = request.split('\n')
-                get_line = lines[0]
-                url_part = get_line.split(' ')[1]
-                
-                if '?code=' in url_part:
-                    parsed = urlparse(f"http://localhost:8080{url_part}")
-                    query_params = parse_qs(parsed.query)
-                    auth_code = query_params.get('code', [None])[0]
-                    
-                    if auth_code:
-                        # Enviar respuesta al navegador
-                        response = """HTTP/1.1 200 OK
-Content-Type: text/html
-
-<html>
-<body>
-<h2>Autenticación exitosa!</h2>
-<p>Puedes cerrar esta ventana y volver a VideoSort Pro.</p>
-</body>
-</html>
-"""
-                        client_socket.send(response.encode())
-                        client_socket.close()
-                        server_socket.close()
-                        
-                        # Intercambiar código por tokens
-                        self.exchange_code_for_tokens(auth_code)
-                        return
-            
-            # Si llegamos aquí, algo salió mal
-            error_response = """HTTP/1.1 400 Bad Request
-Content-Type: text/html
-
-<html>
-<body>
-<h2>Error en autenticación</h2>
-<p>No se pudo obtener el código de autorización.</p>
-</body>
-</html>
-"""
-            client_socket.send(error_response.encode())
-            client_socket.close()
-            server_socket.close()
+            if server.auth_code:
+                # Intercambiar código por tokens
+                self.exchange_code_for_tokens(server.auth_code)
+            else:
+                self.log_progress("No se recibió la autorización a tiempo", "WARNING")
             
         except Exception as e:
             self.log_progress(f"Error en servidor callback: {e}", "ERROR")
@@ -165,20 +228,17 @@ Content-Type: text/html
                 "redirect_uri": self.redirect_uri
             }
             
-            response = requests.post(self.token_url, data=data)
+            response = self.http.post(self.token_url, data=data, timeout=HTTP_TIMEOUT)
             response.raise_for_status()
             
             tokens = response.json()
             
-            self.access_token = tokens.get("access_token")
             refresh_token = tokens.get("refresh_token")
-            
             if refresh_token:
                 # Guardar refresh token para uso futuro
                 self.config_manager.set("youtube_refresh_token", refresh_token)
-                self.config_manager.save_config()
+            self._store_access_token(tokens)
             
-            self.is_authenticated = True
             self.log_progress("Autenticación exitosa con YouTube!")
             
         except Exception as e:
@@ -199,12 +259,11 @@ Content-Type: text/html
                 "grant_type": "refresh_token"
             }
             
-            response = requests.post(self.token_url, data=data)
+            response = self.http.post(self.token_url, data=data, timeout=HTTP_TIMEOUT)
             response.raise_for_status()
             
             tokens = response.json()
-            self.access_token = tokens.get("access_token")
-            self.is_authenticated = True
+            self._store_access_token(tokens)
             
             self.log_progress("Token renovado exitosamente")
             return True
@@ -213,13 +272,30 @@ Content-Type: text/html
             self.log_progress(f"Error renovando token: {e}", "ERROR")
             return False
     
+    def _store_access_token(self, tokens: Dict):
+        """Guardar el access token recibido y calcular cuándo hay que renovarlo"""
+        self.access_token = tokens.get("access_token")
+        expires_in = int(tokens.get("expires_in", 3600))
+        self.token_expires_at = time.time() + expires_in - TOKEN_EXPIRY_MARGIN
+        self.is_authenticated = bool(self.access_token)
+        
+        # Persistir para no gastar una renovación al reiniciar la aplicación
+        self.config_manager.set("youtube_access_token", self.access_token)
+        self.config_manager.set("youtube_token_expires_at", self.token_expires_at)
+        self.config_manager.save_config()
+    
+    def _ensure_token(self) -> bool:
+        """Renovar el access token solo si falta o está a punto de caducar"""
+        if self.access_token and time.time() < self.token_expires_at:
+            return True
+        return self.refresh_access_token()
+    
     def search_trailer(self, movie_title: str, year: str = None) -> Optional[str]:
         """Buscar trailer en YouTube"""
         try:
-            if not self.is_authenticated:
-                if not self.refresh_access_token():
-                    self.log_progress("No autenticado con YouTube", "ERROR")
-                    return None
+            if not self._ensure_token():
+                self.log_progress("No autenticado con YouTube", "ERROR")
+                return None
             
             # Construir query de búsqueda
             query = f"{movie_title} trailer"
@@ -239,10 +315,11 @@ Content-Type: text/html
                 "Authorization": f"Bearer {self.access_token}"
             }
             
-            response = requests.get(
+            response = self.http.get(
                 f"{self.youtube_api_url}/search",
                 params=params,
-                headers=headers
+                headers=headers,
+                timeout=HTTP_TIMEOUT
             )
             response.raise_for_status()
             
@@ -274,39 +351,73 @@ Content-Type: text/html
     def download_video(self, video_url: str, output_path: Path, quality: str = "480p") -> bool:
         """Descargar video usando yt-dlp"""
         try:
-            # Verificar que yt-dlp esté instalado
-            try:
-                subprocess.run(["yt-dlp", "--version"], 
-                              capture_output=True, check=True)
-            except (subprocess.CalledProcessError, FileNotFoundError):
+            # Verificar que yt-dlp esté instalado (solo en la primera descarga)
+            if self.ytdlp_path is None:
+                self.ytdlp_path = shutil.which("yt-dlp") or ""
+            if not self.ytdlp_path:
                 self.log_progress("yt-dlp no está instalado. Instálalo con: pip install yt-dlp", "ERROR")
                 return False
             
             # Configurar opciones de descarga
             cmd = [
-                "yt-dlp",
+                self.ytdlp_path,
                 "--format", f"best[height<={quality[:-1]}]",  # 480p -> 480
                 "--output", str(output_path / "%(title)s.%(ext)s"),
                 "--no-playlist",
+                # Solo el video en la carpeta de salida
+                "--no-write-subs", "--no-write-info-json",
+                "--newline", "--progress",
                 video_url
             ]
             
             self.log_progress(f"Descargando: {video_url}")
             
-            # Ejecutar descarga
-            result = subprocess.run(cmd, capture_output=True, text=True)
+            # Ejecutar descarga mostrando el progreso
+            returncode, messages = self._run_download(cmd)
             
-            if result.returncode == 0:
+            if returncode == 0:
                 self.log_progress("Descarga completada exitosamente")
                 return True
             else:
-                self.log_progress(f"Error en descarga: {result.stderr}", "ERROR")
+                self.log_progress(f"Error en descarga: {' | '.join(messages)}", "ERROR")
                 return False
                 
         except Exception as e:
             self.log_progress(f"Error descargando video: {e}", "ERROR")
             return False
     
+    def _run_download(self, cmd: List[str]):
+        """Ejecutar yt-dlp leyendo su salida línea a línea (progreso al callback, memoria constante)"""
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1, errors='replace')
+        # La lectura de la salida no tiene timeout: si se excede, el temporizador termina el proceso
+        watchdog = threading.Timer(YTDLP_DOWNLOAD_TIMEOUT, proc.kill)
+        watchdog.start()
+        messages = deque(maxlen=5)
+        reported = -1
+        try:
+            for line in proc.stdout:
+                line = line.strip()
+                match = _DOWNLOAD_PERCENT_RE.search(line) if line.startswith("[download]") else None
+                if match:
+                    # Solo cada 10% del avance
+                    decile = int(float(match.group(1))) // 10
+                    if decile > reported:
+                        reported = decile
+                        self.log_progress(line)
+                elif line:
+                    messages.append(line)
+            returncode = proc.wait()
+        finally:
+            timed_out = not watchdog.is_alive()
+            watchdog.cancel()
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            proc.stdout.close()
+        if timed_out:
+            raise subprocess.TimeoutExpired(cmd, YTDLP_DOWNLOAD_TIMEOUT)
+        return returncode, list(messages)
+    
     def get_trailer_from_tmdb(self, tmdb_id: str, tmdb_client) -> Optional[str]:
         """Obtener URL de trailer desde TMDB"""
         try:
@@ -317,7 +428,7 @@ Content-Type: text/html
                 "language": "en-US"
             }
             
-            response = requests.get(videos_url, params=params)
+            response = self.http.get(videos_url, params=params, timeout=HTTP_TIMEOUT)
             response.raise_for_status()
             
             data = response.json()
@@ -367,10 +478,8 @@ Content-Type: text/html
             temp_dir.mkdir(exist_ok=True)
             
             if self.download_video(trailer_url, temp_dir):
-                # Buscar archivo descargado
-                downloaded_files = list(temp_dir.glob("*"))
-                if downloaded_files:
-                    return downloaded_files[0]  # Retornar primer archivo encontrado
+                # Buscar archivo descargado (el primero basta, sin listar todo el directorio)
+                return next((path for path in temp_dir.iterdir() if path.is_file()), None)
             
             return None
             
@@ -382,13 +491,10 @@ Content-Type: text/html
         """Limpiar archivos temporales"""
         try:
             if temp_dir.exists():
-                for file in temp_dir.iterdir():
-                    if file.is_file():
-                        file.unlink()
-                        self.log_progress(f"Archivo temporal eliminado: {file.name}")
-                
-                temp_dir.rmdir()
-                self.log_progress("Limpieza de archivos temporales completada")
+                # Un único mensaje al terminar en vez de uno por archivo
+                removed = sum(1 for _ in temp_dir.iterdir())
+                shutil.rmtree(temp_dir, ignore_errors=True)
+                self.log_progress(f"Limpieza de archivos temporales completada ({removed} archivos)")
                 
         except Exception as e:
             self.log_progress(f"Error limpiando archivos temporales: {e}", "ERROR")
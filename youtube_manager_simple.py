@@ -6,57 +6,162 @@ Utiliza yt-dlp para descargar trailers sin requerir autenticación OAuth.
 import subprocess
 import logging
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple, Callable
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
 import re
 import threading
+import sqlite3
+import shutil
+from glob import escape as glob_escape
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+try:
+    from yt_dlp import YoutubeDL
+    from yt_dlp.utils import DownloadError, DownloadCancelled
+    YTDLP_AVAILABLE = True
+except ImportError:
+    YTDLP_AVAILABLE = False
+    logging.warning("yt_dlp no está instalado como módulo; se usará el ejecutable yt-dlp. Instálalo con: pip install yt-dlp")
+
+# Descargas de yt-dlp simultáneas (más provoca bloqueos temporales de YouTube); las consultas a TMDB no se limitan
+YTDLP_PARALLEL_DOWNLOADS = 2
+
+# Consultas simultáneas a TMDB al resolver URLs de trailers en bloque (igual al pool de la sesión HTTP)
+TMDB_VIDEO_LOOKUP_WORKERS = 8
+
+# Cache de URLs de trailers de TMDB: vigencia de las encontradas y de las consultas sin trailer (segundos)
+TRAILER_CACHE_PATH = "cache/tmdb_videos.db"
+TRAILER_CACHE_TTL = 30 * 24 * 3600
+TRAILER_NEGATIVE_TTL = 24 * 3600
+
+# Caracteres no válidos en nombres de archivo de trailer y número de la calidad pedida ("480p")
+_SANITIZE_RE = re.compile(r'[^\w\s-]')
+_QUALITY_RE = re.compile(r'\d+')
+
+# Tiempo máximo de una descarga con el ejecutable yt-dlp (segundos) y porcentaje en sus líneas "[download]"
+YTDLP_DOWNLOAD_TIMEOUT = 180
+_PROGRESS_RE = re.compile(r'(\d+(?:\.\d+)?)%')
 
 class YouTubeManagerSimple:
     def __init__(self, config, progress_callback=None):
         self.config = config
         self.progress_callback = progress_callback
         self.tmdb_base_url = "https://api.themoviedb.org/3"
+        self.refresh_config()
+        # Sesión persistente para las consultas a TMDB (reutiliza la conexión entre trailers)
+        self.http = requests.Session()
+        retries = Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+        self.http.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retries))
+        # Descargas en lote desde varios hilos
+        self._download_semaphore = threading.Semaphore(YTDLP_PARALLEL_DOWNLOADS)
+        self._log_lock = threading.Lock()
+        # Ruta del ejecutable yt-dlp, comprobada una sola vez (None = aún sin comprobar)
+        self.ytdlp_path = None
+        self._ytdlp_ok = None
+        # URLs de trailers ya consultadas: en memoria y en disco (None = TMDB no tiene trailer)
+        self._trailer_cache = {}
+        self._trailer_cache_lock = threading.Lock()
+        self.trailer_cache_conn = None
+        try:
+            Path(TRAILER_CACHE_PATH).parent.mkdir(parents=True, exist_ok=True)
+            self.trailer_cache_conn = sqlite3.connect(TRAILER_CACHE_PATH, check_same_thread=False)
+            self.trailer_cache_conn.execute('CREATE TABLE IF NOT EXISTS trailer_urls (key TEXT PRIMARY KEY, url TEXT, ts INTEGER)')
+            self.trailer_cache_conn.commit()
+        except sqlite3.Error as e:
+            logging.warning(f"No se pudo abrir la cache de trailers: {e}")
+            self.trailer_cache_conn = None
+
+    def close(self):
+        """Cerrar las conexiones abiertas de la sesión HTTP y de la cache de trailers."""
+        self.http.close()
+        if self.trailer_cache_conn is not None:
+            with self._trailer_cache_lock: self.trailer_cache_conn.close(); self.trailer_cache_conn = None
 
     def log_progress(self, message: str, level: str = "INFO"):
         """Logging con callback."""
         if self.progress_callback:
-            self.progress_callback(message, level)
+            with self._log_lock: self.progress_callback(message, level)
         logging.info(message)
 
+    def refresh_config(self):
+        """Releer de la configuración los valores usados en cada descarga (llamar tras cambiarla)."""
+        self.api_key = self.config.get('tmdb_api_key')
+        self.quality = self.config.get("youtube_quality", "480p")
+        self.high_quality = self.config.get("youtube_high_quality", False)
+        self.parallel = self.config.get("youtube_parallel", 4)
+
+    def preflight(self) -> bool:
+        """Comprobar una sola vez, antes de un lote, lo que necesita cada descarga (API key de TMDb y yt-dlp)."""
+        if not self.api_key:
+            self.log_progress("❌ API Key de TMDb no configurada.", "ERROR"); return False
+        if not self.check_ytdlp_available():
+            self.log_progress("❌ yt-dlp no está instalado. Instalación requerida.", "ERROR"); return False
+        return True
+
     def check_ytdlp_available(self) -> bool:
-        """Verificar si yt-dlp está disponible en el PATH."""
-        try:
-            subprocess.run(["yt-dlp", "--version"], capture_output=True, check=True)
-            return True
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            return False
+        """Verificar si yt-dlp está disponible (como módulo o en el PATH)."""
+        if YTDLP_AVAILABLE: return True
+        if self._ytdlp_ok is None:
+            self.ytdlp_path = shutil.which("yt-dlp")
+            try:
+                subprocess.run([self.ytdlp_path or "yt-dlp", "--version"], capture_output=True, check=True, timeout=5)
+                self._ytdlp_ok = True
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError):
+                self._ytdlp_ok = False
+        return self._ytdlp_ok
 
     def get_trailer_url(self, tmdb_id: str, content_type: str = "movie") -> Optional[str]:
-        """Obtener URL del trailer principal desde TMDB (YouTube Key)."""
+        """Obtener URL del trailer principal desde TMDB, consultando antes la cache."""
+        key = f"{content_type}/{tmdb_id}"
+        now = time.time()
+        with self._trailer_cache_lock:
+            entry = self._trailer_cache.get(key)
+            if entry is None and self.trailer_cache_conn is not None:
+                entry = self.trailer_cache_conn.execute('SELECT url, ts FROM trailer_urls WHERE key = ?', (key,)).fetchone()
+        if entry is not None:
+            url, ts = entry
+            if now - ts < (TRAILER_CACHE_TTL if url else TRAILER_NEGATIVE_TTL):
+                self._trailer_cache[key] = entry
+                return url
+        
+        url, complete = self._fetch_trailer_url(tmdb_id, content_type)
+        if complete:
+            # Solo se guardan respuestas válidas de TMDB (con o sin trailer), nunca errores de red
+            with self._trailer_cache_lock:
+                self._trailer_cache[key] = (url, int(now))
+                if self.trailer_cache_conn is not None:
+                    self.trailer_cache_conn.execute('INSERT OR REPLACE INTO trailer_urls (key, url, ts) VALUES (?, ?, ?)', (key, url, int(now)))
+                    self.trailer_cache_conn.commit()
+        return url
+
+    def _fetch_trailer_url(self, tmdb_id: str, content_type: str) -> tuple:
+        """Consultar a TMDB la URL del trailer principal (YouTube Key); devuelve (url, respuesta_completa)."""
         try:
-            api_key = self.config.get('tmdb_api_key')
-            if not api_key: self.log_progress("❌ API Key de TMDb no configurada.", "ERROR"); return None
+            # Sin clave no se consulta (el aviso lo da preflight() una vez por lote)
+            api_key = self.api_key
+            if not api_key: return None, False
             
             endpoint = f"/{content_type}/{tmdb_id}/videos"; url = f"{self.tmdb_base_url}{endpoint}"
             params = { 'api_key': api_key, 'language': 'en-US' }
-            response = requests.get(url, params=params, timeout=10); response.raise_for_status()
+            response = self.http.get(url, params=params, timeout=10); response.raise_for_status()
             data = response.json()
             
+            # Una sola pasada: oficial > no oficial y, a igualdad, Trailer > Teaser (gana el primero en empate)
+            best, best_score = None, -1
             for video in data.get("results", []):
-                if (video.get("site") == "YouTube" and video.get("type") in ["Trailer", "Teaser"]):
-                    # Priorizar trailer oficial
-                    if "official" in video.get("name", "").lower(): return f"https://www.youtube.com/watch?v={video.get('key')}"
-                    
-            # Fallback al primer resultado
-            for video in data.get("results", []):
-                 if video.get("site") == "YouTube" and video.get("type") in ["Trailer", "Teaser"]:
-                    return f"https://www.youtube.com/watch/v={video.get('key')}"
+                if video.get("site") != "YouTube" or video.get("type") not in ("Trailer", "Teaser"): continue
+                score = (2 if "official" in video.get("name", "").lower() else 0) + (1 if video.get("type") == "Trailer" else 0)
+                if score > best_score: best, best_score = video, score
+            if best: return f"https://www.youtube.com/watch?v={best.get('key')}", True
             
-            self.log_progress(f"⚠️ No se encontró URL de trailer para TMDb ID {tmdb_id}.", "WARNING"); return None
+            self.log_progress(f"⚠️ No se encontró URL de trailer para TMDb ID {tmdb_id}.", "WARNING"); return None, True
             
         except Exception as e:
-            self.log_progress(f"❌ Error obteniendo trailer de TMDB ID {tmdb_id}: {e}", "ERROR"); return None
+            self.log_progress(f"❌ Error obteniendo trailer de TMDB ID {tmdb_id}: {e}", "ERROR"); return None, False
             
     def download_video(self, video_url: str, output_path: Path, quality: str = "480p") -> Optional[Path]:
         """Descargar video usando yt-dlp, con login a través de cookies del navegador."""
@@ -64,34 +169,44 @@ class YouTubeManagerSimple:
             if not self.check_ytdlp_available():
                 self.log_progress("❌ yt-dlp no está instalado. Instalación requerida.", "ERROR"); return None
             
-            output_template = Path(output_path.parent) / f"{output_path.stem}.%(ext)s"
-            quality_num = int(re.search(r'\d+', quality).group(0))
+            output_template = output_path.parent / f"{output_path.stem}.%(ext)s"
+            quality_num = int(_QUALITY_RE.search(quality).group(0))
+            # Para previsualizar basta un único stream ya muxeado (sin descargar audio aparte ni pasar por ffmpeg)
+            if self.high_quality:
+                video_format = f"bestvideo[height<={quality_num}]+bestaudio/best[height<={quality_num}]"
+            else:
+                video_format = f"best[height<={quality_num}][ext=mp4]/best[height<={quality_num}]"
             
             # Crear la carpeta de caché si no existe
             output_path.parent.mkdir(parents=True, exist_ok=True)
             
+            if YTDLP_AVAILABLE:
+                return self._download_in_process(video_url, output_path, output_template, video_format)
+            
             cmd = [
-                "yt-dlp",
-                "--format", f"bestvideo[height<={quality_num}]+bestaudio/best[height<={quality_num}]", 
+                self.ytdlp_path or "yt-dlp",
+                "--format", video_format, 
                 "--output", str(output_template),
                 "--no-playlist",
                 "--max-filesize", "100M",
                 # Solución para el login: Usar cookies del navegador (Chrome)
                 "--cookies-from-browser", "chrome:default",
                 "--no-check-certificate", 
+                # Una línea por actualización de progreso, para poder leerla mientras descarga
+                "--newline", "--progress",
                 video_url
             ]
             
             self.log_progress(f"  ⬇️ Descargando trailer (usando cookies): {video_url}")
             
             # Ejecutar yt-dlp
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=180)
+            returncode, output_tail = self._run_ytdlp(cmd, YTDLP_DOWNLOAD_TIMEOUT)
             
-            if result.returncode == 0:
-                downloaded_files = list(output_path.parent.glob(f"{output_path.stem}.*"))
-                if downloaded_files: return downloaded_files[0]
+            if returncode == 0:
+                downloaded = next(output_path.parent.glob(f"{output_path.stem}.*"), None)
+                if downloaded: return downloaded
             else:
-                self.log_progress(f"  ❌ Error de descarga (yt-dlp): {result.stderr.splitlines()[-1]}", "ERROR")
+                self.log_progress(f"  ❌ Error de descarga (yt-dlp): {output_tail[-1] if output_tail else returncode}", "ERROR")
                 self.log_progress("    Asegúrate de tener sesión iniciada en YouTube en Chrome.", "WARNING")
                 
             return None
@@ -99,14 +214,144 @@ class YouTubeManagerSimple:
         except Exception as e:
             self.log_progress(f"❌ Error crítico descargando trailer: {e}", "ERROR"); return None
             
-    def download_trailer_for_content(self, tmdb_id: str, content_type: str, output_dir: Path, title: str) -> Optional[Path]:
-        """Pipeline: obtener URL y descargar trailer."""
-        video_url = self.get_trailer_url(tmdb_id, content_type)
+    def _run_ytdlp(self, cmd: List[str], timeout: int) -> Tuple[int, List[str]]:
+        """Ejecutar yt-dlp leyendo su salida según llega: reenvía el progreso y guarda solo las últimas líneas.
+
+        Devuelve (código de salida, últimas líneas que no son de progreso). Lanza TimeoutExpired si se pasa de timeout.
+        """
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1, errors='replace')
+        # Leer la salida bloquea hasta que yt-dlp termina, así que el límite de tiempo lo impone un temporizador
+        killer = threading.Timer(timeout, proc.kill)
+        killer.start()
+        tail = deque(maxlen=20)
+        last_step = -1
+        try:
+            for line in proc.stdout:
+                line = line.strip()
+                if not line: continue
+                if line.startswith("[download]") and "%" in line:
+                    match = _PROGRESS_RE.search(line)
+                    # Un mensaje cada 10% para no inundar el log con cada actualización
+                    if match and int(float(match.group(1))) // 10 > last_step:
+                        last_step = int(float(match.group(1))) // 10
+                        self.log_progress(f"    {line}")
+                    continue
+                tail.append(line)
+            returncode = proc.wait()
+        finally:
+            timed_out = not killer.is_alive()
+            killer.cancel()
+            if proc.poll() is None: proc.kill(); proc.wait()
+            proc.stdout.close()
+        if timed_out: raise subprocess.TimeoutExpired(cmd, timeout)
+        return returncode, list(tail)
+
+    @staticmethod
+    def _deadline_hook(deadline: float):
+        """Hook de progreso de yt_dlp que cancela la descarga al pasar deadline (mismo límite que el ejecutable)."""
+        def hook(status):
+            if time.monotonic() > deadline: raise DownloadCancelled("tiempo máximo de descarga superado")
+        return hook
+
+    def _download_in_process(self, video_url: str, output_path: Path, output_template: Path, video_format: str) -> Optional[Path]:
+        """Descargar con la API de yt_dlp en este proceso (sin arrancar un intérprete por trailer)."""
+        opts = {
+            "format": video_format,
+            "outtmpl": str(output_template),
+            "noplaylist": True,
+            "max_filesize": 100 * 1024 * 1024,
+            # Solución para el login: Usar cookies del navegador (Chrome)
+            "cookiesfrombrowser": ("chrome", "default"),
+            "nocheckcertificate": True,
+            "socket_timeout": 30,
+            "quiet": True,
+            "no_warnings": True,
+            "progress_hooks": [self._deadline_hook(time.monotonic() + YTDLP_DOWNLOAD_TIMEOUT)],
+        }
+        self.log_progress(f"  ⬇️ Descargando trailer (usando cookies): {video_url}")
+        try:
+            with YoutubeDL(opts) as ydl: ydl.download([video_url])
+        except DownloadCancelled:
+            self.log_progress(f"  ❌ Descarga cancelada: superó {YTDLP_DOWNLOAD_TIMEOUT}s ({video_url})", "ERROR")
+            return None
+        except DownloadError as e:
+            self.log_progress(f"  ❌ Error de descarga (yt-dlp): {e}", "ERROR")
+            self.log_progress("    Asegúrate de tener sesión iniciada en YouTube en Chrome.", "WARNING")
+            return None
+        return next(output_path.parent.glob(f"{output_path.stem}.*"), None)
+            
+    def get_trailer_urls_bulk(self, items: List[Tuple[str, str]]) -> List[Optional[str]]:
+        """Resolver en paralelo las URLs de trailer de varios (tmdb_id, content_type), en el mismo orden."""
+        if not items: return []
+        with ThreadPoolExecutor(max_workers=min(TMDB_VIDEO_LOOKUP_WORKERS, len(items))) as executor:
+            return list(executor.map(lambda item: self.get_trailer_url(*item), items))
+
+    def _trailer_stem(self, tmdb_id: str, output_dir: Path, title: str) -> Path:
+        """Ruta (sin extensión) del trailer de un título."""
+        clean_title = _SANITIZE_RE.sub('', title).strip().replace(' ', '_')
+        return output_dir / f"{tmdb_id}_{clean_title}_trailer"
+
+    def _existing_trailer(self, tmdb_id: str, output_dir: Path, title: str) -> Optional[Path]:
+        """Trailer completo ya presente en output_dir (se ignoran las descargas a medias de yt-dlp)."""
+        stem = self._trailer_stem(tmdb_id, output_dir, title)
+        for candidate in output_dir.glob(f"{glob_escape(stem.name)}.*"):
+            if candidate.suffix not in ('.part', '.ytdl') and candidate.stat().st_size > 0: return candidate
+        return None
+
+    def download_trailer_for_content(self, tmdb_id: str, content_type: str, output_dir: Path, title: str,
+                                     video_url: Optional[str] = None,
+                                     should_continue: Optional[Callable[[], bool]] = None) -> Optional[Path]:
+        """Pipeline: reutilizar el trailer ya descargado o bien obtener URL (si no se conoce ya) y descargarlo.
+
+        should_continue se consulta justo antes de descargar; si devuelve False no se descarga nada.
+        """
+        existing = self._existing_trailer(tmdb_id, output_dir, title)
+        if existing: return existing
+        if video_url is None: video_url = self.get_trailer_url(tmdb_id, content_type)
         if not video_url: return None
-        clean_title = re.sub(r'[^\w\s-]', '', title).strip().replace(' ', '_')
-        output_file_stem = output_dir / f"{tmdb_id}_{clean_title}_trailer"
+        output_file_stem = self._trailer_stem(tmdb_id, output_dir, title)
         
-        quality = self.config.get("youtube_quality", "480p")
+        quality = self.quality
         
-        trailer_path = self.download_video(video_url, output_file_stem, quality)
-        return trailer_path
\ No newline at end of file
+        with self._download_semaphore:
+            # La espera por el semáforo puede ser larga: se vuelve a comprobar si hay que seguir
+            if should_continue is not None and not should_continue(): return None
+            trailer_path = self.download_video(video_url, output_file_stem, quality)
+        return trailer_path
+
+    def download_trailers_batch(self, items: List[Dict], output_dir: Path,
+                                should_continue: Optional[Callable[[], bool]] = None) -> Dict[str, Optional[Path]]:
+        """Descargar en paralelo los trailers de varios títulos.
+
+        items: diccionarios con 'tmdb_id', 'type' y 'title'. Devuelve {tmdb_id (str): ruta o None}.
+        should_continue (opcional) se consulta antes de cada descarga; las que no llegan a empezar quedan en None.
+        """
+        results = {}
+        if not items: return results
+        # Los trailers que ya están en disco no necesitan ni la consulta a TMDB ni la descarga
+        missing = []
+        for item in items:
+            existing = self._existing_trailer(str(item["tmdb_id"]), output_dir, item["title"])
+            if existing: results[str(item["tmdb_id"])] = existing
+            else: missing.append(item)
+        items = missing
+        # Primero todas las URLs (solo red hacia TMDB), luego las descargas limitadas por el semáforo
+        video_urls = self.get_trailer_urls_bulk([(str(item["tmdb_id"]), item["type"]) for item in items])
+        pending = []
+        for item, video_url in zip(items, video_urls):
+            if video_url: pending.append((item, video_url))
+            else: results[str(item["tmdb_id"])] = None
+        if not pending: return results
+        # Más hilos que plazas del semáforo solo quedarían esperando
+        max_workers = max(1, min(self.parallel, YTDLP_PARALLEL_DOWNLOADS))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(self.download_trailer_for_content, str(item["tmdb_id"]), item["type"], output_dir, item["title"],
+                                       video_url, should_continue): str(item["tmdb_id"])
+                       for item, video_url in pending}
+            for future in as_completed(futures):
+                tmdb_id = futures[future]
+                try:
+                    results[tmdb_id] = future.result()
+                except Exception as e:
+                    self.log_progress(f"❌ Error descargando trailer de TMDb ID {tmdb_id}: {e}", "ERROR"); results[tmdb_id] = None
+        return results
\ No newline at end of file